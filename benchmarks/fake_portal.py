@@ -0,0 +1,519 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import Counter
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+from arcgis.gis import Item
+
+# Configuración de Logging
+logger = logging.getLogger('GISBoxFakePortal')
+logger.setLevel(logging.INFO)
+# Configuración del handler (para que solo se configure una vez)
+if not logger.handlers:
+    ch = logging.StreamHandler()
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+
+# Fecha de modificación (ms) del primer elemento generado; fija para que los datos sean deterministas
+BASE_MODIFIED_MS = 1_700_000_000_000
+# Tamaño de bloque con el que se envían y reciben los cuerpos al limitar el ancho de banda
+TRANSFER_CHUNK_SIZE = 64 * 1024
+
+class FakePortal:
+    """
+    Sustituto local (HTTP) de los endpoints REST del portal de ArcGIS que usa GISBox:
+    token, usuarios, carpetas, listado de contenido, búsqueda, datos de elementos,
+    alta, actualización, movimiento y eliminación (individual y por lotes). `latency` (s) se añade a cada
+    petición y `bandwidth` (bytes/s por conexión, None sin límite) regula la
+    transferencia de los cuerpos. Los elementos generados son deterministas.
+    """
+    def __init__(self, items=100, folders=4, item_size=4 * 1024, latency=0.0, bandwidth=None,
+                 username='bench_user', password='bench_password', host='127.0.0.1', port=0):
+        self.username = username
+        self.password = password
+        self.token = hashlib.sha256(f"{username}:{password}".encode()).hexdigest()
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._clock = BASE_MODIFIED_MS
+        # Listados ya calculados (clave, versión de los datos): paginar 100k elementos
+        # no debe costar O(n) por página en el propio sustituto
+        self._version = 0
+        self._listings = {}
+        self.folders = {}
+        self.items = {}
+        for index in range(folders):
+            self._new_folder(f"Folder{index + 1}")
+        folder_ids = [None] + list(self.folders)
+        for index in range(items):
+            # Reparto round-robin entre la raíz y las carpetas
+            self._new_item(f"item_{index:06d}", 'CSV', item_size, folder_ids[index % len(folder_ids)],
+                           name=f"item_{index:06d}.csv")
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='gisbox-fake-portal', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # --- Datos ---
+
+    def _new_id(self):
+        self._next_id += 1
+        return f"{self._next_id:032x}"
+
+    def _tick(self):
+        self._clock += 1000
+        self._version += 1
+        return self._clock
+
+    def _listing(self, key, build):
+        with self._lock:
+            cached = self._listings.get(key)
+            if cached is None or cached[0] != self._version:
+                cached = self._listings[key] = (self._version, build())
+            return cached[1]
+
+    def _new_folder(self, title):
+        folder = {'id': self._new_id(), 'title': title, 'username': self.username}
+        self.folders[folder['id']] = folder
+        return folder
+
+    def _new_item(self, title, item_type, size, folder_id, name=None):
+        item = {'id': self._new_id(), 'owner': self.username, 'title': title, 'type': item_type,
+                'name': name or title, 'size': size, 'ownerFolder': folder_id, 'modified': self._tick(),
+                'tags': []}
+        self.items[item['id']] = item
+        return item
+
+    @staticmethod
+    def item_data(item_id, size, start=0):
+        """
+        Contenido determinista de un elemento (a partir de su id), desde el byte `start`.
+        """
+        pattern = hashlib.sha256(item_id.encode()).digest()
+        repeat = (size // len(pattern)) + 1
+        return (pattern * repeat)[start:size]
+
+    def _folder_id(self, folder):
+        if folder in self.folders:
+            return folder
+        for folder_id, entry in self.folders.items():
+            if entry['title'] == folder:
+                return folder_id
+        return None
+
+    # --- Endpoints ---
+
+    def generate_token(self, params, files, match):
+        if params.get('username') != self.username or params.get('password') != self.password:
+            return {'error': {'code': 400, 'message': 'Unable to generate token.',
+                              'details': ['Invalid username or password.']}}
+        return {'token': self.token, 'expires': int(time.time() * 1000) + 3600 * 1000, 'ssl': False}
+
+    def user(self, params, files, match):
+        if match['user'] != self.username:
+            return {'error': {'code': 400, 'message': 'User does not exist or is inaccessible.'}}
+        return {'username': self.username, 'fullName': 'GISBox Benchmark', 'role': 'org_admin'}
+
+    def list_content(self, params, files, match):
+        folder_id = match['folder']
+        with self._lock:
+            if folder_id is not None and folder_id not in self.folders:
+                return {'error': {'code': 400, 'message': 'Folder does not exist.'}}
+            folders = list(self.folders.values())
+        items = self._listing(('folder', folder_id), lambda: [
+            item for item in self.items.values() if item['ownerFolder'] == folder_id])
+        response = self._page(items, params)
+        response['items'] = response.pop('results')
+        if folder_id is None:
+            response['folders'] = folders
+        else:
+            response['currentFolder'] = self.folders[folder_id]
+        return response
+
+    def search(self, params, files, match):
+        query = params.get('q', '')
+        sort = (params.get('sortField'), params.get('sortOrder'))
+        items = self._listing(('search', query, sort), lambda: self._search(query, sort))
+        response = self._page(items, params)
+        response['query'] = query
+        return response
+
+    def _search(self, query, sort):
+        items = list(self.items.values())
+        owner = re.search(r'owner:"?([^"\s]+)"?', query)
+        if owner:
+            items = [item for item in items if item['owner'] == owner.group(1)]
+        item_ids = re.findall(r'\bid:(\w+)', query)
+        if item_ids:
+            items = [item for item in items if item['id'] in item_ids]
+        modified = re.search(r'modified:\[(\d+) TO (\d+)\]', query)
+        if modified:
+            low, high = int(modified.group(1)), int(modified.group(2))
+            items = [item for item in items if low <= item['modified'] <= high]
+        if sort[0] == 'modified':
+            items.sort(key=lambda item: item['modified'], reverse=sort[1] == 'desc')
+        return items
+
+    @staticmethod
+    def _page(items, params):
+        start = int(params.get('start', 1))
+        num = min(int(params.get('num', 10)), 100)
+        page = items[start - 1:start - 1 + num]
+        next_start = start + len(page) if start - 1 + num < len(items) else -1
+        return {'total': len(items), 'start': start, 'num': len(page), 'nextStart': next_start,
+                'results': [dict(item) for item in page]}
+
+    def get_item(self, params, files, match):
+        with self._lock:
+            item = self.items.get(match['item'])
+        if item is None:
+            return {'error': {'code': 400, 'message': 'Item does not exist or is inaccessible.'}}
+        return dict(item)
+
+    def item_data_response(self, match, range_header):
+        with self._lock:
+            item = self.items.get(match['item'])
+        if item is None:
+            return 404, {}, b''
+        size = item['size']
+        start = 0
+        if range_header:
+            start = int(re.match(r'bytes=(\d+)-', range_header).group(1))
+            if start >= size:
+                return 416, {'Content-Range': f"bytes */{size}"}, b''
+        headers = {'Content-Type': 'application/octet-stream',
+                   'Content-Disposition': f'attachment; filename="{item["name"]}"'}
+        if start:
+            headers['Content-Range'] = f"bytes {start}-{size - 1}/{size}"
+        return 206 if start else 200, headers, self.item_data(item['id'], size, start)
+
+    def add_item(self, params, files, match):
+        folder_id = self._folder_id(match['folder']) if match['folder'] else None
+        if match['folder'] and folder_id is None:
+            return {'error': {'code': 400, 'message': 'Folder does not exist.'}}
+        data = files.get('file', b'')
+        with self._lock:
+            item = self._new_item(params.get('title') or 'untitled', params.get('type') or 'File', len(data),
+                                  folder_id, name=files.get('file_name') or params.get('title'))
+        return {'success': True, 'id': item['id'], 'folder': folder_id}
+
+    def create_folder(self, params, files, match):
+        with self._lock:
+            if self._folder_id(params.get('title')) is not None:
+                return {'error': {'code': 400, 'message': 'Folder already exists.'}}
+            folder = self._new_folder(params.get('title'))
+            self._version += 1
+        return {'success': True, 'folder': dict(folder)}
+
+    def update_item(self, params, files, match):
+        with self._lock:
+            item = self.items.get(match['item'])
+            if item is None:
+                return {'error': {'code': 400, 'message': 'Item does not exist or is inaccessible.'}}
+            if params.get('title'):
+                item['title'] = params['title']
+            if 'file' in files:
+                item['size'] = len(files['file'])
+            item['modified'] = self._tick()
+        return {'success': True, 'id': item['id']}
+
+    def move_item(self, params, files, match):
+        folder = params.get('folder')
+        with self._lock:
+            item = self.items.get(match['item'])
+            if item is None:
+                return {'error': {'code': 400, 'message': 'Item does not exist or is inaccessible.'}}
+            folder_id = None if folder in (None, '', '/') else self._folder_id(folder)
+            if folder not in (None, '', '/') and folder_id is None:
+                return {'error': {'code': 400, 'message': 'Folder does not exist.'}}
+            item['ownerFolder'] = folder_id
+            item['modified'] = self._tick()
+        return {'success': True, 'itemId': item['id'], 'folder': folder_id}
+
+    def delete_items(self, params, files, match):
+        results = []
+        with self._lock:
+            for item_id in filter(None, params.get('items', '').split(',')):
+                item = self.items.pop(item_id, None)
+                if item is None:
+                    results.append({'itemId': item_id, 'success': False,
+                                    'error': {'code': 400, 'message': 'Item does not exist or is inaccessible.'}})
+                else:
+                    results.append({'itemId': item_id, 'success': True})
+            self._version += 1
+        return {'results': results}
+
+    def delete_item(self, params, files, match):
+        with self._lock:
+            item = self.items.pop(match['item'], None)
+            self._version += 1
+        if item is None:
+            return {'error': {'code': 400, 'message': 'Item does not exist or is inaccessible.'}}
+        return {'success': True, 'itemId': item['id']}
+
+ROUTES = [
+    ('POST', r'generateToken', 'generate_token'),
+    ('GET', r'community/users/(?P<user>[^/]+)', 'user'),
+    ('GET', r'content/users/(?P<user>[^/]+)(?:/(?P<folder>[^/]+))?', 'list_content'),
+    ('GET', r'search', 'search'),
+    ('GET', r'content/items/(?P<item>[^/]+)', 'get_item'),
+    ('GET', r'content/items/(?P<item>[^/]+)/data', 'item_data'),
+    ('POST', r'content/users/(?P<user>[^/]+)(?:/(?P<folder>[^/]+))?/addItem', 'add_item'),
+    ('POST', r'content/users/(?P<user>[^/]+)/createFolder', 'create_folder'),
+    ('POST', r'content/users/(?P<user>[^/]+)/items/(?P<item>[^/]+)/update', 'update_item'),
+    ('POST', r'content/users/(?P<user>[^/]+)/items/(?P<item>[^/]+)/move', 'move_item'),
+    ('POST', r'content/users/(?P<user>[^/]+)/items/(?P<item>[^/]+)/delete', 'delete_item'),
+    ('POST', r'content/users/(?P<user>[^/]+)/deleteItems', 'delete_items'),
+]
+
+REST_PREFIX = '/sharing/rest/'
+
+def _make_handler(portal):
+    class Handler(BaseHTTPRequestHandler):
+        # HTTP/1.1: conexiones keep-alive, como el portal real
+        protocol_version = 'HTTP/1.1'
+        # Cabeceras y cuerpo salen en escrituras separadas: sin TCP_NODELAY, el retardo
+        # del ACK (~40 ms) se sumaría a cada respuesta
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            self._handle('GET')
+
+        def do_POST(self):
+            self._handle('POST')
+
+        def _handle(self, method):
+            url = urlsplit(self.path)
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            form, files = self._read_body()
+            params.update(form)
+            if portal.latency:
+                time.sleep(portal.latency)
+
+            path = url.path[len(REST_PREFIX):] if url.path.startswith(REST_PREFIX) else None
+            for route_method, pattern, name in ROUTES:
+                match = re.fullmatch(pattern, path or '') if route_method == method else None
+                if match:
+                    break
+            else:
+                portal.stats['unknown'] += 1
+                return self._send_json({'error': {'code': 400, 'message': f"Unknown endpoint: {url.path}"}})
+            portal.stats[name] += 1
+
+            if name != 'generate_token' and params.get('token') != portal.token:
+                return self._send_json({'error': {'code': 498, 'message': 'Invalid token.'}})
+            if name == 'item_data':
+                status, headers, body = portal.item_data_response(match, self.headers.get('Range'))
+                return self._send(status, headers, body)
+            return self._send_json(getattr(portal, name)(params, files, match.groupdict()))
+
+        def _read_body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            chunks = []
+            while length > 0:
+                chunk = self.rfile.read(min(length, TRANSFER_CHUNK_SIZE))
+                if not chunk:
+                    break
+                length -= len(chunk)
+                chunks.append(chunk)
+                self._throttle(len(chunk))
+            body = b''.join(chunks)
+            content_type = self.headers.get('Content-Type', '')
+            if content_type.startswith('multipart/form-data'):
+                return self._parse_multipart(content_type, body)
+            if body:
+                return {key: values[-1] for key, values in parse_qs(body.decode()).items()}, {}
+            return {}, {}
+
+        @staticmethod
+        def _parse_multipart(content_type, body):
+            message = BytesParser(policy=policy.HTTP).parsebytes(
+                f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+            form, files = {}, {}
+            for part in message.iter_parts():
+                name = part.get_param('name', header='content-disposition')
+                filename = part.get_filename()
+                if filename is not None:
+                    files[name] = part.get_payload(decode=True)
+                    files[f"{name}_name"] = filename
+                else:
+                    form[name] = part.get_content().strip()
+            return form, files
+
+        def _send_json(self, payload):
+            self._send(200, {'Content-Type': 'application/json'}, json.dumps(payload).encode())
+
+        def _send(self, status, headers, body):
+            self.send_response(status)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            for offset in range(0, len(body), TRANSFER_CHUNK_SIZE):
+                chunk = body[offset:offset + TRANSFER_CHUNK_SIZE]
+                self.wfile.write(chunk)
+                self._throttle(len(chunk))
+
+        def _throttle(self, size):
+            if portal.bandwidth:
+                time.sleep(size / portal.bandwidth)
+
+    return Handler
+
+# --- Cliente ---
+
+class FakeGIS:
+    """
+    Cliente mínimo con la misma interfaz que `arcgis.gis.GIS` en lo que usa GISBox
+    (`_con`, `_portal.resturl`, `session`, `users`, `content`, `properties`), que
+    habla por HTTP con un FakePortal. Las peticiones son reales (sesión de requests
+    con pool keep-alive) y los elementos son `arcgis.gis.Item` auténticos.
+    """
+    def __init__(self, url, username, password, pool_size=10):
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._portal = SimpleNamespace(resturl=f"{url.rstrip('/')}{REST_PREFIX}")
+        self._con = _Connection(self.session)
+        token = self._con.post(f"{self._portal.resturl}generateToken",
+                               {'username': username, 'password': password, 'client': 'requestip'})
+        self.session.params = {'token': token['token']}
+        self.properties = SimpleNamespace(name='GISBox Benchmark Portal')
+        self.users = _UserManager(self, username)
+        self.content = _ContentManager(self)
+
+class _Connection:
+    def __init__(self, session):
+        self.session = session
+
+    def get(self, path, params=None, **kwargs):
+        return self._result(self.session.get(path, params=dict(params or {}, f='json')))
+
+    def post(self, path, params=None, **kwargs):
+        return self._result(self.session.post(path, data=dict(params or {}, f='json')))
+
+    def post_multipart(self, path, params=None, files=None, **kwargs):
+        return self._result(self.session.post(path, data=dict(params or {}, f='json'), files=files))
+
+    @staticmethod
+    def _result(response):
+        # Igual que la API de ArcGIS: HTTPError para los estados HTTP, Exception con el
+        # código en el mensaje para los errores JSON
+        response.raise_for_status()
+        result = response.json()
+        if 'error' in result:
+            error = result['error']
+            raise Exception(f"{error.get('message')}\n(Error Code: {error.get('code')})")
+        return result
+
+class _UserManager:
+    def __init__(self, gis, username):
+        self._gis = gis
+        self.me = _User(gis, username)
+
+    def get(self, username):
+        self._gis._con.get(f"{self._gis._portal.resturl}community/users/{username}")
+        return _User(self._gis, username)
+
+class _User:
+    def __init__(self, gis, username):
+        self._gis = gis
+        self.username = username
+
+    @property
+    def folders(self):
+        response = self._gis._con.get(f"{self._gis._portal.resturl}content/users/{self.username}",
+                                      {'start': 1, 'num': 1})
+        return response['folders']
+
+class _ContentManager:
+    def __init__(self, gis):
+        self._gis = gis
+
+    def _user_url(self):
+        return f"{self._gis._portal.resturl}content/users/{self._gis.users.me.username}/"
+
+    def get(self, item_id):
+        try:
+            item_dict = self._gis._con.get(f"{self._gis._portal.resturl}content/items/{item_id}")
+        except Exception:
+            return None
+        return FakeItem(self._gis, item_id, item_dict)
+
+    def add(self, item_properties, data=None, folder=None):
+        if folder:
+            # Como arcgis, que resuelve la carpeta (por nombre o id) con una petición en cada llamada
+            folders = self._gis.users.me.folders
+            folder = next(f['id'] for f in folders if folder in (f['id'], f['title']))
+        url = self._user_url() + (f"{folder}/addItem" if folder else "addItem")
+        with open(data, 'rb') as f:
+            result = self._gis._con.post_multipart(url, dict(item_properties),
+                                                   files=[('file', (os.path.basename(str(data)), f))])
+        return self.get(result['id'])
+
+    def create_folder(self, folder):
+        return self._gis._con.post(self._user_url() + "createFolder", {'title': folder})['folder']
+
+class FakeItem(Item):
+    """
+    `arcgis.gis.Item` cuyas operaciones de escritura usan los endpoints REST del FakePortal.
+    """
+    def _items_url(self):
+        return f"{self._gis.content._user_url()}items/{self.itemid}/"
+
+    def update(self, item_properties=None, data=None, **kwargs):
+        params = dict(item_properties or {})
+        if data is None:
+            self._gis._con.post(self._items_url() + "update", params)
+        else:
+            with open(data, 'rb') as f:
+                self._gis._con.post_multipart(self._items_url() + "update", params,
+                                              files=[('file', (os.path.basename(str(data)), f))])
+        self.__dict__.update(params)
+        dict.update(self, params)
+        return True
+
+    def move(self, folder, **kwargs):
+        folder_id = folder['id'] if isinstance(folder, dict) else folder
+        return self._gis._con.post(self._items_url() + "move", {'folder': folder_id})
+
+    def delete(self, **kwargs):
+        return self._gis._con.post(self._items_url() + "delete", {}).get('success', False)
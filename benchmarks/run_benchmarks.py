@@ -0,0 +1,279 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from watchdog.events import FileCreatedEvent, FileDeletedEvent
+
+# Los módulos de GISBox están en la raíz del repositorio
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.fake_portal import FakeGIS, FakePortal
+from gisbox_governor import RequestGovernor
+from gisbox_monitor import FingerprintCache, ItemIndex, UploadHandler, UploadQueue
+from gisbox_state import StateStore
+from gisbox_sync import GISBoxSync
+
+# Configuración de Logging
+logger = logging.getLogger('GISBoxBenchmark')
+logger.setLevel(logging.INFO)
+# Configuración del handler (para que solo se configure una vez)
+if not logger.handlers:
+    ch = logging.StreamHandler()
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+
+GISBOX_LOGGERS = ('GISBoxSync', 'GISBoxMonitor', 'GISBoxState', 'GISBoxGovernor')
+MB = 1024 * 1024
+
+@contextmanager
+def _environ(**values):
+    """
+    Fija variables de entorno durante el bloque y restaura las anteriores al salir.
+    """
+    previous = {key: os.environ.get(key) for key in values}
+    os.environ.update({key: str(value) for key, value in values.items()})
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def bench_sync_down(portal, workdir):
+    """
+    Descarga completa (incremental desde cero) de todo el contenido del portal y,
+    a continuación, una segunda pasada sin cambios. Devuelve las métricas.
+    """
+    with _environ(LOCAL_SYNC_DIR=workdir, SYNC_MODE='incremental'):
+        sync = GISBoxSync(gis=FakeGIS(portal.url, portal.username, portal.password))
+    requests_before = sum(portal.stats.values())
+    started = time.perf_counter()
+    downloaded = sync.sync_down()
+    seconds = time.perf_counter() - started
+    requests = sum(portal.stats.values()) - requests_before
+
+    started = time.perf_counter()
+    sync.sync_down()
+    noop_seconds = time.perf_counter() - started
+    sync.state.close()
+
+    total_bytes = sum(item['size'] for item in portal.items.values())
+    return {
+        'benchmark': 'sync_down',
+        'items': downloaded,
+        'seconds': seconds,
+        'items_per_s': downloaded / seconds if seconds else None,
+        'mb_per_s': total_bytes / MB / seconds if seconds else None,
+        'requests': requests,
+        'noop_seconds': noop_seconds,
+    }
+
+class _TimedUploadHandler(UploadHandler):
+    """
+    UploadHandler que anota el instante en que termina la subida de cada ruta.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.completed = {}
+
+    def _upload_file(self, src_path):
+        super()._upload_file(src_path)
+        self.completed[src_path] = time.perf_counter()
+
+def bench_upload_handler(portal, workdir, events, file_size, create_window=0):
+    """
+    Crea `events` archivos en el directorio local (raíz y carpetas del portal) y
+    entrega un evento de creación por archivo a UploadHandler, sin agrupado de
+    eventos. Con `create_window`, los archivos nuevos se suben por lotes. Mide
+    eventos/s y la latencia de cada evento hasta que la subida termina.
+    """
+    folders = [None] + [folder['title'] for folder in portal.folders.values()]
+    paths = []
+    for index in range(events):
+        folder = folders[index % len(folders)]
+        directory = Path(workdir, folder) if folder else Path(workdir)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"upload_{index:06d}.csv"
+        path.write_bytes(FakePortal.item_data(str(index), file_size))
+        paths.append(str(path))
+
+    gis = FakeGIS(portal.url, portal.username, portal.password)
+    state = StateStore.for_sync_dir(workdir)
+    upload_queue = UploadQueue(int(os.getenv("UPLOAD_WORKERS") or 2))
+    upload_queue.start()
+    handler = _TimedUploadHandler(gis, workdir, upload_queue=upload_queue, fingerprints=FingerprintCache(state),
+                                  governor=RequestGovernor.from_env(), state=state, create_window=create_window,
+                                  create_batch_size=int(os.getenv("CREATE_BATCH_SIZE") or 500),
+                                  create_workers=int(os.getenv("CREATE_WORKERS") or 4))
+    if handler.batcher is not None:
+        handler.batcher.start()
+    requests_before = sum(portal.stats.values())
+
+    submitted = {}
+    for path in paths:
+        submitted[path] = time.perf_counter()
+        handler.on_created(FileCreatedEvent(path))
+    if handler.batcher is not None:
+        handler.batcher.stop()
+    upload_queue.join()
+    upload_queue.stop()
+    requests = sum(portal.stats.values()) - requests_before
+    state.close()
+
+    latencies = [handler.completed[path] - submitted[path] for path in handler.completed]
+    seconds = (max(handler.completed.values()) - min(submitted.values())) if handler.completed else 0
+    uploaded = len(handler.completed)
+    return {
+        'benchmark': 'upload_batch' if create_window else 'upload_handler',
+        'items': uploaded,
+        'failed': events - uploaded,
+        'seconds': seconds,
+        'events_per_s': uploaded / seconds if seconds else None,
+        'mb_per_s': uploaded * file_size / MB / seconds if seconds else None,
+        'latency_p50_ms': _percentile(latencies, 0.50) * 1000 if latencies else None,
+        'latency_p95_ms': _percentile(latencies, 0.95) * 1000 if latencies else None,
+        'latency_max_ms': max(latencies) * 1000 if latencies else None,
+        'requests': requests,
+    }
+
+def bench_delete_handler(portal, workdir, delete_window=1.0):
+    """
+    Entrega a UploadHandler un evento de eliminación por cada elemento del portal
+    (como al borrar carpetas enteras) y mide el tiempo y las peticiones hasta que
+    ya no queda ninguno en ArcGIS.
+    """
+    gis = FakeGIS(portal.url, portal.username, portal.password)
+    index = ItemIndex()
+    index.build(gis, gis.users.me)
+    folder_titles = {folder_id: folder['title'] for folder_id, folder in portal.folders.items()}
+    paths = [str(Path(workdir, folder_titles[item['ownerFolder']], f"{item['title']}.csv") if item['ownerFolder']
+                 else Path(workdir, f"{item['title']}.csv"))
+             for item in portal.items.values()]
+    upload_queue = UploadQueue(int(os.getenv("UPLOAD_WORKERS") or 2))
+    upload_queue.start()
+    handler = UploadHandler(gis, workdir, upload_queue=upload_queue, index=index,
+                            governor=RequestGovernor.from_env(), delete_window=delete_window,
+                            delete_batch_size=int(os.getenv("DELETE_BATCH_SIZE") or 100))
+    if handler.tombstones is not None:
+        handler.tombstones.start()
+    requests_before = sum(portal.stats.values())
+
+    started = time.perf_counter()
+    for path in paths:
+        handler.on_deleted(FileDeletedEvent(path))
+    upload_queue.join()
+    if handler.tombstones is not None:
+        handler.tombstones.stop()
+    upload_queue.stop()
+    seconds = time.perf_counter() - started
+    deleted = len(paths) - len(portal.items)
+    return {
+        'benchmark': 'delete_handler',
+        'items': deleted,
+        'failed': len(paths) - deleted,
+        'seconds': seconds,
+        'events_per_s': deleted / seconds if seconds else None,
+        'requests': sum(portal.stats.values()) - requests_before,
+    }
+
+def run(scales, latency=0.02, bandwidth=None, item_size=4 * 1024, folders=4,
+        benchmarks=('sync', 'monitor', 'delete'), workdir=None):
+    """
+    Ejecuta los benchmarks seleccionados para cada escala (número de elementos o
+    eventos), cada uno contra un portal simulado nuevo. Devuelve la lista de resultados.
+    """
+    results = []
+    base_dir = Path(workdir or tempfile.mkdtemp(prefix='gisbox-bench-'))
+    try:
+        for scale in scales:
+            settings = {'scale': scale, 'latency_ms': latency * 1000, 'bandwidth': bandwidth,
+                        'item_size': item_size}
+            if 'sync' in benchmarks:
+                run_dir = base_dir / f"sync-{scale}"
+                with FakePortal(items=scale, folders=folders, item_size=item_size, latency=latency,
+                                bandwidth=bandwidth) as portal:
+                    results.append(dict(settings, **bench_sync_down(portal, str(run_dir))))
+                shutil.rmtree(run_dir, ignore_errors=True)
+                _report(results[-1])
+            if 'monitor' in benchmarks:
+                run_dir = base_dir / f"monitor-{scale}"
+                # Uno a uno y, si está activo, por lotes (CREATE_BATCH_SECONDS)
+                create_window = float(os.getenv("CREATE_BATCH_SECONDS") or 1)
+                for window in (0, create_window) if create_window else (0,):
+                    with FakePortal(items=0, folders=folders, latency=latency, bandwidth=bandwidth) as portal:
+                        results.append(dict(settings, **bench_upload_handler(portal, str(run_dir), scale, item_size,
+                                                                             window)))
+                    shutil.rmtree(run_dir, ignore_errors=True)
+                    _report(results[-1])
+            if 'delete' in benchmarks:
+                with FakePortal(items=scale, folders=folders, item_size=item_size, latency=latency,
+                                bandwidth=bandwidth) as portal:
+                    delete_window = float(os.getenv("DELETE_BATCH_SECONDS") or 1)
+                    results.append(dict(settings, **bench_delete_handler(portal, str(base_dir / f"delete-{scale}"),
+                                                                         delete_window)))
+                _report(results[-1])
+    finally:
+        if workdir is None:
+            shutil.rmtree(base_dir, ignore_errors=True)
+    return results
+
+def _report(result):
+    if result['benchmark'] == 'sync_down':
+        logger.info(f"sync_down      {result['items']:>7} elementos  {result['seconds']:8.2f} s  "
+                    f"{result['items_per_s'] or 0:9.1f} elem/s  {result['mb_per_s'] or 0:7.2f} MB/s  "
+                    f"{result['requests']:>7} peticiones  (sin cambios: {result['noop_seconds']:.2f} s)")
+    elif result['benchmark'] == 'delete_handler':
+        logger.info(f"delete_handler {result['items']:>7} eventos    {result['seconds']:8.2f} s  "
+                    f"{result['events_per_s'] or 0:9.1f} ev/s    {'':>12}  {result['requests']:>7} peticiones")
+        if result['failed']:
+            logger.warning(f"  {result['failed']} elementos no llegaron a eliminarse")
+    else:
+        logger.info(f"{result['benchmark']:<14} {result['items']:>7} eventos    {result['seconds']:8.2f} s  "
+                    f"{result['events_per_s'] or 0:9.1f} ev/s    {result['mb_per_s'] or 0:7.2f} MB/s  "
+                    f"{result['requests']:>7} peticiones  (latencia p50 {result['latency_p50_ms'] or 0:.0f} ms, "
+                    f"p95 {result['latency_p95_ms'] or 0:.0f} ms, máx {result['latency_max_ms'] or 0:.0f} ms)")
+        if result['failed']:
+            logger.warning(f"  {result['failed']} eventos no llegaron a subirse")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de GISBox contra un portal de ArcGIS simulado en local.")
+    parser.add_argument('--scales', default='100,10000,100000',
+                        help="Elementos (sync_down) y eventos (UploadHandler) por ejecución, separados por comas")
+    parser.add_argument('--latency-ms', type=float, default=20, help="Latencia añadida a cada petición")
+    parser.add_argument('--bandwidth-mb', type=float, default=0,
+                        help="Ancho de banda por conexión en MB/s (0: sin límite)")
+    parser.add_argument('--item-size-kb', type=float, default=4, help="Tamaño de cada elemento o archivo")
+    parser.add_argument('--folders', type=int, default=4, help="Carpetas del usuario (además de la raíz)")
+    parser.add_argument('--only', choices=['sync', 'monitor', 'delete'], help="Ejecutar solo uno de los benchmarks")
+    parser.add_argument('--json', help="Guardar los resultados en este archivo JSON")
+    parser.add_argument('--verbose', action='store_true', help="Mantener el log de GISBox")
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        for name in GISBOX_LOGGERS:
+            logging.getLogger(name).setLevel(logging.WARNING)
+    results = run([int(scale) for scale in args.scales.split(',')], latency=args.latency_ms / 1000,
+                  bandwidth=args.bandwidth_mb * MB or None, item_size=int(args.item_size_kb * 1024),
+                  folders=args.folders, benchmarks=(args.only,) if args.only else ('sync', 'monitor', 'delete'))
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding='utf-8')
+        logger.info(f"Resultados guardados en {args.json}")
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import os
+import sys
+import json
+import logging
+import argparse
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from dotenv import load_dotenv
+
+# Configuración de Logging
+logger = logging.getLogger('GISBox')
+logger.setLevel(logging.INFO)
+# Configuración del handler (para que solo se configure una vez)
+if not logger.handlers:
+    ch = logging.StreamHandler()
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+
+# Este módulo solo importa la biblioteca estándar y python-dotenv: los módulos de
+# GISBox (y con ellos la API de ArcGIS) se importan dentro de cada comando, después
+# de validar la configuración, para que `--help` y los errores del .env sean inmediatos.
+
+def check_config(command):
+    """
+    Valida la configuración mínima del comando antes de importar nada pesado. El
+    resto de opciones las valida cada clase antes de conectarse a ArcGIS.
+    """
+    if not os.getenv("LOCAL_SYNC_DIR"):
+        raise ValueError("LOCAL_SYNC_DIR no está configurado en el archivo .env")
+    if command in ('sync', 'plan'):
+        sync_mode = (os.getenv("SYNC_MODE") or "backup").lower()
+        if sync_mode not in ('backup', 'incremental', 'delta'):
+            raise ValueError(f"SYNC_MODE no válido: {sync_mode} (use 'backup', 'incremental' o 'delta')")
+
+def make_profiler(args):
+    """
+    Profiler de la ejecución si se pidió `--profile` (traza JSON de Chrome y, con
+    `--cprofile`, estadísticas pstats junto a ella); si no, None.
+    """
+    if not args.profile:
+        return None
+    from gisbox_profile import Profiler
+    trace_path = Path(args.profile)
+    cprofile_path = trace_path.with_suffix('.prof') if args.cprofile else None
+    return Profiler(trace_path, cprofile_path).start()
+
+def cmd_sync(args):
+    """
+    Sincronización de descarga (como `python gisbox_sync.py`).
+    """
+    from gisbox_sync import GISBoxSync
+    profiler = make_profiler(args)
+    try:
+        sync_tool = GISBoxSync(profiler=profiler)
+        try:
+            with sync_tool.profiler.span('sync_down', sync_mode=sync_tool.sync_mode):
+                sync_tool.sync_down()
+        finally:
+            sync_tool.state.close()
+    finally:
+        if profiler is not None:
+            profiler.stop()
+    return 0
+
+def cmd_monitor(args):
+    """
+    Monitorización y subida de los cambios locales (como `python gisbox_monitor.py`).
+    """
+    if not Path(os.getenv("LOCAL_SYNC_DIR")).exists():
+        logger.warning("El directorio local no existe. Por favor, ejecute primero `gisbox sync` para la sincronización inicial.")
+    from gisbox_monitor import GISBoxMonitor
+    profiler = make_profiler(args)
+    try:
+        GISBoxMonitor(profiler=profiler).start_monitoring()
+    finally:
+        if profiler is not None:
+            profiler.stop()
+    return 0
+
+def cmd_plan(args):
+    """
+    Muestra lo que haría `sync` sin descargar ni borrar nada.
+    """
+    from gisbox_state import StateStore
+    local_sync_dir = os.getenv("LOCAL_SYNC_DIR")
+    if not StateStore.exists_for_sync_dir(local_sync_dir):
+        # Sin estado no hay nada que comparar, y `plan` no debe crearlo
+        logger.warning("Aún no hay estado guardado: ejecute `gisbox sync` para la sincronización inicial")
+        return 0
+    from gisbox_sync import GISBoxSync
+    sync_tool = GISBoxSync(state=StateStore.for_sync_dir(local_sync_dir, read_only=True))
+    try:
+        plan = sync_tool.plan()
+    finally:
+        sync_tool.state.close()
+
+    if args.json:
+        print(json.dumps(plan, indent=2, ensure_ascii=False))
+        return 0
+    if plan['reset']:
+        print(f"Modo backup: se vaciará {sync_tool.local_sync_dir} y se descargará todo")
+    for item in plan['download']:
+        path = f"{item['folder']}/{item['title']}" if item['folder'] else item['title']
+        size = f", {item['size']} bytes" if item['size'] is not None else ""
+        print(f"+ {path} ({item['type']}{size})")
+    for path in plan['remove']:
+        print(f"- {path}")
+    print(f"{len(plan['download'])} descargas, {len(plan['remove'])} eliminaciones locales, "
+          f"{plan['unchanged']} elementos al día")
+    return 0
+
+def cmd_status(args):
+    """
+    Resume el estado guardado en LOCAL_SYNC_DIR sin conectarse a ArcGIS.
+    """
+    from gisbox_state import StateStore
+    local_sync_dir = Path(os.getenv("LOCAL_SYNC_DIR"))
+    has_state = StateStore.exists_for_sync_dir(local_sync_dir)
+    status = {
+        'local_sync_dir': str(local_sync_dir),
+        'sync_mode': (os.getenv("SYNC_MODE") or "backup").lower(),
+        'items': 0,
+        'by_status': {},
+        'delta_high_water_mark': None,
+        'pending_multipart_uploads': 0,
+    }
+    if has_state:
+        # Solo lectura: el almacén usa WAL y no bloquea a un monitor o daemon en marcha
+        state = StateStore.for_sync_dir(local_sync_dir, read_only=True)
+        try:
+            by_status = Counter(row['sync_status'] or 'desconocido' for row in state.rows())
+            status['items'] = sum(by_status.values())
+            status['by_status'] = dict(sorted(by_status.items()))
+            high_water_mark = state.get_meta('delta_high_water_mark')
+            if high_water_mark is not None:
+                status['delta_high_water_mark'] = int(high_water_mark)
+            status['pending_multipart_uploads'] = len(state.upload_sessions())
+        finally:
+            state.close()
+
+    if args.json:
+        print(json.dumps(status, indent=2, ensure_ascii=False))
+        return 0
+    print(f"Directorio: {status['local_sync_dir']} (modo {status['sync_mode']})")
+    if not has_state:
+        print("Aún no hay estado guardado: ejecute `gisbox sync` o `gisbox monitor`")
+        return 0
+    detail = ', '.join(f"{sync_status}: {count}" for sync_status, count in status['by_status'].items())
+    print(f"Elementos sincronizados: {status['items']}" + (f" ({detail})" if detail else ""))
+    if status['delta_high_water_mark'] is not None:
+        moment = datetime.fromtimestamp(status['delta_high_water_mark'] / 1000)
+        print(f"Última modificación remota vista (delta): {moment:%Y-%m-%d %H:%M:%S}")
+    print(f"Subidas por partes pendientes: {status['pending_multipart_uploads']}")
+    return 0
+
+COMMANDS = {'sync': cmd_sync, 'monitor': cmd_monitor, 'plan': cmd_plan, 'status': cmd_status}
+
+def add_profile_arguments(parser):
+    parser.add_argument('--profile', metavar='TRAZA.json',
+                        help="Guardar una traza JSON de Chrome con el tiempo de reloj y de CPU de cada fase")
+    parser.add_argument('--cprofile', action='store_true',
+                        help="Con --profile, perfilar también con cProfile (estadísticas pstats en TRAZA.prof)")
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='gisbox', description="Sincronización entre ArcGIS Online/Enterprise y un directorio local.")
+    parser.add_argument('--env-file', help="Archivo .env a cargar (por defecto, el .env junto a este script)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    sync_parser = subparsers.add_parser('sync', help="Descargar el contenido de ArcGIS al directorio local")
+    sync_parser.add_argument('--mode', choices=['backup', 'incremental', 'delta'], help="Sustituye a SYNC_MODE")
+    add_profile_arguments(sync_parser)
+    monitor_parser = subparsers.add_parser('monitor', help="Subir a ArcGIS los cambios del directorio local")
+    add_profile_arguments(monitor_parser)
+    plan_parser = subparsers.add_parser('plan', help="Mostrar lo que haría `sync` sin cambiar nada")
+    plan_parser.add_argument('--mode', choices=['backup', 'incremental', 'delta'], help="Sustituye a SYNC_MODE")
+    plan_parser.add_argument('--json', action='store_true', help="Salida en JSON")
+    status_parser = subparsers.add_parser('status', help="Resumir el estado local sin conectarse a ArcGIS")
+    status_parser.add_argument('--json', action='store_true', help="Salida en JSON")
+    return parser
+
+def main(argv=None):
+    """
+    Punto de entrada de la CLI. Devuelve el código de salida: 0 si todo fue bien,
+    2 si la configuración no es válida y 1 ante cualquier otro error.
+    """
+    args = build_parser().parse_args(argv)
+    load_dotenv(args.env_file or Path(__file__).parent / ".env")
+    if getattr(args, 'mode', None):
+        os.environ["SYNC_MODE"] = args.mode
+    if getattr(args, 'cprofile', False) and not args.profile:
+        logger.error("--cprofile requiere --profile")
+        return 2
+    try:
+        check_config(args.command)
+        return COMMANDS[args.command](args)
+    except ValueError as e:
+        logger.error(f"Error de configuración: {e}. Por favor, complete el archivo .env.")
+        return 2
+    except Exception as e:
+        logger.error(f"Ocurrió un error en `gisbox {args.command}`: {e}")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+import os
+import time
+import logging
+import threading
+from pathlib import Path
+from dotenv import load_dotenv
+from gisbox_governor import RequestGovernor
+from gisbox_metrics import Metrics, start_metrics_server
+from gisbox_monitor import GISBoxMonitor
+from gisbox_scheduler import AdaptiveInterval
+from gisbox_state import StateStore
+from gisbox_sync import GISBoxSync
+
+# Configuración de Logging
+logger = logging.getLogger('GISBoxDaemon')
+logger.setLevel(logging.INFO)
+# Configuración del handler (para que solo se configure una vez)
+if not logger.handlers:
+    ch = logging.StreamHandler()
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+
+def configure_connection_pool(gis, pool_size):
+    """
+    Ajusta el tamaño del pool de conexiones keep-alive de la sesión HTTP de `gis`.
+    Se reconfiguran los adaptadores ya montados (en lugar de montar otros) para
+    conservar su configuración TLS/PKI.
+    """
+    adapters = {id(adapter): adapter for adapter in gis.session.adapters.values()}
+    for adapter in adapters.values():
+        adapter._pool_connections = pool_size
+        adapter._pool_maxsize = pool_size
+        adapter.poolmanager.clear()
+        adapter.init_poolmanager(pool_size, pool_size, block=adapter._pool_block)
+    logger.info(f"Pool de conexiones HTTP: {pool_size} conexiones por host")
+
+class GISBoxDaemon:
+    """
+    Proceso único de larga duración: ejecuta el monitor de forma continua y
+    sincronizaciones de descarga incrementales periódicas. Ambos comparten una
+    sola conexión a ArcGIS (un inicio de sesión, una renovación del token y un
+    pool de conexiones keep-alive), el regulador de peticiones, el almacén de estado
+    y las métricas.
+    """
+    def __init__(self):
+        # Cargar variables de entorno desde .env
+        load_dotenv(Path(__file__).parent / ".env")
+
+        self.local_sync_dir = os.getenv("LOCAL_SYNC_DIR")
+        if not self.local_sync_dir:
+            raise ValueError("LOCAL_SYNC_DIR no está configurado en el archivo .env")
+        # Intervalo entre sincronizaciones de descarga, adaptado a los cambios remotos
+        self.sync_interval = AdaptiveInterval.from_env()
+
+        self.governor = RequestGovernor.from_env()
+        self.state = StateStore.for_sync_dir(self.local_sync_dir)
+        self.metrics = Metrics.from_env()
+        self.sync = GISBoxSync(governor=self.governor, state=self.state, metrics=self.metrics)
+        if self.sync.sync_mode == 'backup':
+            # Borrar el directorio en cada pasada mientras el monitor lo vigila no tiene sentido
+            logger.info("El daemon usa sincronización incremental (SYNC_MODE=backup no aplica)")
+            self.sync.sync_mode = 'incremental'
+        self.monitor = GISBoxMonitor(gis=self.sync.gis, governor=self.governor, state=self.state,
+                                     metrics=self.metrics)
+        self.gis = self.sync.gis
+
+        # Por defecto, una conexión por cada hilo que puede hablar con el portal a la vez
+        monitor_workers = self.monitor.upload_workers
+        if self.monitor.create_window:
+            monitor_workers += self.monitor.create_workers
+        default_pool_size = (self.sync.max_workers + self.sync.folder_workers
+                             + monitor_workers * self.monitor.multipart_workers)
+        self.pool_size = int(os.getenv("HTTP_POOL_SIZE") or default_pool_size)
+        if self.pool_size < 1:
+            raise ValueError("HTTP_POOL_SIZE debe ser un entero mayor que 0")
+        configure_connection_pool(self.gis, self.pool_size)
+
+        self._sync_thread = None
+        self._next_sync = None
+
+    def run(self):
+        """
+        Arranca el monitor y lanza una sincronización de descarga al inicio y, después,
+        cada vez que vence el intervalo adaptativo, contado desde el final de la
+        anterior. Nunca hay dos sincronizaciones a la vez.
+        """
+        self.monitor.start()
+        metrics_server = start_metrics_server(self.metrics)
+        logger.info("GISBox Daemon iniciado. Presiona CTRL+C para detener.")
+        self._next_sync = time.monotonic()
+        try:
+            while True:
+                self._maybe_start_sync()
+                time.sleep(1)
+                self.monitor.tick()
+        except KeyboardInterrupt:
+            pass
+        if self._sync_thread is not None:
+            self._sync_thread.join()
+        self.monitor.stop()
+        if metrics_server is not None:
+            metrics_server.stop()
+        self.state.close()
+        logger.info("GISBox Daemon detenido.")
+
+    def _maybe_start_sync(self):
+        if self._sync_thread is not None and self._sync_thread.is_alive():
+            return
+        if time.monotonic() < self._next_sync:
+            return
+        self._sync_thread = threading.Thread(target=self._run_sync, name='gisbox-sync', daemon=True)
+        self._sync_thread.start()
+
+    def _run_sync(self):
+        try:
+            self.sync.sync_down()
+            self.sync_interval.update(self.sync.last_change_count)
+        except Exception as e:
+            logger.error(f"Error en la sincronización de descarga: {e}")
+        self._next_sync = time.monotonic() + self.sync_interval.seconds
+
+if __name__ == "__main__":
+    try:
+        daemon = GISBoxDaemon()
+        daemon.run()
+
+    except ValueError as e:
+        logger.error(f"Error de configuración: {e}. Por favor, complete el archivo .env.")
+    except Exception as e:
+        logger.error(f"Ocurrió un error en el daemon: {e}")
@@ -0,0 +1,254 @@
+import os
+import re
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+import requests
+
+# Configuración de Logging
+logger = logging.getLogger('GISBoxGovernor')
+logger.setLevel(logging.INFO)
+# Configuración del handler (para que solo se configure una vez)
+if not logger.handlers:
+    ch = logging.StreamHandler()
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+
+# Códigos HTTP con los que el portal indica que hay que frenar
+THROTTLE_STATUS = {429, 503}
+# Códigos HTTP de errores transitorios que merece la pena reintentar
+TRANSIENT_STATUS = {500, 502, 504}
+
+# La API de ArcGIS convierte los errores HTTP en excepciones genéricas con el código en el texto
+_THROTTLE_PATTERN = re.compile(r'\b(429|503)\b|too many requests|rate limit', re.IGNORECASE)
+_TRANSIENT_PATTERN = re.compile(r'\b(500|502|504)\b|timed out|timeout|connection (aborted|reset|refused)',
+                                re.IGNORECASE)
+
+def classify_error(error):
+    """
+    Clasifica una excepción de una petición al portal. Devuelve una tupla
+    (throttled, transient, retry_after): si el portal pidió frenar, si el error
+    es transitorio (se puede reintentar) y los segundos indicados en Retry-After.
+    """
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    if status is not None:
+        retry_after = _parse_retry_after(response.headers.get('Retry-After'))
+        throttled = status in THROTTLE_STATUS
+        return throttled, throttled or status in TRANSIENT_STATUS, retry_after
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return False, True, None
+    message = str(error)
+    if _THROTTLE_PATTERN.search(message):
+        return True, True, None
+    return False, bool(_TRANSIENT_PATTERN.search(message)), None
+
+def _parse_retry_after(value):
+    # Retry-After admite segundos o una fecha HTTP
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+class RequestGovernor:
+    """
+    Regula las peticiones al portal compartidas por la descarga y el monitor.
+    El número de peticiones simultáneas se ajusta con AIMD: crece de uno en uno
+    mientras las respuestas son rápidas y se reduce a la mitad ante un 429/503 o
+    una latencia por encima de `latency_target`. Un Retry-After detiene todas las
+    peticiones el tiempo indicado y los errores transitorios se reintentan con
+    espera exponencial con jitter.
+    """
+    def __init__(self, max_concurrency=8, min_concurrency=1, max_retries=5, base_delay=1.0, max_delay=60.0,
+                 latency_target=10.0):
+        if max_concurrency < 1 or min_concurrency < 1:
+            raise ValueError("La concurrencia del regulador debe ser un entero mayor que 0")
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min(min_concurrency, max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.latency_target = latency_target
+        self.limit = float(max_concurrency)
+        self.throttle_count = 0
+        self.retry_count = 0
+        self._in_flight = 0
+        self._resume_at = 0.0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    @classmethod
+    def from_env(cls):
+        """
+        Crea el regulador con la configuración del .env (MAX_REQUESTS_IN_FLIGHT,
+        REQUEST_RETRIES y LATENCY_TARGET_SECONDS).
+        """
+        return cls(max_concurrency=int(os.getenv("MAX_REQUESTS_IN_FLIGHT") or 8),
+                   max_retries=int(os.getenv("REQUEST_RETRIES") or 5),
+                   latency_target=float(os.getenv("LATENCY_TARGET_SECONDS") or 10))
+
+    def call(self, func, *args, timed=True, idempotent=True, **kwargs):
+        """
+        Ejecuta `func(*args, **kwargs)` dentro del límite de concurrencia,
+        reintentando los errores transitorios. Con `timed=False` la latencia no se
+        usa como señal de congestión (transferencias cuya duración depende del tamaño).
+        Con `idempotent=False` (p. ej. una creación) solo se reintenta si el portal
+        pidió frenar: tras un corte o un timeout la petición pudo aplicarse igualmente.
+        """
+        attempt = 0
+        while True:
+            self._acquire()
+            started = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self._release()
+                throttled, transient, retry_after = classify_error(e)
+                if throttled:
+                    self.throttle_count += 1
+                    self._decrease(retry_after)
+                if not transient or attempt >= self.max_retries or not (idempotent or throttled):
+                    raise
+                delay = self.backoff(attempt, retry_after)
+                attempt += 1
+                self.retry_count += 1
+                logger.warning(f"Petición fallida ({e}); reintento {attempt}/{self.max_retries} en {delay:.1f} s")
+                time.sleep(delay)
+                continue
+            self._release()
+            if timed and self.latency_target and time.monotonic() - started > self.latency_target:
+                self._decrease()
+            else:
+                self._increase()
+            return result
+
+    def wrap(self, func, timed=True):
+        """
+        Devuelve `func` envuelta para pasar siempre por el regulador.
+        """
+        def governed(*args, **kwargs):
+            return self.call(func, *args, timed=timed, **kwargs)
+        return governed
+
+    def backoff(self, attempt, retry_after=None):
+        """
+        Espera exponencial con jitter completo; nunca menor que Retry-After.
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(delay, retry_after or 0.0)
+
+    @property
+    def in_flight(self):
+        with self._condition:
+            return self._in_flight
+
+    def _acquire(self):
+        with self._condition:
+            while True:
+                wait = self._resume_at - time.monotonic()
+                if wait <= 0 and self._in_flight < int(self.limit):
+                    self._in_flight += 1
+                    return
+                self._condition.wait(timeout=wait if wait > 0 else None)
+
+    def _release(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify()
+
+    def _increase(self):
+        # Aumento aditivo: +1 por cada "ventana" completa de respuestas correctas
+        with self._condition:
+            if self.limit < self.max_concurrency:
+                self.limit = min(self.max_concurrency, self.limit + 1.0 / int(self.limit))
+                self._condition.notify_all()
+
+    def _decrease(self, retry_after=None):
+        # Reducción multiplicativa, como mucho una vez por intervalo de espera base,
+        # para que una ráfaga de errores simultáneos no hunda el límite al mínimo
+        with self._condition:
+            now = time.monotonic()
+            if retry_after:
+                self._resume_at = max(self._resume_at, now + retry_after)
+            if now - self._last_decrease >= self.base_delay:
+                self._last_decrease = now
+                self.limit = max(float(self.min_concurrency), self.limit / 2)
+                logger.info(f"Portal saturado: se reducen las peticiones simultáneas a {int(self.limit)}")
+
+class RetryQueue:
+    """
+    Cola de elementos cuya sincronización falló, para reintentarlos más tarde en
+    lugar de descartarlos. Cada entrada se identifica por una clave (id de elemento
+    o ruta); añadir de nuevo una clave reemplaza la entrada anterior.
+    """
+    def __init__(self, governor=None, max_attempts=5):
+        self.governor = governor if governor is not None else RequestGovernor()
+        self.max_attempts = max_attempts
+        # Claves que agotaron sus intentos
+        self.exhausted = set()
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def add(self, key, func, *args, error=None):
+        """
+        Encola `func(*args)` para reintentarlo tras una espera creciente. Devuelve
+        False (y no lo encola) si ya se agotaron los intentos.
+        """
+        with self._lock:
+            previous = self._entries.get(key)
+            attempts = previous['attempts'] + 1 if previous and previous['func'] == func else 1
+            if attempts > self.max_attempts:
+                self._entries.pop(key, None)
+                self.exhausted.add(key)
+                logger.error(f"Se descarta {key} tras {self.max_attempts} intentos: {error}")
+                return False
+            self._entries[key] = {'func': func, 'args': args, 'attempts': attempts,
+                                  'not_before': time.monotonic() + self.governor.backoff(attempts)}
+            return True
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self.exhausted.discard(key)
+
+    def pop_due(self, now=None):
+        """
+        Devuelve las entradas cuya espera ya pasó, como tuplas (clave, func, args).
+        La entrada se conserva, para contar los intentos, hasta que se llame a
+        `discard` (reintento correcto) o a `add` (reintento fallido).
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            due = []
+            for key, entry in self._entries.items():
+                if entry['not_before'] <= now:
+                    entry['not_before'] = float('inf')  # En curso
+                    due.append((key, entry['func'], entry['args']))
+            return due
+
+    def next_due(self):
+        """
+        Segundos hasta la próxima entrada en espera (None si no hay ninguna).
+        """
+        with self._lock:
+            waiting = [entry['not_before'] for entry in self._entries.values() if entry['not_before'] != float('inf')]
+        if not waiting:
+            return None
+        return max(0.0, min(waiting) - time.monotonic())
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,314 @@
+import os
+import time
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Configuración de Logging
+logger = logging.getLogger('GISBoxMetrics')
+logger.setLevel(logging.INFO)
+# Configuración del handler (para que solo se configure una vez)
+if not logger.handlers:
+    ch = logging.StreamHandler()
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+
+# Límites superiores (segundos) de los intervalos de los histogramas de latencia
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# Prefijo de todas las métricas exportadas
+PREFIX = 'gisbox'
+
+class _Timer:
+    """
+    Mide la duración de un bloque `with` y la registra al salir (con resultado
+    'error' si el bloque lanzó una excepción).
+    """
+    __slots__ = ('metrics', 'operation', 'started')
+
+    def __init__(self, metrics, operation):
+        self.metrics = metrics
+        self.operation = operation
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.operation, time.perf_counter() - self.started,
+                             'ok' if exc_type is None else 'error')
+        return False
+
+class Metrics:
+    """
+    Registro de métricas en memoria, seguro entre hilos: por cada operación, un
+    contador de resultados y un histograma de latencia; contadores genéricos con
+    etiquetas (bytes transferidos, eventos, ...) e indicadores que se calculan al
+    leerlos (profundidad de las colas). Se exporta en el formato de texto de
+    Prometheus (ver `render` y MetricsServer) y como resumen legible (`summary`).
+    """
+    enabled = True
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # (operación, resultado) -> número de operaciones
+        self._results = {}
+        # operación -> [recuento por intervalo (+Inf al final), suma de segundos]
+        self._histograms = {}
+        # (nombre, etiquetas ordenadas) -> valor
+        self._counters = {}
+        # nombre -> función sin argumentos que devuelve el valor actual
+        self._gauges = {}
+
+    @classmethod
+    def from_env(cls):
+        """
+        Devuelve un registro activo si METRICS_ENABLED está activado; si no, NULL_METRICS.
+        """
+        if (os.getenv("METRICS_ENABLED") or "false").lower() in ('1', 'true', 'yes'):
+            return cls()
+        return NULL_METRICS
+
+    def time(self, operation):
+        """
+        Context manager que mide la duración de `operation`.
+        """
+        return _Timer(self, operation)
+
+    def observe(self, operation, seconds, result='ok'):
+        """
+        Registra una operación terminada, su resultado y su duración.
+        """
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            key = (operation, result)
+            self._results[key] = self._results.get(key, 0) + 1
+            histogram = self._histograms.get(operation)
+            if histogram is None:
+                histogram = self._histograms[operation] = [[0] * (len(self.buckets) + 1), 0.0]
+            histogram[0][index] += 1
+            histogram[1] += seconds
+
+    def count(self, name, value=1, **labels):
+        """
+        Suma `value` al contador `name` con las etiquetas indicadas.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def add_bytes(self, direction, size):
+        """
+        Suma bytes transferidos ('download' o 'upload').
+        """
+        if size:
+            self.count('bytes', size, direction=direction)
+
+    def gauge(self, name, callback):
+        """
+        Registra un indicador cuyo valor se obtiene llamando a `callback` al exportar.
+        """
+        with self._lock:
+            self._gauges[name] = callback
+
+    def snapshot(self):
+        """
+        Copia del estado actual, para resumir después solo lo ocurrido desde entonces.
+        """
+        with self._lock:
+            return {
+                'results': dict(self._results),
+                'histograms': {operation: [list(histogram[0]), histogram[1]]
+                               for operation, histogram in self._histograms.items()},
+                'counters': dict(self._counters),
+            }
+
+    def summary(self, since=None):
+        """
+        Líneas de resumen legibles (operaciones, errores, tiempos y bytes) de lo
+        registrado desde la instantánea `since` (o desde el principio).
+        """
+        current = self.snapshot()
+        since = since or {'results': {}, 'histograms': {}, 'counters': {}}
+        lines = []
+        for operation in sorted(current['histograms']):
+            counts, total = current['histograms'][operation]
+            previous = since['histograms'].get(operation, [[0] * len(counts), 0.0])
+            counts = [count - before for count, before in zip(counts, previous[0])]
+            number = sum(counts)
+            if not number:
+                continue
+            total -= previous[1]
+            errors = (current['results'].get((operation, 'error'), 0)
+                      - since['results'].get((operation, 'error'), 0))
+            lines.append(f"  {operation}: {number} operaciones"
+                         + (f" ({errors} con error)" if errors else "")
+                         + f", {total:.2f} s en total, media {total / number * 1000:.0f} ms, "
+                         f"p95 {self._percentile_bound(counts, 0.95)}")
+        for (name, labels), value in sorted(current['counters'].items()):
+            value -= since['counters'].get((name, labels), 0)
+            if not value:
+                continue
+            label = ', '.join(f"{key}={label_value}" for key, label_value in labels)
+            amount = f"{value / (1024 * 1024):.2f} MB" if name == 'bytes' else f"{value:g}"
+            lines.append(f"  {name}" + (f" ({label})" if label else "") + f": {amount}")
+        return lines
+
+    def _percentile_bound(self, counts, fraction):
+        # Límite superior del intervalo del histograma que contiene el percentil
+        target = fraction * sum(counts)
+        accumulated = 0
+        for bound, count in zip(self.buckets + (None,), counts):
+            accumulated += count
+            if accumulated >= target:
+                return f"≤ {bound * 1000:g} ms" if bound is not None else f"> {self.buckets[-1]:g} s"
+        return "-"
+
+    def render(self):
+        """
+        Devuelve todas las métricas en el formato de texto de Prometheus (0.0.4).
+        """
+        current = self.snapshot()
+        with self._lock:
+            gauges = dict(self._gauges)
+
+        lines = [f"# HELP {PREFIX}_operations_total Operaciones terminadas por tipo y resultado",
+                 f"# TYPE {PREFIX}_operations_total counter"]
+        for (operation, result), value in sorted(current['results'].items()):
+            lines.append(f"{PREFIX}_operations_total{_labels(operation=operation, result=result)} {value}")
+
+        lines += [f"# HELP {PREFIX}_operation_seconds Duración de las operaciones por tipo",
+                  f"# TYPE {PREFIX}_operation_seconds histogram"]
+        for operation, (counts, total) in sorted(current['histograms'].items()):
+            accumulated = 0
+            for bound, count in zip(self.buckets + (None,), counts):
+                accumulated += count
+                le = '+Inf' if bound is None else f"{bound:g}"
+                lines.append(f"{PREFIX}_operation_seconds_bucket{_labels(operation=operation, le=le)} {accumulated}")
+            lines.append(f"{PREFIX}_operation_seconds_sum{_labels(operation=operation)} {total:.6f}")
+            lines.append(f"{PREFIX}_operation_seconds_count{_labels(operation=operation)} {accumulated}")
+
+        counter_names = sorted({name for name, _ in current['counters']})
+        for name in counter_names:
+            lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+            for (counter_name, labels), value in sorted(current['counters'].items()):
+                if counter_name == name:
+                    lines.append(f"{PREFIX}_{name}_total{_labels(**dict(labels))} {value:g}")
+
+        for name, callback in sorted(gauges.items()):
+            try:
+                value = float(callback())
+            except Exception as e:
+                logger.debug(f"No se pudo leer el indicador {name}: {e}")
+                continue
+            lines += [f"# TYPE {PREFIX}_{name} gauge", f"{PREFIX}_{name} {value:g}"]
+        return '\n'.join(lines) + '\n'
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class NullMetrics:
+    """
+    Registro desactivado: misma interfaz que Metrics, sin hacer nada. Es el valor
+    por defecto, de modo que la instrumentación apenas cuesta una llamada vacía.
+    """
+    enabled = False
+
+    def time(self, operation):
+        return _NULL_TIMER
+
+    def observe(self, operation, seconds, result='ok'):
+        pass
+
+    def count(self, name, value=1, **labels):
+        pass
+
+    def add_bytes(self, direction, size):
+        pass
+
+    def gauge(self, name, callback):
+        pass
+
+    def snapshot(self):
+        return None
+
+    def summary(self, since=None):
+        return []
+
+    def render(self):
+        return ''
+
+NULL_METRICS = NullMetrics()
+
+def _labels(**labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+class MetricsServer:
+    """
+    Servidor HTTP local que expone las métricas en /metrics para Prometheus.
+    Con `port=0` el sistema elige un puerto libre (ver `port` tras `start`).
+    """
+    def __init__(self, metrics, port, host='127.0.0.1'):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Sin una línea de log por cada lectura de Prometheus
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='gisbox-metrics', daemon=True)
+        self._thread.start()
+        logger.info(f"Métricas disponibles en http://{self.host}:{self.port}/metrics")
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+def start_metrics_server(metrics):
+    """
+    Arranca el servidor de métricas si el registro está activo y METRICS_PORT está
+    configurado (METRICS_HOST, por defecto 127.0.0.1). Devuelve el servidor o None.
+    """
+    port = int(os.getenv("METRICS_PORT") or 0)
+    if not metrics.enabled or not port:
+        return None
+    return MetricsServer(metrics, port, os.getenv("METRICS_HOST") or '127.0.0.1').start()
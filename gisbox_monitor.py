@@ -1,11 +1,22 @@
+import io
 import os
+import math
 import time
+import queue
+import itertools
+import functools
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from arcgis.gis import GIS
 from dotenv import load_dotenv
+from gisbox_governor import RequestGovernor, RetryQueue
+from gisbox_metrics import NULL_METRICS, Metrics, start_metrics_server
+from gisbox_profile import NULL_PROFILER
+from gisbox_state import STATE_DIR_NAME, StateStore, hash_file
+from gisbox_sync import FILE_TYPES, _item_modified, get_file_extension, iter_user_items
 
 # Configuración de Logging
 # Configuración de Logging
@@ -18,17 +29,999 @@ if not logger.handlers:
     ch.setFormatter(formatter)
     logger.addHandler(ch)
 
+# La API de ArcGIS se importa la primera vez que se necesita (ver `load_arcgis`)
+GIS = None
+Item = None
+
+def load_arcgis():
+    """
+    Importa `arcgis.gis` si aún no se ha hecho. Respeta los nombres ya asignados
+    (p. ej. sustituidos en las pruebas).
+    """
+    global GIS, Item
+    if GIS is None or Item is None:
+        from arcgis import gis as arcgis_gis
+        GIS = GIS or arcgis_gis.GIS
+        Item = Item or arcgis_gis.Item
+
+class UploadQueue:
+    """
+    Cola de trabajo en segundo plano para las operaciones con ArcGIS (subidas,
+    actualizaciones y eliminaciones). Cada ruta se asigna siempre al mismo hilo,
+    de modo que las operaciones sobre un mismo archivo nunca se reordenan.
+    """
+    def __init__(self, num_workers=2):
+        if num_workers < 1:
+            raise ValueError("UPLOAD_WORKERS debe ser un entero mayor que 0")
+        self.num_workers = num_workers
+        self._queues = [queue.Queue() for _ in range(num_workers)]
+        self._threads = []
+
+    def start(self):
+        """
+        Arranca los hilos de trabajo.
+        """
+        for index, work_queue in enumerate(self._queues):
+            thread = threading.Thread(target=self._worker, args=(work_queue,),
+                                      name=f'gisbox-upload-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def put(self, src_path, func, *args):
+        """
+        Encola `func(*args)` en el hilo asignado a `src_path`.
+        """
+        work_queue = self._queues[hash(str(src_path)) % self.num_workers]
+        work_queue.put((src_path, func, args))
+
+    def pending(self):
+        """
+        Número de operaciones pendientes en la cola.
+        """
+        return sum(work_queue.qsize() for work_queue in self._queues)
+
+    def join(self):
+        """
+        Espera a que se procesen todas las operaciones encoladas.
+        """
+        for work_queue in self._queues:
+            work_queue.join()
+
+    def stop(self):
+        """
+        Procesa las operaciones pendientes y detiene los hilos de trabajo.
+        """
+        for work_queue in self._queues:
+            work_queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _worker(self, work_queue):
+        while True:
+            task = work_queue.get()
+            try:
+                if task is None:
+                    return
+                src_path, func, args = task
+                try:
+                    func(*args)
+                except Exception as e:
+                    logger.error(f"Error al sincronizar {src_path}: {e}")
+            finally:
+                work_queue.task_done()
+
+class EventDebouncer:
+    """
+    Agrupa los eventos de cada ruta hasta que dejan de llegar durante `quiet_seconds`
+    y el tamaño y la fecha de modificación del archivo se mantienen estables.
+    Entonces emite una única operación ('upload', 'delete' o 'move') por ruta, evitando
+    subir varias veces (o a medio escribir) un archivo que se guarda en ráfagas.
+
+    Si se indica `find_moved_from`, las eliminaciones se retienen `move_window`
+    segundos: una creación cuyo contenido coincide con el de un archivo eliminado
+    en ese intervalo se emite como movimiento.
+    """
+    def __init__(self, emit, quiet_seconds=2.0, poll_interval=0.5, move_window=0, find_moved_from=None):
+        self.emit = emit
+        self.quiet_seconds = quiet_seconds
+        self.poll_interval = poll_interval
+        self.move_window = move_window
+        self.find_moved_from = find_moved_from
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        # Métricas: eventos recibidos frente a operaciones emitidas
+        self.events_received = 0
+        self.operations_emitted = 0
+
+    def push(self, action, src_path, now=None, moved_from=None):
+        """
+        Registra un evento. Prevalece la última acción recibida para cada ruta, salvo
+        que la ruta sea el destino de un movimiento pendiente.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.events_received += 1
+            existing = self._pending.get(src_path)
+            if existing and existing['action'] == 'move':
+                if action == 'upload':
+                    # Modificado tras moverlo: el movimiento sincroniza también el contenido
+                    existing['last_event'] = now
+                    existing['stat'] = None
+                    return
+                if action == 'delete':
+                    # Movido y eliminado: lo que hay que eliminar es el elemento original
+                    del self._pending[src_path]
+                    src_path, moved_from = existing['moved_from'], None
+            if action == 'move':
+                previous = self._pending.pop(moved_from, None)
+                if previous and previous['action'] == 'move':
+                    # Movimientos encadenados (A -> B -> C): el origen sigue siendo A
+                    moved_from = previous['moved_from']
+            self._pending[src_path] = {'action': action, 'last_event': now, 'stat': None,
+                                       'moved_from': moved_from}
+
+    def flush_ready(self, now=None):
+        """
+        Emite las rutas que llevan `quiet_seconds` sin eventos y cuyo archivo es estable.
+        La búsqueda de movimientos (que calcula el hash del archivo nuevo) se hace sin
+        retener el bloqueo, para no detener a `push` (el hilo del observador).
+        """
+        now = time.monotonic() if now is None else now
+        ready = []
+        # (ruta, entrada) de las creaciones que pueden ser un movimiento
+        candidates = []
+        ready_deletes = []
+        with self._lock:
+            for src_path, entry in list(self._pending.items()):
+                wait = self.quiet_seconds
+                if entry['action'] == 'delete' and self.find_moved_from:
+                    wait = max(wait, self.move_window)
+                if now - entry['last_event'] < wait:
+                    continue
+                if entry['action'] in ('upload', 'move'):
+                    stat = self._stat(src_path)
+                    if stat is None:
+                        # El archivo ya no existe: el resultado neto es una eliminación
+                        if entry['action'] == 'move':
+                            # ...del elemento original
+                            del self._pending[src_path]
+                            entry['action'] = 'delete'
+                            ready.append(self._operation(entry, entry['moved_from']))
+                            continue
+                        entry['action'] = 'delete'
+                    elif stat != entry['stat']:
+                        # Aún no se había comprobado o ha cambiado: esperar al siguiente ciclo
+                        entry['stat'] = stat
+                        continue
+                if entry['action'] == 'upload' and self.find_moved_from:
+                    candidates.append((src_path, entry))
+                elif entry['action'] == 'delete':
+                    # Se emite después: puede ser el origen de un movimiento de este ciclo
+                    ready_deletes.append((src_path, entry))
+                else:
+                    del self._pending[src_path]
+                    ready.append(self._operation(entry, src_path))
+            deleted = [path for path, other in self._pending.items() if other['action'] == 'delete']
+
+        # Hash del archivo nuevo fuera del bloqueo
+        matches = [(src_path, entry, self.find_moved_from(src_path, deleted) if deleted else None)
+                   for src_path, entry in candidates]
+
+        with self._lock:
+            for src_path, entry, moved_from in matches:
+                if self._pending.get(src_path) is not entry:
+                    # Llegó otro evento mientras se calculaba el hash: se revisa en el siguiente ciclo
+                    continue
+                if moved_from and self._pending.get(moved_from, {}).get('action') == 'delete':
+                    del self._pending[moved_from]
+                    entry['action'] = 'move'
+                    entry['moved_from'] = moved_from
+                del self._pending[src_path]
+                ready.append(self._operation(entry, src_path))
+            for src_path, entry in ready_deletes:
+                if self._pending.get(src_path) is entry:
+                    del self._pending[src_path]
+                    ready.append(self._operation(entry, src_path))
+            self.operations_emitted += len(ready)
+
+        for operation in ready:
+            self.emit(*operation)
+        return ready
+
+    def flush_all(self):
+        """
+        Emite inmediatamente todas las operaciones pendientes.
+        """
+        with self._lock:
+            ready = [self._operation(entry, src_path) for src_path, entry in self._pending.items()]
+            self._pending.clear()
+            self.operations_emitted += len(ready)
+        for operation in ready:
+            self.emit(*operation)
+
+    @staticmethod
+    def _operation(entry, src_path):
+        if entry['action'] == 'move':
+            return ('move', src_path, entry['moved_from'])
+        return (entry['action'], src_path)
+
+    def start(self):
+        """
+        Arranca el hilo que emite periódicamente las rutas estables.
+        """
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='gisbox-debouncer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Detiene el hilo y emite lo que quede pendiente.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush_all()
+        logger.info(f"Eventos recibidos: {self.events_received}, operaciones emitidas: {self.operations_emitted}")
+
+    def _run(self):
+        while not self._stop_event.wait(self.poll_interval):
+            try:
+                self.flush_ready()
+            except Exception as e:
+                logger.error(f"Error al procesar eventos pendientes: {e}")
+
+    @staticmethod
+    def _stat(src_path):
+        try:
+            stat = os.stat(src_path)
+        except OSError:
+            return None
+        return (stat.st_size, stat.st_mtime_ns)
+
+class TombstoneQueue:
+    """
+    Agrupa las eliminaciones remotas. Cada archivo borrado deja una "lápida" con el id
+    de su elemento. Cuando la más antigua cumple `window` segundos o se reúnen
+    `max_batch`, se entregan juntas a `delete_batch` para eliminarlas con una sola
+    petición al portal. Los lotes solo se envían desde el hilo propio (o con `flush`):
+    quien anota o retira una lápida (un hilo de subida) nunca espera a esa petición.
+    """
+    def __init__(self, delete_batch, window=1.0, max_batch=100, poll_interval=0.2):
+        self.delete_batch = delete_batch
+        self.window = window
+        self.max_batch = max_batch
+        self.poll_interval = poll_interval
+        # Ruta -> (id del elemento, instante de la eliminación); en orden de llegada
+        self._pending = {}
+        # Rutas de los lotes que se están enviando
+        self._in_flight = set()
+        # Ruta -> operación que se ejecuta cuando termine el envío de su lote
+        self._followups = {}
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def add(self, src_path, item_id, now=None):
+        """
+        Anota la eliminación de `src_path`. Si se completa un lote, avisa al hilo
+        para que lo envíe sin esperar al plazo.
+        """
+        now = time.monotonic() if now is None else now
+        with self._condition:
+            self._pending[src_path] = (item_id, now)
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wakeup.set()
+
+    def discard(self, src_path, followup=None):
+        """
+        Retira la lápida de `src_path` (el archivo ha vuelto a aparecer). Devuelve
+        'cancelled' si se retiró y None si no había ninguna. Si su lote ya se está
+        enviando no espera: `followup` se ejecutará cuando termine y devuelve 'deferred'.
+        """
+        with self._condition:
+            if src_path in self._in_flight:
+                if followup is not None:
+                    self._followups[src_path] = followup
+                return 'deferred'
+            return 'cancelled' if self._pending.pop(src_path, None) is not None else None
+
+    def flush(self, now=None, force=False):
+        """
+        Envía en lotes de hasta `max_batch` las lápidas cuyo plazo ha vencido (todas
+        con `force`). Devuelve cuántas se enviaron.
+        """
+        now = time.monotonic() if now is None else now
+        sent = 0
+        while True:
+            with self._condition:
+                if not self._pending:
+                    return sent
+                oldest = next(iter(self._pending.values()))[1]
+                if not force and len(self._pending) < self.max_batch and now - oldest < self.window:
+                    return sent
+                batch = [(src_path, item_id) for src_path, (item_id, _)
+                         in itertools.islice(self._pending.items(), self.max_batch)]
+                for src_path, _ in batch:
+                    del self._pending[src_path]
+                self._in_flight.update(src_path for src_path, _ in batch)
+            try:
+                self.delete_batch(batch)
+            finally:
+                with self._condition:
+                    self._in_flight.difference_update(src_path for src_path, _ in batch)
+                    followups = [self._followups.pop(src_path) for src_path, _ in batch
+                                 if src_path in self._followups]
+                for followup in followups:
+                    followup()
+            sent += len(batch)
+
+    def __len__(self):
+        with self._condition:
+            return len(self._pending)
+
+    def start(self):
+        """
+        Arranca el hilo que envía periódicamente las lápidas vencidas.
+        """
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='gisbox-tombstones', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Detiene el hilo y envía lo que quede pendiente.
+        """
+        self._stop_event.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush(force=True)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            if self._stop_event.is_set():
+                return
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error al enviar las eliminaciones pendientes: {e}")
+
+class UploadBatcher:
+    """
+    Agrupa las creaciones de archivos nuevos. Las rutas se retienen hasta que la más
+    antigua cumple `window` segundos o se reúnen `max_batch`; entonces el lote se
+    prepara una sola vez (`prepare_batch`, p. ej. para resolver sus carpetas) y cada
+    archivo se sube con `upload` en `num_workers` hilos, primero los más pequeños
+    (shortest-job-first): los archivos pequeños aparecen enseguida y los grandes se
+    suben en segundo plano. Al terminar un lote se llama a `finish_batch`.
+
+    Mientras una ruta está retenida o subiéndose, sus eventos posteriores se absorben
+    (ver `absorb`); los que llegan durante la subida se devuelven a `on_complete`.
+    """
+    def __init__(self, prepare_batch, upload, finish_batch=None, on_complete=None, window=1.0,
+                 max_batch=500, num_workers=4, poll_interval=0.2):
+        if num_workers < 1:
+            raise ValueError("CREATE_WORKERS debe ser un entero mayor que 0")
+        self.prepare_batch = prepare_batch
+        self.upload = upload
+        self.finish_batch = finish_batch
+        self.on_complete = on_complete
+        self.window = window
+        self.max_batch = max_batch
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        # Ruta -> instante de llegada, en orden; rutas en subida -> acción recibida durante ella
+        self._waiting = {}
+        self._running = {}
+        self._lock = threading.Lock()
+        # (tamaño, orden de llegada, ruta, lote): el archivo más pequeño sale primero
+        self._jobs = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._stop_event = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._workers = []
+
+    def hold(self, src_path, now=None):
+        """
+        Retiene la creación de `src_path`. Si se completa un lote, se despierta al hilo
+        de lotes: `hold` se llama desde los callbacks de eventos y no debe preparar el
+        lote (que resuelve carpetas en ArcGIS) en su propio hilo.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if src_path in self._waiting or src_path in self._running:
+                return
+            self._waiting[src_path] = now
+            full = len(self._waiting) >= self.max_batch
+        if full:
+            self._wakeup.set()
+
+    def absorb(self, action, src_path):
+        """
+        Absorbe un evento ('upload' o 'delete') de una ruta retenida. Antes de la subida,
+        una modificación no cambia nada (se sube el contenido final) y una eliminación
+        la cancela; durante la subida, la acción queda pendiente para `on_complete`.
+        Devuelve False si la ruta no está retenida.
+        """
+        with self._lock:
+            if src_path in self._waiting:
+                if action == 'delete':
+                    del self._waiting[src_path]
+                return True
+            if src_path in self._running:
+                self._running[src_path] = action
+                return True
+            return False
+
+    def flush(self, now=None, force=False):
+        """
+        Prepara y encola por tamaño, en lotes de hasta `max_batch`, las creaciones cuyo
+        plazo ha vencido (todas con `force`). Devuelve cuántas se encolaron.
+        """
+        now = time.monotonic() if now is None else now
+        sent = 0
+        while True:
+            with self._lock:
+                if not self._waiting:
+                    return sent
+                oldest = next(iter(self._waiting.values()))
+                if not force and len(self._waiting) < self.max_batch and now - oldest < self.window:
+                    return sent
+                paths = list(itertools.islice(self._waiting, self.max_batch))
+                for src_path in paths:
+                    del self._waiting[src_path]
+                    self._running[src_path] = None
+            try:
+                self.prepare_batch(paths)
+            except Exception as e:
+                # Cada subida vuelve a intentar lo que falte (p. ej. crear la carpeta)
+                logger.error(f"Error al preparar el lote de {len(paths)} archivos nuevos: {e}")
+            batch = {'paths': paths, 'remaining': len(paths)}
+            for src_path in paths:
+                self._jobs.put((self._size(src_path), next(self._sequence), src_path, batch))
+            sent += len(paths)
+
+    def pending(self):
+        """
+        Número de creaciones retenidas o en subida.
+        """
+        with self._lock:
+            return len(self._waiting) + len(self._running)
+
+    def join(self):
+        """
+        Espera a que se suban todas las creaciones encoladas.
+        """
+        self._jobs.join()
+
+    def start(self):
+        """
+        Arranca los hilos de subida y el que envía periódicamente los lotes vencidos.
+        """
+        self._stop_event.clear()
+        for index in range(self.num_workers):
+            thread = threading.Thread(target=self._worker, name=f'gisbox-create-{index}', daemon=True)
+            thread.start()
+            self._workers.append(thread)
+        self._thread = threading.Thread(target=self._run, name='gisbox-create-batcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Detiene el hilo de lotes, sube lo que quede pendiente y detiene los hilos de subida.
+        """
+        self._stop_event.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush(force=True)
+        for _ in self._workers:
+            # Tras todas las subidas reales, que son siempre más pequeñas
+            self._jobs.put((math.inf, next(self._sequence), None, None))
+        for thread in self._workers:
+            thread.join()
+        self._workers = []
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            if self._stop_event.is_set():
+                return
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error al enviar las creaciones pendientes: {e}")
+
+    def _worker(self):
+        while True:
+            _, _, src_path, batch = self._jobs.get()
+            try:
+                if src_path is None:
+                    return
+                self._process(src_path, batch)
+            finally:
+                self._jobs.task_done()
+
+    def _process(self, src_path, batch):
+        try:
+            self.upload(src_path)
+        except Exception as e:
+            logger.error(f"Error al sincronizar {src_path}: {e}")
+        with self._lock:
+            followup = self._running.pop(src_path, None)
+            batch['remaining'] -= 1
+            finished = batch['remaining'] == 0
+        if followup is not None and self.on_complete is not None:
+            self.on_complete(followup, src_path)
+        if finished and self.finish_batch is not None:
+            try:
+                self.finish_batch(batch['paths'])
+            except Exception as e:
+                logger.error(f"Error al completar el lote de {len(batch['paths'])} archivos nuevos: {e}")
+
+    @staticmethod
+    def _size(src_path):
+        try:
+            return os.stat(src_path).st_size
+        except OSError:
+            # Ya no existe: la subida no tiene nada que hacer
+            return 0
+
+class ItemIndex:
+    """
+    Índice local que asocia cada archivo sincronizado con el id de su elemento en
+    ArcGIS. La clave es la carpeta de ArcGIS y el nombre del archivo con su
+    extensión ("Carpeta/título.ext" o "título.ext"), que es como sync_down guarda
+    los elementos y como el monitor los sube.
+    """
+    def __init__(self):
+        self._item_ids = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(folder_name, file_name):
+        return f"{folder_name}/{file_name}" if folder_name else file_name
+
+    @classmethod
+    def key_for_path(cls, relative_path):
+        """
+        Clave de una ruta relativa a LOCAL_SYNC_DIR (separador '/'): solo cuenta la
+        carpeta de primer nivel, que es la carpeta de ArcGIS.
+        """
+        parts = relative_path.split('/')
+        return cls.make_key(parts[0] if len(parts) > 1 else None, parts[-1])
+
+    def build(self, gis, user, page_size=100, governor=None, state=None):
+        """
+        Construye el índice a partir de un listado completo del contenido del usuario.
+        Solo se indexan por título y extensión los elementos de tipos de archivo
+        (FILE_TYPES): un servicio o un mapa con el mismo título que un archivo nunca
+        se confunde con él. Con `state`, los archivos ya sincronizados se resuelven
+        por el id guardado en su fila, si el elemento sigue existiendo.
+        """
+        item_ids = {}
+        remote_ids = set()
+        folders = [(None, None)] + [(folder['title'], folder['id']) for folder in user.folders]
+        for folder_name, folder_id in folders:
+            for item in iter_user_items(gis, user.username, folder_id, page_size, governor):
+                remote_ids.add(item.id)
+                if item.type in FILE_TYPES:
+                    # Con títulos repetidos se conserva el primero
+                    item_ids.setdefault(self.make_key(folder_name, f"{item.title}.{get_file_extension(item)}"),
+                                        item.id)
+        if state is not None:
+            for row in state.rows('item_id IS NOT NULL'):
+                if row['item_id'] in remote_ids:
+                    item_ids[self.key_for_path(row['path'])] = row['item_id']
+        with self._lock:
+            self._item_ids = item_ids
+        logger.info(f"Índice local construido: {len(item_ids)} elementos")
+
+    def get(self, key):
+        with self._lock:
+            return self._item_ids.get(key)
+
+    def set(self, key, item_id):
+        with self._lock:
+            self._item_ids[key] = item_id
+
+    def pop(self, key):
+        with self._lock:
+            return self._item_ids.pop(key, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._item_ids)
+
+class FingerprintCache:
+    """
+    Caché de huellas de contenido por ruta (tamaño, mtime_ns y SHA-256) del último
+    contenido sincronizado con ArcGIS. Si el tamaño y la fecha no cambian no se
+    vuelve a calcular el hash. Con un almacén de estado (StateStore) las huellas
+    sobreviven a reinicios.
+    """
+    def __init__(self, store=None):
+        self.store = store
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Carga las huellas guardadas en el almacén de estado.
+        """
+        if self.store is not None:
+            entries = {row['path']: {'size': row['size'], 'mtime_ns': row['local_mtime'], 'sha256': row['content_hash']}
+                       for row in self.store.rows('content_hash IS NOT NULL')}
+            with self._lock:
+                self._entries = entries
+        return self
+
+    def save(self):
+        """
+        Aplica en el almacén de estado las escrituras pendientes.
+        """
+        if self.store is not None:
+            self.store.flush()
+
+    def compute(self, key, src_path):
+        """
+        Devuelve la huella actual de `src_path`. Reutiliza el hash guardado para
+        `key` si el tamaño y mtime_ns coinciden con los registrados.
+        """
+        stat = os.stat(src_path)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return dict(entry)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': self._hash_file(src_path)}
+
+    def is_unchanged(self, key, fingerprint):
+        """
+        Indica si `fingerprint` tiene el mismo contenido que el último sincronizado.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry is not None and entry['sha256'] == fingerprint['sha256']
+
+    def record(self, key, fingerprint, persist=True, **state):
+        """
+        Registra la huella de `key`. Los argumentos adicionales (item_id, title, ...)
+        se guardan junto a ella en el almacén de estado; con `persist=False` solo se
+        actualiza la caché en memoria.
+        """
+        with self._lock:
+            self._entries[key] = fingerprint
+        if persist and self.store is not None:
+            self.store.upsert(key, size=fingerprint['size'], local_mtime=fingerprint['mtime_ns'],
+                              content_hash=fingerprint['sha256'], **state)
+
+    def get(self, key):
+        with self._lock:
+            return self._entries.get(key)
+
+    def snapshot(self):
+        """
+        Copia de todas las entradas (ruta relativa -> huella).
+        """
+        with self._lock:
+            return dict(self._entries)
+
+    def remove(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.store is not None:
+            self.store.delete(key)
+
+    def rename(self, old_key, new_key):
+        with self._lock:
+            entry = self._entries.pop(old_key, None)
+            if entry is not None:
+                self._entries[new_key] = entry
+        if self.store is not None:
+            self.store.rename(old_key, new_key)
+
+    @staticmethod
+    def _hash_file(src_path):
+        return hash_file(src_path)
+
+class MultipartUploader:
+    """
+    Subida por partes de archivos grandes mediante la API REST del portal:
+    addItem (o update) con multipart=true, un addPart por cada parte y commit.
+    Las partes se suben en paralelo y, con un almacén de estado (StateStore), cada
+    parte confirmada se guarda en él, de modo que si el monitor se reinicia la
+    subida continúa desde ahí. Cada petición (no la subida entera) pasa por el
+    regulador: las partes simultáneas cuentan como peticiones en curso y la espera
+    entre consultas del estado del commit no ocupa ninguna plaza.
+    """
+    def __init__(self, gis, username, store=None, part_size=50 * 1024 * 1024, part_workers=4,
+                 commit_timeout=3600, governor=None):
+        self.gis = gis
+        self.username = username
+        self.store = store
+        self.governor = governor if governor is not None else RequestGovernor()
+        self.part_size = part_size
+        self.part_workers = part_workers
+        self.commit_timeout = commit_timeout
+        self._sessions = store.upload_sessions() if store is not None else {}
+        self._lock = threading.Lock()
+
+    def pending_keys(self):
+        """
+        Claves (rutas relativas) de las subidas que quedaron a medias.
+        """
+        with self._lock:
+            return list(self._sessions)
+
+    def upload(self, key, src_path, item_properties, folder_id=None, item_id=None):
+        """
+        Sube `src_path` por partes. Si `item_id` se indica, reemplaza los datos de ese
+        elemento; si no, crea uno nuevo en la carpeta `folder_id`. Devuelve el id del elemento.
+        """
+        file_path = Path(src_path)
+        stat = file_path.stat()
+        session = self._resume_session(key, stat, item_id)
+        if session is None:
+            session = {
+                'item_id': self._start(file_path.name, item_properties, folder_id, item_id),
+                'mode': 'update' if item_id else 'add',
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'part_size': self.part_size,
+                'parts_done': [],
+            }
+            self._save_session(key, session)
+        else:
+            logger.info(f"  [REANUDANDO] {file_path.name}: {len(session['parts_done'])} partes ya subidas")
+
+        num_parts = max(1, math.ceil(session['size'] / session['part_size']))
+        missing = [part for part in range(1, num_parts + 1) if part not in session['parts_done']]
+        with ThreadPoolExecutor(max_workers=self.part_workers, thread_name_prefix='gisbox-part') as executor:
+            # list() propaga el primer error; las partes ya confirmadas quedan guardadas
+            list(executor.map(lambda part: self._upload_part(key, session, file_path, part), missing))
+
+        self._commit(session['item_id'], item_properties)
+        self._drop_session(key)
+        return session['item_id']
+
+    def _resume_session(self, key, stat, item_id):
+        """
+        Devuelve la sesión guardada para `key` si sigue siendo válida para el archivo
+        actual; si el archivo ha cambiado, la descarta.
+        """
+        with self._lock:
+            session = self._sessions.get(key)
+        if session is None:
+            return None
+        if (session['size'] == stat.st_size and session['mtime_ns'] == stat.st_mtime_ns
+                and session['part_size'] == self.part_size
+                and (session['mode'] == 'add' or session['item_id'] == item_id)):
+            return session
+        if session['mode'] == 'add':
+            # El elemento parcial creado por addItem nunca llegó a completarse
+            try:
+                self._post(f"items/{session['item_id']}/delete", {})
+            except Exception as e:
+                logger.warning(f"No se pudo eliminar el elemento parcial {session['item_id']}: {e}")
+        self._drop_session(key)
+        return None
+
+    def _start(self, filename, item_properties, folder_id, item_id):
+        if item_id:
+            self._post(f"items/{item_id}/update", {'multipart': True, 'filename': filename})
+            return item_id
+        path = f"{folder_id}/addItem" if folder_id else "addItem"
+        result = self._post(path, dict(item_properties, multipart=True, filename=filename), idempotent=False)
+        return result['id']
+
+    def _upload_part(self, key, session, file_path, part_num):
+        with open(file_path, 'rb') as f:
+            f.seek((part_num - 1) * session['part_size'])
+            data = f.read(session['part_size'])
+        url = f"{self._base_url()}items/{session['item_id']}/addPart"
+
+        def add_part():
+            # Un BytesIO nuevo en cada intento: el anterior ya se leyó
+            return self.gis._con.post_multipart(path=url, params={'f': 'json', 'partNum': part_num},
+                                                files=[('file', io.BytesIO(data), file_path.name)])
+        result = self.governor.call(add_part, timed=False)
+        if not result.get('success'):
+            raise Exception(f"addPart {part_num} rechazado: {result}")
+        with self._lock:
+            session['parts_done'].append(part_num)
+        self._save_session(key, session)
+
+    def _commit(self, item_id, item_properties):
+        params = dict(item_properties, id=item_id)
+        params['async'] = True
+        self._post(f"items/{item_id}/commit", params, idempotent=False)
+        deadline = time.monotonic() + self.commit_timeout
+        while True:
+            status = self._post(f"items/{item_id}/status", {}).get('status')
+            if status == 'completed':
+                return
+            if status is None or 'fail' in status or time.monotonic() > deadline:
+                raise Exception(f"commit de {item_id} no completado (estado: {status})")
+            time.sleep(1)
+
+    def _base_url(self):
+        return f"{self.gis._portal.resturl}content/users/{self.username}/"
+
+    def _post(self, path, params, idempotent=True):
+        result = self.governor.call(self.gis._con.post, self._base_url() + path, dict(params, f='json'),
+                                    idempotent=idempotent)
+        if 'error' in result or result.get('success') is False:
+            raise Exception(f"{path}: {result}")
+        return result
+
+    def _save_session(self, key, session):
+        # Bajo el bloqueo: otra parte no puede guardar una lista de partes más antigua después
+        with self._lock:
+            self._sessions[key] = session
+            if self.store is not None:
+                self.store.save_upload_session(key, session)
+
+    def _drop_session(self, key):
+        with self._lock:
+            self._sessions.pop(key, None)
+            if self.store is not None:
+                self.store.drop_upload_session(key)
+
+def _is_missing_item_error(error):
+    # Un elemento que ya no existe en ArcGIS cuenta como eliminado
+    return bool(error) and 'does not exist' in str(error.get('message', '') if isinstance(error, dict) else error)
+
 class UploadHandler(FileSystemEventHandler):
     """
-    Maneja los eventos del sistema de archivos (creación, modificación, eliminación)
-    para sincronizar los cambios con ArcGIS Online/Enterprise.
+    Maneja los eventos del sistema de archivos (creación, modificación, eliminación
+    y movimiento) para sincronizar los cambios con ArcGIS Online/Enterprise.
     """
-    def __init__(self, gis, local_sync_dir):
+    def __init__(self, gis, local_sync_dir, upload_queue=None, debounce_seconds=0, index=None,
+                 fingerprints=None, multipart=None, multipart_threshold=100 * 1024 * 1024, move_window=0,
+                 governor=None, retry_attempts=5, state=None, delete_window=0, delete_batch_size=100,
+                 create_window=0, create_batch_size=500, create_workers=4, metrics=None, profiler=None):
         self.gis = gis
         self.local_sync_dir = Path(local_sync_dir)
         self.user = self.gis.users.me
+        # Ruta relativa -> id de elemento; evita buscar en el portal en cada evento
+        self.index = index if index is not None else ItemIndex()
+        # Huellas del contenido ya sincronizado; evita subir archivos sin cambios reales
+        self.fingerprints = fingerprints if fingerprints is not None else FingerprintCache()
+        # Los archivos de al menos `multipart_threshold` bytes se suben por partes
+        self.multipart = multipart
+        self.multipart_threshold = multipart_threshold
+        # Almacén de estado compartido con sync_down: registra sus propias escrituras
+        # para no subir de vuelta lo que acaba de descargar (ecos)
+        self.state = state
+        self._folder_ids = None
+        self._folder_lock = threading.Lock()
+        # Cada petición al portal pasa por el regulador; las operaciones que fallan se
+        # reintentan más tarde (ver `retry_due`) en lugar de perderse
+        self.governor = governor if governor is not None else RequestGovernor()
+        # Rutas cuya creación falló sin saber si llegó a aplicarse (ver `_find_created_item`)
+        self._uncertain_creates = set()
+        self.retry_queue = RetryQueue(self.governor, max_attempts=retry_attempts)
+        # Contadores, bytes y latencias por operación (ver gisbox_metrics.py)
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        # Intervalos de tiempo por operación y elemento (ver gisbox_profile.py)
+        self.profiler = profiler if profiler is not None else NULL_PROFILER
+        # Si hay cola, los callbacks solo encolan el trabajo; si no, se ejecuta en el acto
+        self.upload_queue = upload_queue
+        # Si hay ventana de espera, los eventos de cada ruta se agrupan antes de sincronizar;
+        # con `move_window`, una eliminación y una creación con el mismo contenido son un movimiento
+        self.debouncer = None
+        if debounce_seconds:
+            self.debouncer = EventDebouncer(self._dispatch_action, debounce_seconds, move_window=move_window,
+                                            find_moved_from=self._find_moved_from if move_window else None)
+        # Si hay ventana de eliminación, los archivos borrados se eliminan en ArcGIS por
+        # lotes (una petición deleteItems por lote) en lugar de uno a uno
+        self.tombstones = None
+        if delete_window:
+            self.tombstones = TombstoneQueue(self._flush_tombstones, delete_window, max_batch=delete_batch_size)
+        # Si hay ventana de creación, los archivos nuevos se suben por lotes: carpetas
+        # resueltas una vez por lote y subidas concurrentes, primero las más pequeñas
+        self.batcher = None
+        if create_window:
+            self.batcher = UploadBatcher(self._prepare_batch, self._upload_new_file,
+                                         on_complete=self._dispatch_action, window=create_window,
+                                         max_batch=create_batch_size, num_workers=create_workers)
         logger.info(f"Monitorizando cambios en: {self.local_sync_dir}")
 
+    def _submit(self, action, src_path, moved_from=None):
+        """
+        Punto de entrada de los eventos: pasa por el agrupador si está activo.
+        """
+        if self._is_internal_path(src_path):
+            return
+        self.metrics.count('events', action=action)
+        if self.debouncer is not None:
+            self.debouncer.push(action, src_path, moved_from=moved_from)
+        else:
+            self._dispatch_action(action, src_path, moved_from)
+
+    def _dispatch_action(self, action, src_path, moved_from=None):
+        if self.batcher is not None and self._batch_action(action, src_path, moved_from):
+            return
+        if action == 'move':
+            # Se encola por la ruta de origen, detrás de las operaciones previas sobre ella
+            self._dispatch(self._move_item, moved_from, src_path)
+        else:
+            func = self._upload_file if action == 'upload' else self._delete_item
+            self._dispatch(func, src_path)
+
+    def _batch_action(self, action, src_path, moved_from=None):
+        """
+        Pasa al agrupador de creaciones los archivos nuevos y los eventos de las rutas
+        que retiene. Devuelve True si el evento quedó en sus manos.
+        """
+        if action == 'move':
+            if not self.batcher.absorb('delete', moved_from):
+                return False
+            # El origen aún no estaba en ArcGIS (o se está subiendo y se eliminará
+            # después): el destino es un archivo nuevo
+            action = 'upload'
+        if not self.batcher.absorb(action, src_path):
+            if action != 'upload' or self.index.get(self._index_key(src_path)):
+                return False
+            self.batcher.hold(src_path)
+        self.retry_queue.discard(str(src_path))
+        return True
+
+    def _dispatch(self, func, src_path, *args):
+        """
+        Ejecuta (o encola, si hay cola de subidas) una operación sobre `src_path`.
+        Una operación nueva sustituye al reintento pendiente de la misma ruta.
+        """
+        self.retry_queue.discard(str(src_path))
+        self._enqueue(func, src_path, *args)
+
+    def _enqueue(self, func, src_path, *args):
+        if self.upload_queue is not None:
+            self.upload_queue.put(src_path, self._run, func, src_path, *args)
+        else:
+            self._run(func, src_path, *args)
+
+    def _run(self, func, src_path, *args):
+        """
+        Ejecuta una operación; cada una de sus peticiones pasa por el regulador. Si
+        falla, pasa a la cola de reintentos.
+        """
+        try:
+            operation = getattr(func, '__name__', 'operation').lstrip('_')
+            with self.profiler.span(operation, path=self._relative_key(src_path)):
+                func(src_path, *args)
+        except Exception as e:
+            self._retry_later(e, func, src_path, *args)
+        else:
+            self.retry_queue.discard(str(src_path))
+
+    def _retry_later(self, error, func, src_path, *args):
+        logger.error(f"Error al sincronizar {src_path}: {error}")
+        if self.retry_queue.add(str(src_path), func, src_path, *args, error=error):
+            logger.info(f"  [REINTENTO] {Path(src_path).name} queda pendiente de reintento.")
+
+    def retry_due(self):
+        """
+        Vuelve a encolar las operaciones fallidas cuya espera ya terminó.
+        Devuelve cuántas se encolaron.
+        """
+        due = self.retry_queue.pop_due()
+        for _, func, args in due:
+            self._enqueue(func, *args)
+        return len(due)
+
     def _get_arcgis_folder(self, src_path):
         """
         Determina la carpeta de ArcGIS Online/Enterprise a partir de la ruta local.
@@ -38,11 +1031,68 @@ class UploadHandler(FileSystemEventHandler):
             return relative_path.parts[0]
         return None # Carpeta raíz
 
+    def _get_folder_id(self, folder_name):
+        """
+        Devuelve el id de una carpeta de ArcGIS del usuario, creándola si no existe.
+        """
+        if not folder_name:
+            return None
+        with self._folder_lock:
+            if self._folder_ids is None:
+                folders = self.governor.call(lambda: self.user.folders)
+                self._folder_ids = {folder['title']: folder['id'] for folder in folders}
+            if folder_name not in self._folder_ids:
+                try:
+                    folder = self.governor.call(self.gis.content.create_folder, folder_name, idempotent=False)
+                except Exception:
+                    # La carpeta pudo crearse igualmente: se vuelve a listar en el siguiente intento
+                    self._folder_ids = None
+                    raise
+                self._folder_ids[folder_name] = folder['id']
+            return self._folder_ids[folder_name]
+
+    def _is_internal_path(self, src_path):
+        """
+        Indica si la ruta pertenece al estado interno de GISBox (no se sincroniza).
+        """
+        try:
+            parts = Path(src_path).relative_to(self.local_sync_dir).parts
+        except ValueError:
+            return False
+        return any(part.startswith(STATE_DIR_NAME) for part in parts)
+
+    def _relative_key(self, src_path):
+        """
+        Ruta relativa (con extensión) usada como clave de la caché de huellas.
+        """
+        return Path(src_path).relative_to(self.local_sync_dir).as_posix()
+
+    def _index_key(self, src_path):
+        """
+        Clave del índice local para una ruta: carpeta de ArcGIS y nombre del archivo.
+        """
+        return ItemIndex.key_for_path(self._relative_key(src_path))
+
+    def _get_indexed_item(self, key):
+        """
+        Obtiene directamente (sin búsqueda) el elemento indexado con `key`, o None.
+        """
+        item_id = self.index.get(key)
+        if not item_id:
+            return None
+        item = self.governor.call(self.gis.content.get, item_id)
+        if item is None:
+            # El elemento se eliminó en ArcGIS: la entrada ya no es válida
+            self.index.pop(key)
+        return item
+
     def _upload_file(self, src_path):
         """
         Sube o actualiza un archivo a ArcGIS Online/Enterprise.
         """
         file_path = Path(src_path)
+        if self._cancel_tombstone(src_path, self._upload_file, src_path):
+            return
         if file_path.is_file():
             folder_name = self._get_arcgis_folder(src_path)
             
@@ -53,68 +1103,420 @@ class UploadHandler(FileSystemEventHandler):
                 'type': 'File' # Tipo genérico, la API lo inferirá
             }
             
-            # Buscar si el elemento ya existe
-            search_query = f'title:"{file_path.stem}" AND owner:{self.user.username}'
-            if folder_name:
-                search_query += f' AND folder:{folder_name}'
-                
-            existing_items = self.gis.content.search(query=search_query, max_items=1)
+            key = self._index_key(src_path)
+            fingerprint_key = self._relative_key(src_path)
+            with self.metrics.time('hash'), self.profiler.span('hash', path=fingerprint_key):
+                fingerprint = self.fingerprints.compute(fingerprint_key, src_path)
+            echo = self._consume_echo(fingerprint_key, fingerprint['sha256'])
+            if echo is not None:
+                # Archivo escrito por sync_down: ArcGIS ya tiene este contenido. La fila
+                # del almacén ya la escribió sync_down, solo se actualiza la memoria
+                logger.debug(f"  [ECO] {file_path.name}")
+                if echo['item_id']:
+                    self.index.set(key, echo['item_id'])
+                self.fingerprints.record(fingerprint_key, fingerprint, persist=False)
+                self.metrics.count('uploads', result='echo')
+                return
+            if self.index.get(key) and self.fingerprints.is_unchanged(fingerprint_key, fingerprint):
+                # Mismo contenido que lo ya sincronizado (touch, antivirus, guardado sin cambios)
+                logger.debug(f"  [SIN CAMBIOS] {file_path.name}")
+                self.fingerprints.record(fingerprint_key, fingerprint)
+                self.metrics.count('uploads', result='unchanged')
+                return
+
+            item = self._get_indexed_item(key)
+            if item is None and fingerprint_key in self._uncertain_creates:
+                # Una creación anterior falló sin respuesta: se busca antes de crear otro elemento
+                item = self._find_created_item(folder_name, file_path)
+                if item is not None:
+                    self.index.set(key, item.id)
+            multipart = self.multipart is not None and fingerprint['size'] >= self.multipart_threshold
             
-            if existing_items:
+            if item is not None:
                 # Actualizar elemento existente
-                item = existing_items[0]
                 logger.info(f"  [ACTUALIZANDO] {item.title}...")
-                item.update(item_properties=item_properties, data=src_path)
+                with self.metrics.time('update'), self.profiler.span('update', item, multipart=multipart):
+                    if multipart:
+                        self.multipart.upload(fingerprint_key, src_path, item_properties, item_id=item.id)
+                        # La subida por partes no actualiza `item`: se vuelve a leer para
+                        # guardar la fecha de modificación posterior a la subida
+                        item = self.governor.call(self.gis.content.get, item.id)
+                    else:
+                        self.governor.call(item.update, item_properties=item_properties, data=src_path, timed=False)
+                self.metrics.count('uploads', result='updated')
                 logger.info(f"  [ACTUALIZADO] {item.title} en ArcGIS.")
             else:
                 # Añadir nuevo elemento
                 logger.info(f"  [SUBIENDO] Nuevo archivo: {file_path.name}...")
-                item = self.gis.content.add(item_properties=item_properties, data=src_path, folder=folder_name)
+                with self.metrics.time('create'), self.profiler.span('create', multipart=multipart) as span:
+                    try:
+                        if multipart:
+                            item_id = self.multipart.upload(fingerprint_key, src_path, item_properties,
+                                                            folder_id=self._get_folder_id(folder_name))
+                            item = self.governor.call(self.gis.content.get, item_id)
+                        elif self.batcher is not None:
+                            # La carpeta ya se resolvió para todo el lote: addItem directo a su id
+                            item = self._add_item(item_properties, src_path, self._get_folder_id(folder_name))
+                        else:
+                            item = self.governor.call(self.gis.content.add, item_properties=item_properties,
+                                                      data=src_path, folder=folder_name, timed=False,
+                                                      idempotent=False)
+                    except Exception:
+                        self._uncertain_creates.add(fingerprint_key)
+                        raise
+                    span.item(item)
+                self.metrics.count('uploads', result='created')
+                self.index.set(key, item.id)
                 logger.info(f"  [SUBIDO] {item.title} a ArcGIS.")
+            self._uncertain_creates.discard(fingerprint_key)
+            self.metrics.add_bytes('upload', fingerprint['size'])
+            self.fingerprints.record(fingerprint_key, fingerprint, item_id=item.id, folder=folder_name,
+                                     title=item.title, item_type=item.type,
+                                     remote_modified=_item_modified(item), sync_status='uploaded')
+
+    def _add_item(self, item_properties, src_path, folder_id=None):
+        """
+        Crea un elemento con una petición addItem a la carpeta `folder_id` (`content.add`
+        resuelve además la carpeta con otra petición en cada llamada) y lee el elemento
+        creado directamente (content/items/<id>), no del índice de búsqueda, que puede
+        tardar en incluirlo: su fecha de modificación y su tipo real quedan en el estado.
+        """
+        load_arcgis()
+        file_path = Path(src_path)
+        url = f"{self.gis._portal.resturl}content/users/{self.user.username}/"
+        url += f"{folder_id}/addItem" if folder_id else "addItem"
+        with open(file_path, 'rb') as f:
+            result = self.governor.call(self.gis._con.post_multipart, url, dict(item_properties),
+                                        files={'file': (file_path.name, f, 'application/octet-stream')},
+                                        timed=False, idempotent=False)
+        if not result.get('success'):
+            raise Exception(f"addItem: {result}")
+        item_dict = self.governor.call(self.gis._con.get, f"{self.gis._portal.resturl}content/items/{result['id']}",
+                                       {'f': 'json'})
+        return Item(self.gis, result['id'], item_dict)
+
+    def _find_created_item(self, folder_name, file_path):
+        """
+        Busca en la carpeta de ArcGIS el elemento de `file_path` (mismo título y nombre
+        de archivo) que pudo crear una petición anterior cuya respuesta no llegó. Las
+        creaciones no se reintentan a ciegas: se duplicaría el elemento.
+        """
+        folder_id = self._get_folder_id(folder_name)
+        for item in iter_user_items(self.gis, self.user.username, folder_id, governor=self.governor):
+            if item.title == file_path.stem and getattr(item, 'name', None) == file_path.name:
+                logger.info(f"  [ENCONTRADO] {file_path.name} ya se había creado en ArcGIS.")
+                return item
+        return None
+
+    def _prepare_batch(self, paths):
+        """
+        Resuelve (y crea si faltan) una sola vez las carpetas de un lote de archivos nuevos.
+        """
+        folder_names = {self._get_arcgis_folder(src_path) for src_path in paths} - {None}
+        logger.info(f"  [LOTE] {len(paths)} archivos nuevos en {len(folder_names)} carpetas")
+        for folder_name in sorted(folder_names):
+            self._get_folder_id(folder_name)
+
+    def _upload_new_file(self, src_path):
+        """
+        Sube un archivo nuevo de un lote; si falla, pasa a la cola de reintentos.
+        """
+        self._run(self._upload_file, src_path)
 
     def _delete_item(self, src_path):
         """
-        Elimina un elemento de ArcGIS Online/Enterprise.
+        Elimina de ArcGIS el elemento de un archivo borrado. El archivo ya no existe:
+        el id se obtiene del índice local, sin consultar el portal. Con cola de
+        lápidas, la eliminación se agrupa con las de otros archivos.
         """
         file_path = Path(src_path)
-        if not file_path.is_file():
-            # Solo manejamos archivos, no carpetas
+        if self._consume_echo(self._relative_key(src_path)) is not None:
+            # Borrado hecho por sync_down (elemento eliminado o renombrado en ArcGIS)
+            logger.debug(f"  [ECO] {file_path.name}")
+            self.index.pop(self._index_key(src_path))
+            self.fingerprints.remove(self._relative_key(src_path))
             return
-            
-        folder_name = self._get_arcgis_folder(src_path)
-        
-        # Buscar el elemento a eliminar
-        search_query = f'title:"{file_path.stem}" AND owner:{self.user.username}'
-        if folder_name:
-            search_query += f' AND folder:{folder_name}'
-            
-        existing_items = self.gis.content.search(query=search_query, max_items=1)
-        
-        if existing_items:
-            item = existing_items[0]
+
+        item_id = self.index.get(self._index_key(src_path))
+        if not item_id:
+            # Carpeta o archivo que nunca se sincronizó: no hay nada que eliminar
+            return
+        if self.tombstones is not None:
+            self.tombstones.add(str(src_path), item_id)
+            return
+        failed = self._delete_items([(str(src_path), item_id)])
+        if failed:
+            raise Exception(failed[0][2])
+
+    def _delete_items(self, tombstones):
+        """
+        Elimina varios elementos con una sola petición (content/users/<usuario>/deleteItems)
+        e informa del resultado de cada archivo. Devuelve (ruta, id, error) de los que
+        no se pudieron eliminar; si falla la petición entera, lanza la excepción.
+        """
+        url = f"{self.gis._portal.resturl}content/users/{self.user.username}/deleteItems"
+        if len(tombstones) > 1:
+            logger.info(f"  [ELIMINANDO] {len(tombstones)} elementos de ArcGIS...")
+        else:
+            logger.info(f"  [ELIMINANDO] {Path(tombstones[0][0]).stem} de ArcGIS...")
+        with self.metrics.time('delete'), self.profiler.span('delete_batch', items=len(tombstones)):
+            # Se puede reintentar: un elemento que ya no existe cuenta como eliminado
+            response = self.governor.call(self.gis._con.post, url,
+                                          {'f': 'json', 'items': ','.join(item_id for _, item_id in tombstones)})
+        results = {result.get('itemId'): result for result in response.get('results', [])}
+
+        failed = []
+        for src_path, item_id in tombstones:
+            result = results.get(item_id)
+            error = (result or {}).get('error')
+            if result is None or not (result.get('success') or _is_missing_item_error(error)):
+                failed.append((src_path, item_id, f"deleteItems: {error or 'sin resultado'}"))
+                self.metrics.count('deletes', result='failed')
+                continue
+            key = self._index_key(src_path)
+            if self.index.get(key) == item_id:
+                self.index.pop(key)
+            self.fingerprints.remove(self._relative_key(src_path))
+            self.metrics.count('deletes', result='deleted')
+            logger.info(f"  [ELIMINADO] {Path(src_path).stem} de ArcGIS.")
+        return failed
+
+    def _flush_tombstones(self, tombstones):
+        """
+        Envía un lote de lápidas. Cada archivo que no se pudo eliminar pasa por separado
+        a la cola de reintentos.
+        """
+        try:
+            failed = self._delete_items(tombstones)
+        except Exception as e:
+            failed = [(src_path, item_id, e) for src_path, item_id in tombstones]
+        for src_path, _, error in failed:
+            self._retry_later(error, self._delete_item, src_path)
+
+    def _cancel_tombstone(self, src_path, func, *args):
+        """
+        El archivo ha vuelto a aparecer antes de enviar su eliminación: el elemento se
+        conserva (y la operación lo actualiza). Si la eliminación ya se está enviando,
+        devuelve True y `func(*args)` se vuelve a encolar cuando termine (sin esperar
+        aquí, que se ocupa una plaza del regulador).
+        """
+        if self.tombstones is None:
+            return False
+        status = self.tombstones.discard(str(src_path), followup=functools.partial(self._enqueue, func, *args))
+        if status == 'cancelled':
+            logger.debug(f"  [RESTAURADO] {Path(src_path).name}: se cancela su eliminación")
+        elif status == 'deferred':
+            logger.debug(f"  [EN ESPERA] {Path(src_path).name}: se sincronizará al terminar su eliminación")
+            return True
+        return False
+
+    def _move_item(self, src_path, dest_path):
+        """
+        Refleja en ArcGIS un movimiento o renombrado local sin volver a subir el archivo:
+        un cambio de carpeta de primer nivel se traduce en `item.move()` y un cambio de
+        nombre en una actualización del título.
+        """
+        if self._cancel_tombstone(dest_path, self._move_item, src_path, dest_path):
+            return
+        if self._consume_echo(self._relative_key(src_path)) is not None:
+            # sync_down sustituyó el archivo (renombrado en ArcGIS): solo cuenta el destino
+            self.index.pop(self._index_key(src_path))
+            self.fingerprints.remove(self._relative_key(src_path))
+            return self._upload_file(dest_path)
+        old_key, new_key = self._index_key(src_path), self._index_key(dest_path)
+        item = self._get_indexed_item(old_key)
+        if item is None:
+            # El origen no estaba sincronizado: es una subida normal
+            return self._upload_file(dest_path)
+        if self.index.get(new_key) not in (None, item.id):
+            # El destino sobrescribe otro archivo sincronizado: se elimina el elemento de
+            # origen y se actualiza el del destino
             logger.info(f"  [ELIMINANDO] {item.title} de ArcGIS...")
-            item.delete()
-            logger.info(f"  [ELIMINADO] {item.title} de ArcGIS.")
+            self.governor.call(item.delete)
+            self.index.pop(old_key)
+            self.fingerprints.remove(self._relative_key(src_path))
+            return self._upload_file(dest_path)
+
+        old_folder, new_folder = self._get_arcgis_folder(src_path), self._get_arcgis_folder(dest_path)
+        moved = new_folder != old_folder
+        if moved:
+            with self.metrics.time('move'), self.profiler.span('move', item, folder=new_folder):
+                folder = {'id': self._get_folder_id(new_folder)} if new_folder else '/'
+                self.governor.call(item.move, folder)
+            logger.info(f"  [MOVIDO] {item.title} a la carpeta {new_folder or '(raíz)'}.")
+        new_title = Path(dest_path).stem
+        retitled = new_title != Path(src_path).stem
+        if retitled:
+            old_title = item.title
+            with self.metrics.time('retitle'), self.profiler.span('retitle', item):
+                self.governor.call(item.update, item_properties={'title': new_title})
+            logger.info(f"  [RENOMBRADO] {old_title} a {new_title}.")
+        if moved or retitled:
+            # Se vuelve a leer para guardar la fecha de modificación posterior al cambio:
+            # si no, sync_down vería el elemento modificado y volvería a descargarlo
+            item = self.governor.call(self.gis.content.get, item.id) or item
+
+        self.index.pop(old_key)
+        self.index.set(new_key, item.id)
+        fingerprint_key = self._relative_key(dest_path)
+        self.fingerprints.rename(self._relative_key(src_path), fingerprint_key)
+        fingerprint = self.fingerprints.get(fingerprint_key)
+        if fingerprint is not None:
+            self.fingerprints.record(fingerprint_key, fingerprint, item_id=item.id, folder=new_folder,
+                                     title=item.title, item_type=item.type, remote_modified=_item_modified(item))
+        # Solo se transfieren datos si además cambió el contenido
+        self._upload_file(dest_path)
+
+    def _consume_echo(self, relative_path, content_hash=None):
+        """
+        Devuelve la escritura propia registrada por sync_down que coincide con el
+        evento (y la retira), o None si el cambio es del usuario.
+        """
+        if self.state is None:
+            return None
+        return self.state.consume_write(relative_path, content_hash)
+
+    def _find_moved_from(self, new_path, deleted_paths):
+        """
+        Busca entre `deleted_paths` un archivo sincronizado con el mismo contenido que
+        `new_path` (mismo tamaño y hash). Devuelve su ruta o None.
+        """
+        if self.index.get(self._index_key(new_path)):
+            return None
+        try:
+            size = os.stat(new_path).st_size
+        except OSError:
+            return None
+        candidates = []
+        for deleted_path in deleted_paths:
+            fingerprint = self.fingerprints.get(self._relative_key(deleted_path))
+            if fingerprint and fingerprint['size'] == size and self.index.get(self._index_key(deleted_path)):
+                candidates.append((deleted_path, fingerprint['sha256']))
+        if not candidates:
+            return None
+        content_hash = self.fingerprints.compute(self._relative_key(new_path), new_path)['sha256']
+        for deleted_path, deleted_hash in candidates:
+            if deleted_hash == content_hash:
+                return deleted_path
+        return None
+
+    def reconcile(self):
+        """
+        Sincroniza los cambios hechos mientras el monitor estaba detenido: recorre
+        LOCAL_SYNC_DIR con os.scandir (solo stat, sin leer contenido) y lo compara con
+        el último estado guardado (huellas) y con el listado remoto (índice). Solo las
+        diferencias reales pasan por el flujo normal de subida y eliminación. Un archivo
+        sin cambios cuyo elemento ya no está en ArcGIS se eliminó en remoto: no se
+        vuelve a subir (lo resuelve sync_down).
+        """
+        started = time.monotonic()
+        known = self.fingerprints.snapshot()
+        root = str(self.local_sync_dir)
+        uploads = deletes = remote_deletes = scanned = 0
+
+        for relative_path, path, size, mtime_ns in self._scan(root):
+            scanned += 1
+            fingerprint = known.pop(relative_path, None)
+            unchanged = (fingerprint is not None and fingerprint['size'] == size
+                         and fingerprint['mtime_ns'] == mtime_ns)
+            if self.index.get(self._index_key(path)):
+                if unchanged:
+                    continue
+            elif fingerprint is not None and self._deleted_remotely(relative_path, path, fingerprint, unchanged):
+                remote_deletes += 1
+                continue
+            # Nuevo o modificado; la huella evita subir contenido idéntico
+            self._dispatch_action('upload', path)
+            uploads += 1
+
+        for relative_path in known:
+            # Sincronizado antes y ya no existe en disco: eliminar si sigue en ArcGIS
+            path = os.path.join(root, *relative_path.split('/'))
+            if self.index.get(self._index_key(path)):
+                self._dispatch_action('delete', path)
+                deletes += 1
+            else:
+                self.fingerprints.remove(relative_path)
+
+        logger.info(f"Reconciliación inicial: {scanned} archivos revisados, {uploads} subidas y "
+                    f"{deletes} eliminaciones pendientes ({time.monotonic() - started:.1f} s)")
+        if remote_deletes:
+            logger.info(f"  {remote_deletes} archivos sin cambios se eliminaron en ArcGIS: no se vuelven a subir")
+        return uploads, deletes
+
+    def _deleted_remotely(self, relative_path, path, fingerprint, unchanged):
+        """
+        Indica si un archivo no indexado ya estaba sincronizado con un elemento (su fila
+        del almacén tiene item_id) y conserva el contenido de entonces: el elemento se
+        eliminó en ArcGIS mientras el monitor estaba detenido. Solo se calcula el hash
+        si cambió el tamaño o la fecha.
+        """
+        row = self.state.get(relative_path) if self.state is not None else None
+        if row is None or not row['item_id']:
+            return False
+        if unchanged:
+            return True
+        return self.fingerprints.compute(relative_path, path)['sha256'] == fingerprint['sha256']
+
+    @staticmethod
+    def _scan(root):
+        """
+        Genera (ruta relativa, ruta, tamaño, mtime_ns) de cada archivo bajo `root`,
+        omitiendo el estado interno de GISBox.
+        """
+        prefix_length = len(root.rstrip(os.sep)) + 1
+        stack = [root]
+        while stack:
+            try:
+                entries = os.scandir(stack.pop())
+            except OSError as e:
+                logger.warning(f"No se pudo leer el directorio: {e}")
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.name.startswith(STATE_DIR_NAME):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        relative_path = entry.path[prefix_length:].replace(os.sep, '/')
+                        yield relative_path, entry.path, stat.st_size, stat.st_mtime_ns
 
     def on_created(self, event):
         if not event.is_directory:
-            self._upload_file(event.src_path)
+            self._submit('upload', event.src_path)
 
     def on_deleted(self, event):
         if not event.is_directory:
-            self._delete_item(event.src_path)
+            self._submit('delete', event.src_path)
 
     def on_modified(self, event):
         if not event.is_directory:
             # La modificación se maneja como una subida/actualización
-            self._upload_file(event.src_path)
+            self._submit('upload', event.src_path)
+
+    def on_moved(self, event):
+        if event.is_directory:
+            # watchdog emite también un evento por cada archivo del directorio movido
+            return
+        if self._is_internal_path(event.src_path):
+            # p. ej. un archivo parcial de GISBox renombrado a su nombre final
+            self._submit('upload', event.dest_path)
+        elif self._is_internal_path(event.dest_path):
+            self._submit('delete', event.src_path)
+        else:
+            self._submit('move', event.dest_path, moved_from=event.src_path)
 
 class GISBoxMonitor:
     """
     Monitoriza el directorio local en busca de cambios y los sincroniza
-    con ArcGIS Online/Enterprise.
+    con ArcGIS Online/Enterprise. `gis`, `governor`, `state` y `metrics` permiten
+    compartir la conexión, el regulador de peticiones, el almacén de estado y las
+    métricas con GISBoxSync (ver gisbox_daemon.py). Con `profiler` (ver
+    gisbox_profile.py), cada operación queda registrada en una traza.
     """
-    def __init__(self):
+    def __init__(self, gis=None, governor=None, state=None, metrics=None, profiler=None):
         # Cargar variables de entorno
         load_dotenv(Path(__file__).parent / ".env")
         
@@ -123,16 +1525,54 @@ class GISBoxMonitor:
         self.password = os.getenv("ARCGIS_PASSWORD")
         self.profile = os.getenv("ARCGIS_PROFILE")
         self.local_sync_dir = os.getenv("LOCAL_SYNC_DIR")
+        # Número de hilos que suben cambios a ArcGIS en segundo plano
+        self.upload_workers = int(os.getenv("UPLOAD_WORKERS") or 2)
+        # Segundos sin eventos antes de sincronizar un archivo (0 desactiva el agrupado)
+        self.debounce_seconds = float(os.getenv("DEBOUNCE_SECONDS") or 2)
+        # Subida por partes: tamaño mínimo de archivo, tamaño de parte y partes simultáneas
+        self.multipart_threshold_mb = float(os.getenv("MULTIPART_THRESHOLD_MB") or 100)
+        self.multipart_part_size_mb = float(os.getenv("MULTIPART_PART_SIZE_MB") or 50)
+        self.multipart_workers = int(os.getenv("MULTIPART_WORKERS") or 4)
+        # Segundos durante los que una eliminación puede emparejarse con una creación
+        # del mismo contenido para tratarlas como un movimiento (0 lo desactiva)
+        self.move_window = float(os.getenv("MOVE_WINDOW_SECONDS") or 5)
+        # Intentos de una operación fallida antes de descartarla
+        self.retry_attempts = int(os.getenv("RETRY_ATTEMPTS") or 3)
+        # Eliminaciones remotas por lotes: segundos que se acumulan y tamaño máximo del lote
+        self.delete_window = float(os.getenv("DELETE_BATCH_SECONDS") or 1)
+        self.delete_batch_size = int(os.getenv("DELETE_BATCH_SIZE") or 100)
+        # Creaciones por lotes: segundos que se acumulan (0 lo desactiva), tamaño máximo
+        # del lote e hilos que suben sus archivos
+        self.create_window = float(os.getenv("CREATE_BATCH_SECONDS") or 1)
+        self.create_batch_size = int(os.getenv("CREATE_BATCH_SIZE") or 500)
+        self.create_workers = int(os.getenv("CREATE_WORKERS") or 4)
         
         if not self.local_sync_dir:
             raise ValueError("LOCAL_SYNC_DIR no está configurado en el archivo .env")
+        if self.upload_workers < 1:
+            raise ValueError("UPLOAD_WORKERS debe ser un entero mayor que 0")
+        if self.delete_batch_size < 1:
+            raise ValueError("DELETE_BATCH_SIZE debe ser un entero mayor que 0")
+        if self.create_batch_size < 1:
+            raise ValueError("CREATE_BATCH_SIZE debe ser un entero mayor que 0")
+        if self.create_workers < 1:
+            raise ValueError("CREATE_WORKERS debe ser un entero mayor que 0")
 
-        self.gis = self._connect_to_arcgis()
+        self.governor = governor if governor is not None else RequestGovernor.from_env()
+        # Si las métricas vienen de fuera, quien las creó expone su servidor HTTP
+        self._owns_metrics = metrics is None
+        self.metrics = metrics if metrics is not None else Metrics.from_env()
+        self.metrics_server = None
+        self.profiler = profiler if profiler is not None else NULL_PROFILER
+        self.state = state
+        self._owns_state = False
+        self.gis = gis if gis is not None else self._connect_to_arcgis()
         
     def _connect_to_arcgis(self):
         """
         Establece la conexión con la organización de ArcGIS.
         """
+        load_arcgis()
         if self.profile:
             gis = GIS(profile=self.profile)
         elif self.username and self.password:
@@ -143,24 +1583,109 @@ class GISBoxMonitor:
         logger.info(f'Conectado exitosamente a la organización: [{gis.properties.name}]')
         return gis
 
+    def start(self):
+        """
+        Pone en marcha la monitorización sin bloquear: índice local, cola de subidas,
+        observador y reconciliación de los cambios hechos mientras estaba detenido.
+        """
+        owns_state = self.state is None
+        state = self.state if not owns_state else StateStore.for_sync_dir(self.local_sync_dir)
+        self._owns_state = owns_state
+        self.state = state
+        index = ItemIndex()
+        index.build(self.gis, self.gis.users.me, governor=self.governor, state=state)
+        self.fingerprints = FingerprintCache(state).load()
+        multipart = MultipartUploader(self.gis, self.gis.users.me.username, state,
+                                      part_size=int(self.multipart_part_size_mb * 1024 * 1024),
+                                      part_workers=self.multipart_workers, governor=self.governor)
+        self.upload_queue = UploadQueue(self.upload_workers)
+        self.upload_queue.start()
+        self.event_handler = UploadHandler(self.gis, self.local_sync_dir, upload_queue=self.upload_queue,
+                                           debounce_seconds=self.debounce_seconds, index=index,
+                                           fingerprints=self.fingerprints, multipart=multipart,
+                                           multipart_threshold=int(self.multipart_threshold_mb * 1024 * 1024),
+                                           move_window=self.move_window, governor=self.governor,
+                                           retry_attempts=self.retry_attempts, state=state,
+                                           delete_window=self.delete_window,
+                                           delete_batch_size=self.delete_batch_size,
+                                           create_window=self.create_window,
+                                           create_batch_size=self.create_batch_size,
+                                           create_workers=self.create_workers, metrics=self.metrics,
+                                           profiler=self.profiler)
+        self.metrics.gauge('upload_queue_depth', self.upload_queue.pending)
+        self.metrics.gauge('retry_queue_depth', lambda: len(self.event_handler.retry_queue))
+        if self.event_handler.tombstones is not None:
+            self.metrics.gauge('pending_deletes', lambda: len(self.event_handler.tombstones))
+        if self.event_handler.batcher is not None:
+            self.metrics.gauge('pending_creates', self.event_handler.batcher.pending)
+        if self._owns_metrics:
+            self.metrics_server = start_metrics_server(self.metrics)
+        if self.event_handler.debouncer is not None:
+            self.event_handler.debouncer.start()
+        if self.event_handler.tombstones is not None:
+            self.event_handler.tombstones.start()
+        if self.event_handler.batcher is not None:
+            self.event_handler.batcher.start()
+        self.observer = Observer()
+        self.observer.schedule(self.event_handler, self.local_sync_dir, recursive=True)
+        self.observer.start()
+        # Con el observador ya en marcha, recuperar lo que cambió mientras estaba detenido
+        # (incluidas las subidas por partes que quedaron a medias, que se reanudan)
+        self.event_handler.reconcile()
+
+    def tick(self):
+        """
+        Tareas periódicas (cada segundo): reintentos pendientes y guardado del estado.
+        """
+        self.event_handler.retry_due()
+        self.fingerprints.save()
+
+    def stop(self):
+        """
+        Detiene el observador y termina las subidas pendientes.
+        """
+        self.observer.stop()
+        self.observer.join()
+        if self.event_handler.debouncer is not None:
+            self.event_handler.debouncer.stop()
+        if self.event_handler.batcher is not None:
+            # Las creaciones retenidas se suben antes de parar la cola (sus eventos
+            # posteriores se encolan en ella)
+            self.event_handler.batcher.stop()
+        if self.event_handler.tombstones is not None:
+            # Las eliminaciones que dejó la cola se envían con la cola aún en marcha:
+            # las operaciones que esperaban a su lote se encolan en ella
+            self.upload_queue.join()
+            self.event_handler.tombstones.stop()
+        self.upload_queue.stop()
+        if len(self.event_handler.retry_queue):
+            logger.warning(f"{len(self.event_handler.retry_queue)} operaciones pendientes de reintento: "
+                           f"se recuperarán en la reconciliación del próximo arranque")
+        if self._owns_state:
+            self.state.close()
+            self.state = None
+        else:
+            self.fingerprints.save()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+        logger.info("GISBox Monitor detenido.")
+
     def start_monitoring(self):
         """
         Inicia el observador de archivos.
         """
-        event_handler = UploadHandler(self.gis, self.local_sync_dir)
-        observer = Observer()
-        observer.schedule(event_handler, self.local_sync_dir, recursive=True)
-        observer.start()
-        
+        self.start()
         logger.info("GISBox Monitor iniciado. Presiona CTRL+C para detener.")
         
         try:
             while True:
                 time.sleep(1)
+                self.tick()
         except KeyboardInterrupt:
-            observer.stop()
-        observer.join()
-        logger.info("GISBox Monitor detenido.")
+            pass
+        # Terminar las subidas pendientes antes de salir
+        self.stop()
 
 if __name__ == "__main__":
     try:
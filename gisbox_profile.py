@@ -0,0 +1,198 @@
+import os
+import sys
+import json
+import time
+import pstats
+import logging
+import cProfile
+import threading
+from pathlib import Path
+
+# Configuración de Logging
+logger = logging.getLogger('GISBoxProfile')
+logger.setLevel(logging.INFO)
+# Configuración del handler (para que solo se configure una vez)
+if not logger.handlers:
+    ch = logging.StreamHandler()
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+
+# Desde Python 3.12 cProfile usa sys.monitoring: un solo perfilador ve todos los
+# hilos y no se puede activar otro a la vez. Antes, cada hilo necesita el suyo.
+PROFILER_SEES_ALL_THREADS = sys.version_info >= (3, 12)
+
+class _Span:
+    """
+    Intervalo de tiempo de una fase: mide el tiempo de reloj y el de CPU del hilo
+    que lo abre y lo registra en el Profiler al cerrarse.
+    """
+    __slots__ = ('profiler', 'name', 'args', 'started', 'cpu_started')
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def item(self, item):
+        """
+        Asocia el intervalo a un elemento de ArcGIS (id y tipo).
+        """
+        self.args['item_id'] = item.id
+        self.args['item_type'] = item.type
+        return self
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.cpu_started = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        ended = time.perf_counter()
+        cpu = time.thread_time() - self.cpu_started
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.profiler._record(self.name, self.started, ended, cpu, self.args)
+        return False
+
+class Profiler:
+    """
+    Registra intervalos por fase (listado, descarga, renombrado, empaquetado,
+    subida...) con su tiempo de reloj y de CPU, por elemento y por carpeta, y los
+    escribe como traza JSON de Chrome (chrome://tracing, Perfetto, speedscope).
+    Con `cprofile_path`, la ejecución se perfila además con cProfile en todos los
+    hilos y las estadísticas se guardan en formato pstats.
+    """
+    enabled = True
+
+    def __init__(self, trace_path, cprofile_path=None):
+        self.trace_path = Path(trace_path)
+        self.cprofile_path = Path(cprofile_path) if cprofile_path else None
+        self._lock = threading.Lock()
+        self._events = []
+        self._threads = {}
+        self._origin = time.perf_counter()
+        self._profiles = []
+
+    def span(self, name, item=None, **args):
+        """
+        Context manager que mide la fase `name`. Con `item`, el intervalo queda
+        asociado a su id y su tipo; `args` añade otros datos (carpeta, ruta, ...).
+        """
+        span = _Span(self, name, args)
+        if item is not None:
+            span.item(item)
+        return span
+
+    def _record(self, name, started, ended, cpu, args):
+        thread = threading.current_thread()
+        event = {
+            'name': name,
+            'cat': 'gisbox',
+            'ph': 'X',
+            'ts': round((started - self._origin) * 1e6, 1),
+            'dur': round((ended - started) * 1e6, 1),
+            'pid': os.getpid(),
+            'tid': thread.ident,
+            'args': dict(args, cpu_ms=round(cpu * 1000, 3)),
+        }
+        with self._lock:
+            self._events.append(event)
+            self._threads.setdefault(thread.ident, thread.name)
+
+    def start(self):
+        """
+        Empieza a perfilar con cProfile (si se pidió) el hilo actual y los que se
+        creen a partir de ahora (pools de descarga, cola de subidas, ...).
+        """
+        if self.cprofile_path is None:
+            return self
+        profile = cProfile.Profile()
+        profile.enable()
+        self._profiles.append(profile)
+        if not PROFILER_SEES_ALL_THREADS:
+            threading.setprofile(self._profile_thread)
+        return self
+
+    def _profile_thread(self, frame, event, arg):
+        # Se ejecuta al arrancar cada hilo nuevo: lo sustituye un cProfile propio.
+        # Si otra herramienta de perfilado ya está activa, el hilo no se perfila
+        # (nunca debe impedir que arranque)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e:
+            sys.setprofile(None)
+            logger.warning(f"No se pudo perfilar el hilo {threading.current_thread().name}: {e}")
+            return
+        with self._lock:
+            self._profiles.append(profile)
+
+    def stop(self):
+        """
+        Deja de perfilar y escribe la traza (y las estadísticas de cProfile).
+        """
+        if self.cprofile_path is not None:
+            if not PROFILER_SEES_ALL_THREADS:
+                threading.setprofile(None)
+            for profile in self._profiles:
+                profile.disable()
+        self.write()
+
+    def write(self):
+        with self._lock:
+            events = list(self._events)
+            threads = dict(self._threads)
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': name}}
+                    for tid, name in threads.items()]
+        self.trace_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.trace_path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f)
+        logger.info(f"Traza de {len(events)} intervalos guardada en {self.trace_path}")
+
+        if self.cprofile_path is not None:
+            stats = None
+            for profile in self._profiles:
+                try:
+                    if stats is None:
+                        stats = pstats.Stats(profile)
+                    else:
+                        stats.add(profile)
+                except TypeError:
+                    # Hilo que no llegó a ejecutar código perfilado
+                    continue
+            if stats is not None:
+                stats.dump_stats(self.cprofile_path)
+                logger.info(f"Estadísticas de cProfile guardadas en {self.cprofile_path}")
+
+class _NullSpan:
+    __slots__ = ()
+
+    def item(self, item):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class NullProfiler:
+    """
+    Perfilado desactivado (valor por defecto): misma interfaz que Profiler, sin
+    hacer nada.
+    """
+    enabled = False
+
+    def span(self, name, item=None, **args):
+        return _NULL_SPAN
+
+    def start(self):
+        return self
+
+    def stop(self):
+        pass
+
+NULL_PROFILER = NullProfiler()
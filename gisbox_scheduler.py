@@ -0,0 +1,143 @@
+import os
+import logging
+from datetime import datetime
+from pathlib import Path
+from dotenv import load_dotenv
+from apscheduler.schedulers.blocking import BlockingScheduler
+from gisbox_metrics import start_metrics_server
+from gisbox_sync import GISBoxSync
+
+# Configuración de Logging
+logger = logging.getLogger('GISBoxScheduler')
+logger.setLevel(logging.INFO)
+# Configuración del handler (para que solo se configure una vez)
+if not logger.handlers:
+    ch = logging.StreamHandler()
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+
+# Identificador del trabajo de sincronización en APScheduler
+SYNC_JOB_ID = 'gisbox-sync'
+
+class AdaptiveInterval:
+    """
+    Intervalo entre sincronizaciones que se adapta a la actividad remota: se
+    reduce (`shrink`) cuando una ejecución encuentra al menos `busy_changes`
+    cambios y crece (`grow`) cuando no encuentra ninguno, siempre entre
+    `minimum` y `maximum` segundos.
+    """
+    def __init__(self, initial=300, minimum=60, maximum=3600, busy_changes=10, shrink=0.5, grow=1.5):
+        if not 0 < minimum <= maximum:
+            raise ValueError("El intervalo mínimo debe ser mayor que 0 y no superar al máximo")
+        if busy_changes < 1:
+            raise ValueError("SYNC_BUSY_CHANGES debe ser un entero mayor que 0")
+        self.minimum = minimum
+        self.maximum = maximum
+        self.busy_changes = busy_changes
+        self.shrink = shrink
+        self.grow = grow
+        self.seconds = min(max(initial, minimum), maximum)
+
+    @classmethod
+    def from_env(cls):
+        """
+        Crea el intervalo a partir de SYNC_INTERVAL_SECONDS (inicial),
+        SYNC_MIN_INTERVAL_SECONDS, SYNC_MAX_INTERVAL_SECONDS y SYNC_BUSY_CHANGES.
+        """
+        initial = float(os.getenv("SYNC_INTERVAL_SECONDS") or 300)
+        if initial <= 0:
+            raise ValueError("SYNC_INTERVAL_SECONDS debe ser mayor que 0")
+        return cls(initial=initial,
+                   minimum=float(os.getenv("SYNC_MIN_INTERVAL_SECONDS") or 60),
+                   maximum=float(os.getenv("SYNC_MAX_INTERVAL_SECONDS") or 3600),
+                   busy_changes=int(os.getenv("SYNC_BUSY_CHANGES") or 10))
+
+    def update(self, changes):
+        """
+        Ajusta el intervalo según los cambios encontrados en la última ejecución
+        y devuelve el nuevo valor en segundos.
+        """
+        if changes >= self.busy_changes:
+            self.seconds = max(self.minimum, self.seconds * self.shrink)
+        elif changes == 0:
+            self.seconds = min(self.maximum, self.seconds * self.grow)
+        return self.seconds
+
+class GISBoxScheduler:
+    """
+    Ejecuta sincronizaciones de descarga incrementales periódicas con APScheduler.
+    El intervalo se adapta a los cambios encontrados y nunca se solapan dos
+    ejecuciones.
+    """
+    def __init__(self, sync=None, scheduler=None):
+        # Cargar variables de entorno desde .env
+        load_dotenv(Path(__file__).parent / ".env")
+
+        self.interval = AdaptiveInterval.from_env()
+        self.sync = sync if sync is not None else GISBoxSync()
+        if self.sync.sync_mode == 'backup':
+            # Volver a descargarlo todo en cada ejecución no tiene sentido
+            logger.info("La sincronización programada usa el modo incremental (SYNC_MODE=backup no aplica)")
+            self.sync.sync_mode = 'incremental'
+        self.scheduler = scheduler if scheduler is not None else BlockingScheduler()
+        self.metrics_server = None
+
+    def start(self):
+        """
+        Programa la sincronización (la primera, de inmediato) y arranca el planificador.
+        Con BlockingScheduler, bloquea hasta que se detiene.
+        """
+        # max_instances=1: si una ejecución sigue en curso, la siguiente se omite
+        self.scheduler.add_job(self.run_once, 'interval', seconds=self.interval.seconds, id=SYNC_JOB_ID,
+                               next_run_time=datetime.now(), max_instances=1, coalesce=True,
+                               replace_existing=True)
+        logger.info(f"Sincronización programada cada {self.interval.seconds:g} s "
+                    f"(entre {self.interval.minimum:g} y {self.interval.maximum:g} s según la actividad)")
+        self.metrics_server = start_metrics_server(self.sync.metrics)
+        self.scheduler.start()
+
+    def run_once(self):
+        """
+        Ejecuta una sincronización y reprograma la siguiente con el intervalo
+        ajustado. Devuelve el número de cambios encontrados (None si falló).
+        """
+        try:
+            self.sync.sync_down()
+            changes = self.sync.last_change_count
+        except Exception as e:
+            # Un fallo puntual (red, portal) no detiene la programación ni altera el intervalo
+            logger.error(f"Error en la sincronización programada: {e}")
+            changes = None
+
+        previous = self.interval.seconds
+        if changes is not None:
+            self.interval.update(changes)
+        if self.interval.seconds != previous:
+            logger.info(f"{changes} cambios remotos: próxima sincronización en {self.interval.seconds:g} s "
+                        f"(antes {previous:g} s)")
+        # Reprogramar cuenta el intervalo desde ahora, es decir, desde el final de esta ejecución
+        self.scheduler.reschedule_job(SYNC_JOB_ID, trigger='interval', seconds=self.interval.seconds)
+        return changes
+
+    def stop(self):
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=True)
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+        self.sync.state.close()
+        logger.info("Sincronización programada detenida.")
+
+if __name__ == "__main__":
+    try:
+        scheduler = GISBoxScheduler()
+        try:
+            scheduler.start()
+        except (KeyboardInterrupt, SystemExit):
+            scheduler.stop()
+
+    except ValueError as e:
+        logger.error(f"Error de configuración: {e}. Por favor, complete el archivo .env.")
+    except Exception as e:
+        logger.error(f"Ocurrió un error en la sincronización programada: {e}")
@@ -0,0 +1,335 @@
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+
+# Configuración de Logging
+logger = logging.getLogger('GISBoxState')
+logger.setLevel(logging.INFO)
+# Configuración del handler (para que solo se configure una vez)
+if not logger.handlers:
+    ch = logging.StreamHandler()
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+
+# Directorio (dentro de LOCAL_SYNC_DIR) donde GISBox guarda su estado interno
+STATE_DIR_NAME = '.gisbox'
+
+# Tamaño de bloque al calcular el hash de un archivo
+HASH_CHUNK_SIZE = 1024 * 1024
+# Segundos durante los que una escritura propia registrada puede reconocerse como eco
+WRITE_TTL_SECONDS = 600
+
+# Columnas de la tabla de elementos (además de la clave `path`)
+ITEM_COLUMNS = ('item_id', 'folder', 'title', 'item_type', 'remote_modified', 'size',
+                'content_hash', 'local_mtime', 'sync_status', 'updated_at')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    path TEXT PRIMARY KEY,      -- ruta relativa a LOCAL_SYNC_DIR (separador '/')
+    item_id TEXT,               -- id del elemento en ArcGIS
+    folder TEXT,                -- carpeta de ArcGIS (NULL para la raíz)
+    title TEXT,
+    item_type TEXT,
+    remote_modified INTEGER,    -- `modified` del elemento en ArcGIS (ms)
+    size INTEGER,               -- tamaño en bytes
+    content_hash TEXT,          -- SHA-256 del contenido local sincronizado
+    local_mtime INTEGER,        -- mtime_ns del archivo local sincronizado
+    sync_status TEXT,           -- 'downloaded', 'uploaded', ...
+    updated_at REAL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_items_path ON items(path);
+CREATE INDEX IF NOT EXISTS idx_items_item_id ON items(item_id);
+CREATE TABLE IF NOT EXISTS sync_writes (
+    path TEXT PRIMARY KEY,      -- ruta relativa que GISBox va a escribir o borrar
+    content_hash TEXT,          -- SHA-256 del contenido escrito (NULL si es un borrado)
+    item_id TEXT,
+    expires_at REAL
+);
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    path TEXT PRIMARY KEY,      -- ruta relativa del archivo que se sube por partes
+    session TEXT                -- sesión de la subida (JSON: id, tamaño, partes confirmadas...)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+def hash_file(path):
+    """
+    Devuelve el SHA-256 (hex) del contenido de un archivo.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class StateStore:
+    """
+    Almacén de estado de GISBox en SQLite, compartido por GISBoxSync y GISBoxMonitor.
+    Usa modo WAL, de modo que un lector concurrente (otro proceso, la CLI) nunca
+    bloquea al que escribe. Las escrituras se acumulan en memoria y se aplican
+    por lotes en una sola transacción.
+
+    Con `read_only` (comandos `plan` y `status`) el almacén ya debe existir: se abre
+    en modo de solo lectura, sin crear directorios, archivos ni tablas.
+    """
+    def __init__(self, path, batch_size=500, flush_interval=2.0, read_only=False):
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.read_only = read_only
+        if read_only and not self.path.exists():
+            raise FileNotFoundError(f"No existe el almacén de estado {self.path}")
+        if not read_only:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._write_lock = threading.Lock()
+        self._local = threading.local()
+        self._writer = self._connect()
+        if not read_only:
+            self._writer.executescript(SCHEMA)
+
+    @classmethod
+    def for_sync_dir(cls, local_sync_dir, **kwargs):
+        """
+        Abre el almacén de estado de un directorio de sincronización.
+        """
+        return cls(Path(local_sync_dir) / STATE_DIR_NAME / 'state.db', **kwargs)
+
+    @classmethod
+    def exists_for_sync_dir(cls, local_sync_dir):
+        """
+        Indica si el directorio de sincronización tiene ya un almacén de estado.
+        """
+        return (Path(local_sync_dir) / STATE_DIR_NAME / 'state.db').exists()
+
+    def _connect(self):
+        if self.read_only:
+            # Sin `mode=ro`, sqlite3.connect crearía el archivo. El modo WAL ya es persistente
+            # (SQLite solo puede añadir sus archivos -wal/-shm junto a un state.db existente)
+            connection = sqlite3.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True, timeout=30,
+                                         check_same_thread=False, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            return connection
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def _reader(self):
+        # Una conexión de lectura por hilo: en WAL las lecturas no esperan a las escrituras
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    # --- Escritura (por lotes) ---
+
+    def upsert(self, path, **fields):
+        """
+        Crea o actualiza la fila de `path` con las columnas indicadas.
+        """
+        unknown = set(fields) - set(ITEM_COLUMNS)
+        if unknown:
+            raise ValueError(f"Columnas desconocidas: {sorted(unknown)}")
+        fields['updated_at'] = time.time()
+        self._queue(('upsert', path, fields))
+
+    def delete(self, path):
+        self._queue(('delete', path, None))
+
+    def rename(self, old_path, new_path):
+        self._queue(('rename', old_path, new_path))
+
+    def clear(self):
+        """
+        Elimina todas las filas de elementos.
+        """
+        self._queue(('clear', None, None))
+
+    def set_meta(self, key, value):
+        self._queue(('meta', key, None if value is None else str(value)))
+
+    def _queue(self, operation):
+        with self._write_lock:
+            self._pending.append(operation)
+            due = (len(self._pending) >= self.batch_size
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """
+        Aplica las escrituras pendientes en una única transacción.
+        """
+        with self._write_lock:
+            pending, self._pending = self._pending, []
+            self._last_flush = time.monotonic()
+            if not pending:
+                return 0
+            cursor = self._writer.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                for kind, key, value in pending:
+                    if kind == 'upsert':
+                        columns = list(value)
+                        assignments = ', '.join(f"{column} = excluded.{column}" for column in columns)
+                        cursor.execute(
+                            f"INSERT INTO items (path, {', '.join(columns)}) "
+                            f"VALUES (?{', ?' * len(columns)}) "
+                            f"ON CONFLICT(path) DO UPDATE SET {assignments}",
+                            [key] + [value[column] for column in columns])
+                    elif kind == 'delete':
+                        cursor.execute('DELETE FROM items WHERE path = ?', (key,))
+                    elif kind == 'rename':
+                        cursor.execute('DELETE FROM items WHERE path = ? AND EXISTS '
+                                       '(SELECT 1 FROM items WHERE path = ?)', (value, key))
+                        cursor.execute('UPDATE items SET path = ? WHERE path = ?', (value, key))
+                    elif kind == 'clear':
+                        cursor.execute('DELETE FROM items')
+                    elif kind == 'meta':
+                        cursor.execute('INSERT INTO meta (key, value) VALUES (?, ?) '
+                                       'ON CONFLICT(key) DO UPDATE SET value = excluded.value', (key, value))
+                cursor.execute('COMMIT')
+            except BaseException:
+                cursor.execute('ROLLBACK')
+                raise
+            logger.debug(f"Estado: {len(pending)} escrituras aplicadas en lote")
+            return len(pending)
+
+    # --- Registro de escrituras propias (supresión de ecos) ---
+
+    def register_write(self, path, content_hash=None, item_id=None, ttl=WRITE_TTL_SECONDS):
+        """
+        Registra que GISBox va a escribir (`content_hash`) o borrar (sin hash) `path`,
+        para que el monitor no suba de vuelta su propio cambio. Se escribe en el acto,
+        fuera de los lotes: el monitor puede estar en otro proceso.
+        """
+        now = time.time()
+        with self._write_lock:
+            cursor = self._writer.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                cursor.execute('DELETE FROM sync_writes WHERE expires_at <= ?', (now,))
+                cursor.execute('INSERT OR REPLACE INTO sync_writes (path, content_hash, item_id, expires_at) '
+                               'VALUES (?, ?, ?, ?)', (path, content_hash, item_id, now + ttl))
+                cursor.execute('COMMIT')
+            except BaseException:
+                cursor.execute('ROLLBACK')
+                raise
+
+    def register_deletes(self, paths, ttl=WRITE_TTL_SECONDS):
+        """
+        Registra de una vez el borrado de varias rutas (ver `register_write`), en una
+        sola transacción: el modo backup vacía el directorio entero.
+        """
+        now = time.time()
+        with self._write_lock:
+            cursor = self._writer.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                cursor.execute('DELETE FROM sync_writes WHERE expires_at <= ?', (now,))
+                cursor.executemany('INSERT OR REPLACE INTO sync_writes (path, content_hash, item_id, expires_at) '
+                                   'VALUES (?, NULL, NULL, ?)', [(path, now + ttl) for path in paths])
+                cursor.execute('COMMIT')
+            except BaseException:
+                cursor.execute('ROLLBACK')
+                raise
+
+    def consume_write(self, path, content_hash=None):
+        """
+        Si `path` tiene registrada una escritura propia con el mismo contenido (o un
+        borrado, si `content_hash` es None), la retira y la devuelve como diccionario.
+        Si no (cambio real del usuario), devuelve None.
+        """
+        with self._write_lock:
+            cursor = self._writer.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                row = cursor.execute('SELECT * FROM sync_writes WHERE path = ? AND content_hash IS ? '
+                                     'AND expires_at > ?', (path, content_hash, time.time())).fetchone()
+                if row is not None:
+                    cursor.execute('DELETE FROM sync_writes WHERE path = ?', (path,))
+                cursor.execute('COMMIT')
+            except BaseException:
+                cursor.execute('ROLLBACK')
+                raise
+        return dict(row) if row is not None else None
+
+    # --- Subidas por partes ---
+
+    def save_upload_session(self, path, session):
+        """
+        Guarda la sesión de la subida por partes de `path`. Se escribe en el acto,
+        fuera de los lotes: cada parte confirmada debe sobrevivir a un reinicio.
+        """
+        with self._write_lock:
+            self._writer.execute('INSERT OR REPLACE INTO upload_sessions (path, session) VALUES (?, ?)',
+                                 (path, json.dumps(session)))
+
+    def drop_upload_session(self, path):
+        with self._write_lock:
+            self._writer.execute('DELETE FROM upload_sessions WHERE path = ?', (path,))
+
+    def upload_sessions(self):
+        """
+        Devuelve las subidas por partes que quedaron a medias (ruta relativa -> sesión).
+        """
+        rows = self._reader().execute('SELECT path, session FROM upload_sessions').fetchall()
+        return {row['path']: json.loads(row['session']) for row in rows}
+
+    # --- Lectura ---
+
+    def get(self, path):
+        """
+        Devuelve la fila de `path` como diccionario, o None.
+        """
+        self.flush()
+        row = self._reader().execute('SELECT * FROM items WHERE path = ?', (path,)).fetchone()
+        return dict(row) if row else None
+
+    def get_by_item_id(self, item_id):
+        """
+        Devuelve las filas asociadas a un id de elemento.
+        """
+        self.flush()
+        rows = self._reader().execute('SELECT * FROM items WHERE item_id = ?', (item_id,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def rows(self, where=None, params=()):
+        """
+        Genera todas las filas (opcionalmente filtradas por una condición SQL).
+        """
+        self.flush()
+        query = 'SELECT * FROM items' + (f' WHERE {where}' if where else '')
+        for row in self._reader().execute(query, params):
+            yield dict(row)
+
+    def count(self):
+        self.flush()
+        return self._reader().execute('SELECT COUNT(*) FROM items').fetchone()[0]
+
+    def get_meta(self, key, default=None):
+        self.flush()
+        row = self._reader().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row['value'] if row else default
+
+    def close(self):
+        """
+        Aplica lo pendiente y cierra la conexión de escritura.
+        """
+        self.flush()
+        self._writer.close()
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
@@ -1,9 +1,20 @@
 import os
+import json
+import time
 import shutil
 import logging
+import zipfile
+import tempfile
+import threading
+import requests
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager
 from pathlib import Path
-from arcgis.gis import GIS, User
 from dotenv import load_dotenv
+from gisbox_governor import RequestGovernor, RetryQueue
+from gisbox_metrics import NULL_METRICS, Metrics
+from gisbox_profile import NULL_PROFILER
+from gisbox_state import STATE_DIR_NAME, StateStore, hash_file
 
 # Configuración de Logging
 # Configuración de Logging
@@ -16,12 +27,263 @@ if not logger.handlers:
     ch.setFormatter(formatter)
     logger.addHandler(ch)
 
+# La API de ArcGIS tarda segundos en importarse: no se importa con este módulo, sino
+# la primera vez que se necesita (ver `load_arcgis`)
+GIS = None
+Item = None
+User = None
+
+def load_arcgis():
+    """
+    Importa `arcgis.gis` si aún no se ha hecho. Respeta los nombres ya asignados
+    (p. ej. sustituidos en las pruebas).
+    """
+    global GIS, Item, User
+    if GIS is None or Item is None or User is None:
+        from arcgis import gis as arcgis_gis
+        GIS = GIS or arcgis_gis.GIS
+        Item = Item or arcgis_gis.Item
+        User = User or arcgis_gis.User
+
+# Tamaño del búfer de escritura de las descargas en streaming
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Margen (ms) que se solapa con la sincronización anterior en el modo delta, para
+# cubrir el retardo del índice de búsqueda del portal y la deriva de los relojes
+DELTA_OVERLAP_MS = 10 * 60 * 1000
+# Claves del almacén de estado usadas por el modo delta
+HIGH_WATER_MARK_KEY = 'delta_high_water_mark'
+REMOTE_IDS_KEY = 'delta_remote_item_ids'
+# Tipos de elemento que se sincronizan como archivos (Se podría externalizar)
+FILE_TYPES = ('CSV', 'Service Definition', 'KML', 'ZIP', 'Shapefile',
+              'Image Collection', 'PDF', 'Microsoft Excel')
+# Formatos ya comprimidos: se guardan en el ZIP sin volver a comprimirlos
+COMPRESSED_EXTENSIONS = {
+    '.zip', '.kmz', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar', '.sd',
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.jp2', '.sid', '.ecw',
+    '.mp3', '.mp4', '.docx', '.xlsx', '.pptx',
+}
+
+class SyncManifest:
+    """
+    Manifiesto local de la sincronización de descarga, respaldado por el almacén de
+    estado (StateStore). Registra, por id de elemento, la fecha de modificación
+    remota, el tamaño y la ruta local (relativa a LOCAL_SYNC_DIR) del último
+    archivo descargado.
+    """
+    def __init__(self, local_sync_dir, store):
+        self.local_sync_dir = Path(local_sync_dir)
+        self.store = store
+        self.entries = {}
+        # Hash del contenido de las escrituras anunciadas con `register_write`
+        self._pending_hashes = {}
+        # Las descargas registran elementos desde varios hilos
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Carga el manifiesto desde el almacén de estado: toda fila con id de elemento
+        y fecha de modificación remota (descargada por sync_down o subida por el monitor).
+        """
+        self.entries = {}
+        for row in self.store.rows('item_id IS NOT NULL AND remote_modified IS NOT NULL'):
+            self.entries[row['item_id']] = {
+                'title': row['title'],
+                'type': row['item_type'],
+                'modified': row['remote_modified'],
+                'size': row['size'],
+                'path': row['path'],
+            }
+        return self.entries
+
+    def save(self):
+        """
+        Aplica en el almacén de estado las escrituras pendientes.
+        """
+        self.store.flush()
+
+    def clear(self):
+        with self._lock:
+            self.entries = {}
+            self.store.clear()
+
+    def is_current(self, item):
+        """
+        Indica si la copia local del elemento está al día: mismo `modified`,
+        mismo tamaño y el archivo sigue existiendo en disco.
+        """
+        entry = self.entries.get(item.id)
+        if not entry:
+            return False
+        return (entry['modified'] == _item_modified(item)
+                and entry['size'] == _item_size(item)
+                and (self.local_sync_dir / entry['path']).exists())
+
+    def register_write(self, item, source_path, local_path):
+        """
+        Anuncia en el almacén de estado que `source_path` (archivo temporal o parcial)
+        va a pasar a `local_path`, con su hash, para que el monitor reconozca el
+        evento resultante como un eco de la descarga y no lo suba de vuelta.
+        Debe llamarse justo antes del renombrado final.
+        """
+        relative_path = Path(local_path).relative_to(self.local_sync_dir).as_posix()
+        content_hash = hash_file(source_path)
+        self.store.register_write(relative_path, content_hash, item.id)
+        with self._lock:
+            self._pending_hashes[relative_path] = content_hash
+
+    def record(self, item, local_path):
+        """
+        Registra la descarga de un elemento. Si el elemento estaba antes en otra
+        ruta (p. ej. cambió su título), se elimina el archivo anterior.
+        """
+        local_path = Path(local_path)
+        relative_path = local_path.relative_to(self.local_sync_dir).as_posix()
+        folder = Path(relative_path).parent.as_posix()
+        with self._lock:
+            previous = self.entries.get(item.id)
+            if previous and previous['path'] != relative_path:
+                self._remove_file(previous['path'])
+                self.store.delete(previous['path'])
+            self.entries[item.id] = {
+                'title': item.title,
+                'type': item.type,
+                'modified': _item_modified(item),
+                'size': _item_size(item),
+                'path': relative_path,
+            }
+            self.store.upsert(relative_path, item_id=item.id, folder=None if folder == '.' else folder,
+                              title=item.title, item_type=item.type, remote_modified=_item_modified(item),
+                              size=_item_size(item), local_mtime=_local_mtime(local_path),
+                              content_hash=self._pending_hashes.pop(relative_path, None),
+                              sync_status='downloaded')
+
+    def remove_missing(self, seen_ids):
+        """
+        Elimina del disco y del manifiesto los elementos que ya no existen en
+        ArcGIS (los que no aparecen en `seen_ids`). Devuelve las entradas eliminadas.
+        """
+        return self.remove_items([item_id for item_id in list(self.entries) if item_id not in seen_ids])
+
+    def remove_items(self, item_ids):
+        """
+        Elimina del disco y del manifiesto los elementos indicados. Devuelve las
+        entradas eliminadas.
+        """
+        removed = []
+        for item_id in item_ids:
+            entry = self.entries.pop(item_id, None)
+            if entry is None:
+                continue
+            self._remove_file(entry['path'])
+            self.store.delete(entry['path'])
+            removed.append(entry)
+        return removed
+
+    def _remove_file(self, relative_path):
+        path = self.local_sync_dir / relative_path
+        if path.exists():
+            # El borrado también se anuncia: no es una eliminación del usuario
+            self.store.register_write(relative_path)
+            path.unlink()
+            logger.info(f"  [ELIMINADO LOCAL] {relative_path}")
+
+def _item_modified(item):
+    modified = getattr(item, 'modified', None)
+    return int(modified) if modified is not None else None
+
+def _item_size(item):
+    size = getattr(item, 'size', None)
+    return int(size) if size is not None else None
+
+def _local_mtime(path):
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+def iter_user_items(gis, username, folder_id=None, page_size=100, governor=None, metrics=None, profiler=None):
+    """
+    Genera los elementos de una carpeta de un usuario página a página mediante el
+    endpoint de contenido del portal (content/users/<usuario>/<carpeta>). Cada
+    elemento se entrega en cuanto llega su página. Con `governor`, las peticiones
+    pasan por el regulador; con `metrics` y `profiler`, cada página se mide como 'list'.
+    """
+    load_arcgis()
+    get = governor.wrap(gis._con.get) if governor else gis._con.get
+    metrics = metrics if metrics is not None else NULL_METRICS
+    profiler = profiler if profiler is not None else NULL_PROFILER
+    url = f"{gis._portal.resturl}content/users/{username}"
+    if folder_id:
+        url += f"/{folder_id}"
+
+    start = 1
+    while start > 0:
+        with metrics.time('list'), profiler.span('list', folder_id=folder_id, start=start):
+            response = get(url, {'start': start, 'num': page_size})
+        for item_dict in response.get('items', []):
+            yield Item(gis, item_dict['id'], item_dict)
+        start = response.get('nextStart', -1)
+
+def get_file_extension(item):
+    """
+    Determina la extensión del archivo local a partir del tipo y el título del elemento.
+    """
+    file_extension = item.type.lower().replace(' ', '_')
+    if item.type == 'Microsoft Excel':
+        file_extension = 'xlsx'
+    elif item.type == 'Service Definition':
+        file_extension = 'sd'
+    elif item.type == 'Image Collection':
+        file_extension = 'zip'
+    else:
+        # Intentar obtener la extensión del nombre del item si es posible
+        if '.' in item.title:
+            file_extension = item.title.rsplit('.', 1)[1]
+        elif item.type in ['CSV', 'KML', 'PDF', 'ZIP']:
+            file_extension = item.type.lower()
+    return file_extension
+
+def _search_timestamp(ms):
+    # El índice de búsqueda compara las fechas como texto: ms con 19 dígitos
+    return f"{max(int(ms), 0):019d}"
+
+def iter_search_items(gis, query, page_size=100, governor=None, metrics=None, profiler=None):
+    """
+    Genera los resultados de una búsqueda en el portal (endpoint search) página a
+    página, ordenados por fecha de modificación. Con `metrics` y `profiler`, cada
+    página se mide como 'search'.
+    """
+    load_arcgis()
+    get = governor.wrap(gis._con.get) if governor else gis._con.get
+    metrics = metrics if metrics is not None else NULL_METRICS
+    profiler = profiler if profiler is not None else NULL_PROFILER
+    url = f"{gis._portal.resturl}search"
+    start = 1
+    while start > 0:
+        with metrics.time('search'), profiler.span('search', start=start):
+            response = get(url, {'q': query, 'start': start, 'num': page_size,
+                                 'sortField': 'modified', 'sortOrder': 'asc'})
+        for item_dict in response.get('results', []):
+            yield Item(gis, item_dict['id'], item_dict)
+        start = response.get('nextStart', -1)
+
+def count_search_results(gis, query, governor=None):
+    """
+    Devuelve el número total de resultados de una búsqueda con una sola petición.
+    """
+    get = governor.wrap(gis._con.get) if governor else gis._con.get
+    response = get(f"{gis._portal.resturl}search", {'q': query, 'start': 1, 'num': 1})
+    return int(response.get('total', 0))
+
 class GISBoxSync:
     """
     Clase principal para la sincronización de archivos entre ArcGIS Online/Enterprise
-    y un sistema de archivos local.
+    y un sistema de archivos local. `gis`, `governor` y `state` permiten compartir
+    la conexión, el regulador de peticiones y el almacén de estado con el monitor
+    (ver gisbox_daemon.py). Con `profiler` (ver gisbox_profile.py), cada fase de
+    cada elemento y carpeta queda registrada en una traza.
     """
-    def __init__(self):
+    def __init__(self, gis=None, governor=None, state=None, metrics=None, profiler=None):
         # Cargar variables de entorno desde .env
         load_dotenv(Path(__file__).parent / ".env")
         
@@ -30,22 +292,67 @@ class GISBoxSync:
         self.password = os.getenv("ARCGIS_PASSWORD")
         self.profile = os.getenv("ARCGIS_PROFILE")
         self.local_sync_dir = os.getenv("LOCAL_SYNC_DIR")
+        # 'backup' (borra y descarga todo) o 'incremental' (solo cambios)
+        self.sync_mode = (os.getenv("SYNC_MODE") or "backup").lower()
+        # Número máximo de descargas simultáneas
+        self.max_workers = int(os.getenv("MAX_WORKERS") or 4)
         
         if not self.local_sync_dir:
             raise ValueError("LOCAL_SYNC_DIR no está configurado en el archivo .env")
+        if self.sync_mode not in ('backup', 'incremental', 'delta'):
+            raise ValueError(f"SYNC_MODE no válido: {self.sync_mode} (use 'backup', 'incremental' o 'delta')")
+        # Número de carpetas que se listan en paralelo
+        self.folder_workers = int(os.getenv("FOLDER_WORKERS") or 4)
+        # Elementos por página al listar el contenido (máximo admitido por el portal: 100)
+        self.page_size = int(os.getenv("PAGE_SIZE") or 100)
+        # Los elementos de al menos STREAM_THRESHOLD_MB se descargan en streaming reanudable
+        self.stream_threshold = float(os.getenv("STREAM_THRESHOLD_MB") or 50) * 1024 * 1024
+        self.download_retries = int(os.getenv("DOWNLOAD_RETRIES") or 5)
+        # Empaquetado en ZIP de las descargas que llegan como directorio (p. ej. Shapefile)
+        self.zip_compression_level = int(os.getenv("ZIP_COMPRESSION_LEVEL") or 6)
+        self.package_workers = int(os.getenv("PACKAGE_WORKERS") or 2)
+        if self.max_workers < 1:
+            raise ValueError("MAX_WORKERS debe ser un entero mayor que 0")
+        if self.folder_workers < 1:
+            raise ValueError("FOLDER_WORKERS debe ser un entero mayor que 0")
+        if not 1 <= self.page_size <= 100:
+            raise ValueError("PAGE_SIZE debe estar entre 1 y 100")
+        if not 0 <= self.zip_compression_level <= 9:
+            raise ValueError("ZIP_COMPRESSION_LEVEL debe estar entre 0 y 9")
+        if self.package_workers < 1:
+            raise ValueError("PACKAGE_WORKERS debe ser un entero mayor que 0")
+        # Regulador de peticiones al portal (AIMD, Retry-After y reintentos) y cola de
+        # los elementos que fallan, que se reintentan al final de sync_down
+        self.governor = governor if governor is not None else RequestGovernor.from_env()
+        self.retry_queue = RetryQueue(self.governor, max_attempts=int(os.getenv("RETRY_ATTEMPTS") or 3))
+        # Contadores, bytes y latencias por fase (ver gisbox_metrics.py); desactivado, no cuesta nada
+        self.metrics = metrics if metrics is not None else Metrics.from_env()
+        self.metrics.gauge('governor_in_flight', lambda: self.governor.in_flight)
+        self.metrics.gauge('governor_limit', lambda: self.governor.limit)
+        self.profiler = profiler if profiler is not None else NULL_PROFILER
+
+        self.state = state if state is not None else StateStore.for_sync_dir(self.local_sync_dir)
+        self.manifest = SyncManifest(self.local_sync_dir, self.state)
+        self._seen_item_ids = set()
+        self._remote_items = {}
+        self._removed_count = 0
+        self.last_change_count = None
+        self._download_executor = None
+        self._package_executor = None
+        self._folder_ids = None
 
-        self.gis = self._connect_to_arcgis()
+        self.gis = gis if gis is not None else self._connect_to_arcgis()
         self.user = self.gis.users.get(self.username) if self.username else self.gis.users.me
         
-        # Tipos de archivo a sincronizar (Se podría externalizar)
-        self.file_types = ['CSV', 'Service Definition', 'KML', 'ZIP', 'Shapefile',
-                           'Image Collection', 'PDF', 'Microsoft Excel']
+        # Tipos de archivo a sincronizar
+        self.file_types = list(FILE_TYPES)
 
     def _connect_to_arcgis(self):
         """
         Establece la conexión con la organización de ArcGIS.
         Prioriza la conexión por perfil si está disponible.
         """
+        load_arcgis()
         if self.profile:
             gis = GIS(profile=self.profile)
         elif self.username and self.password:
@@ -60,21 +367,46 @@ class GISBoxSync:
     def _prepare_local_directory(self):
         """
         Prepara el directorio local de sincronización, eliminando el contenido anterior
-        para una sincronización limpia (en modo backup).
+        para una sincronización limpia (en modo backup). En modo incremental se
+        conserva el contenido y se carga el manifiesto de la ejecución anterior.
         """
         local_path = Path(self.local_sync_dir)
+        if self.sync_mode != 'backup':
+            local_path.mkdir(parents=True, exist_ok=True)
+            self.manifest.load()
+            logger.info(f"Sincronización incremental: {len(self.manifest.entries)} elementos en el manifiesto")
+            return
+
+        self.manifest.clear()
         if local_path.exists():
             logger.warning(f"Eliminando contenido anterior en: {self.local_sync_dir}")
-            shutil.rmtree(local_path)
+            # El directorio de estado se conserva: la base de datos puede estar abierta
+            # (por este proceso o por el monitor)
+            children = [child for child in local_path.iterdir() if child.name != STATE_DIR_NAME]
+            # Los borrados se anuncian antes de hacerlos: si el monitor vigila el
+            # directorio, no son eliminaciones del usuario y no deben llegar a ArcGIS
+            deleted = []
+            for child in children:
+                paths = child.rglob('*') if child.is_dir() and not child.is_symlink() else [child]
+                deleted += [path.relative_to(local_path).as_posix() for path in paths
+                            if path.is_symlink() or not path.is_dir()]
+            self.state.register_deletes(deleted)
+            for child in children:
+                if child.is_dir() and not child.is_symlink():
+                    shutil.rmtree(child)
+                else:
+                    child.unlink()
         
         local_path.mkdir(parents=True, exist_ok=True)
         logger.info(f"Directorio de sincronización preparado: {self.local_sync_dir}")
 
-    def download_items(self, folder_name=None):
+    def download_items(self, folder_name=None, items=None):
         """
         Descarga los elementos de ArcGIS Online/Enterprise al directorio local.
+        Las descargas se ejecutan en paralelo en un pool de MAX_WORKERS hilos
+        (compartido entre carpetas durante `sync_down`); un error en un elemento
+        no afecta al resto. Si se pasan `items` (modo delta) no se lista la carpeta.
         """
-        items = self.user.items(folder=folder_name)
         download_count = 0
         
         if folder_name:
@@ -85,82 +417,424 @@ class GISBoxSync:
             local_folder_path = Path(self.local_sync_dir)
             logger.info("Procesando carpeta raíz de ArcGIS")
 
-        for item in items:
-            if item.type in self.file_types:
-                try:
-                    # La API de ArcGIS descarga el archivo a un directorio temporal
-                    temp_path = Path(item.download(local_folder_path))
-                    
-                    # Renombrar el archivo descargado al nombre original con extensión correcta
-                    # La API a veces descarga sin extensión o con un nombre temporal
-                    file_extension = item.type.lower().replace(' ', '_')
-                    if item.type == 'Microsoft Excel':
-                        file_extension = 'xlsx'
-                    elif item.type == 'Service Definition':
-                        file_extension = 'sd'
-                    elif item.type == 'Image Collection':
-                        file_extension = 'zip'
-                    else:
-                        # Intentar obtener la extensión del nombre del item si es posible
-                        if '.' in item.title:
-                            file_extension = item.title.rsplit('.', 1)[1]
-                        elif item.type in ['CSV', 'KML', 'PDF', 'ZIP']:
-                            file_extension = item.type.lower()
-                        
-                    final_name = f"{item.title}.{file_extension}"
-                    final_path = local_folder_path / final_name
-                    
-                    # Mover y renombrar el archivo temporal al destino final
-                    if temp_path.is_dir():
-                        # Si es un zip/carpeta, el archivo descargado es un directorio con el contenido
-                        # Necesitamos mover el contenido o comprimirlo si fuera necesario.
-                        # Por simplicidad, en esta refactorización nos enfocaremos en archivos individuales.
-                        # El código original solo renombra, lo que implica que el download() devuelve un path de archivo.
-                        # Asumimos el comportamiento del código original: temp_path es el archivo descargado.
-                        
-                        # Si el path devuelto es un directorio (ej. para Shapefile), lo comprimimos en un zip
-                        if temp_path.is_dir():
-                            shutil.make_archive(final_path.stem, 'zip', temp_path)
-                            shutil.rmtree(temp_path)
-                            final_path = local_folder_path / f"{final_path.stem}.zip"
-                            
-                        else:
-                            # Renombrar el archivo descargado
-                            os.rename(temp_path, final_path)
-                            
-                    else:
-                         os.rename(temp_path, final_path)
-                         
-                    logger.info(f"  [DESCARGADO] {item.title} ({item.type}) a {final_path.name}")
-                    download_count += 1
-                    
-                except Exception as e:
-                    logger.error(f"Error al descargar {item.title}: {e}")
+        # Número máximo de descargas pendientes de esta carpeta: al alcanzarlo se deja
+        # de paginar hasta que termine alguna, para que la memoria no crezca con la carpeta
+        max_pending = self.max_workers * 2
+
+        with self._worker_pools(), self.profiler.span('folder', folder=folder_name or '(raíz)'):
+            futures = {}
+            for item in (self.iter_items(folder_name) if items is None else items):
+                self._remote_items[item.id] = _item_modified(item)
+                if item.type in self.file_types:
+                    self._seen_item_ids.add(item.id)
+                    if self.sync_mode != 'backup' and self.manifest.is_current(item):
+                        logger.debug(f"  [SIN CAMBIOS] {item.title}")
+                        self.metrics.count('items', result='unchanged')
+                        continue
+                    future = self._download_executor.submit(self._download_item, item, local_folder_path)
+                    futures[future] = (item, local_folder_path)
+                    if len(futures) >= max_pending:
+                        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                        download_count += self._collect_downloads(futures, done)
+
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                download_count += self._collect_downloads(futures, done)
+
+        logger.info(f"Carpeta {folder_name or '(raíz)'}: {download_count} elementos descargados")
+        return download_count
 
+    def _collect_downloads(self, futures, done):
+        """
+        Recoge el resultado de las descargas terminadas (`done`), las retira de
+        `futures` y devuelve cuántas terminaron con éxito. Las descargas que siguen
+        empaquetándose se vuelven a añadir a `futures` con su tarea de empaquetado,
+        y las que fallan pasan a la cola de reintentos.
+        """
+        download_count = 0
+        for future in done:
+            item, local_folder_path = futures.pop(future)
+            try:
+                result = future.result()
+                if isinstance(result, Future):
+                    futures[result] = (item, local_folder_path)
+                    continue
+                download_count += 1
+                self.metrics.count('items', result='downloaded')
+                self.retry_queue.discard(item.id)
+            except Exception as e:
+                logger.error(f"Error al descargar {item.title}: {e}")
+                self.metrics.count('items', result='failed')
+                self.retry_queue.add(item.id, self._download_item, item, local_folder_path, error=e)
         return download_count
 
+    def _retry_failed_downloads(self):
+        """
+        Reintenta las descargas fallidas (con espera exponencial entre intentos)
+        hasta que terminan bien o agotan sus intentos. Devuelve cuántas se completaron.
+        """
+        download_count = 0
+        with self._worker_pools():
+            while len(self.retry_queue):
+                wait_seconds = self.retry_queue.next_due()
+                if wait_seconds:
+                    time.sleep(wait_seconds)
+                due = self.retry_queue.pop_due()
+                logger.info(f"Reintentando {len(due)} descargas fallidas")
+                futures = {self._download_executor.submit(func, *args): args for _, func, args in due}
+                while futures:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    download_count += self._collect_downloads(futures, done)
+        return download_count
+
+    def iter_items(self, folder_name=None):
+        """
+        Genera los elementos de una carpeta del usuario página a página (ver
+        `iter_user_items`). A diferencia de `user.items()`, no materializa la lista
+        completa ni la trunca en `max_items`.
+        """
+        folder_id = self._get_folder_id(folder_name) if folder_name else None
+        return iter_user_items(self.gis, self.user.username, folder_id, self.page_size, self.governor, self.metrics,
+                               self.profiler)
+
+    def _get_folder_id(self, folder_name):
+        """
+        Devuelve el id de una carpeta del usuario a partir de su título.
+        """
+        if self._folder_ids is None:
+            self._folder_ids = {folder['title']: folder['id'] for folder in self.user.folders}
+        return self._folder_ids[folder_name]
+
+    @contextmanager
+    def _worker_pools(self):
+        """
+        Garantiza que existen los pools de descarga y de empaquetado: los compartidos
+        de `sync_down` o, si se llama a `download_items` de forma aislada, unos
+        propios para esa llamada.
+        """
+        if self._download_executor is not None:
+            yield
+            return
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='gisbox-download') as download_executor, \
+             ThreadPoolExecutor(max_workers=self.package_workers, thread_name_prefix='gisbox-package') as package_executor:
+            self._download_executor = download_executor
+            self._package_executor = package_executor
+            try:
+                yield
+            finally:
+                self._download_executor = None
+                self._package_executor = None
+
+    def _download_item(self, item, local_folder_path):
+        """
+        Descarga un único elemento y lo deja en su ruta final. Devuelve la ruta final.
+        """
+        with self.profiler.span('download', item):
+            return self._download_item_data(item, local_folder_path)
+
+    def _download_item_data(self, item, local_folder_path):
+        size = _item_size(item)
+        if size is not None and size >= self.stream_threshold:
+            final_path = local_folder_path / f"{item.title}.{self._get_file_extension(item)}"
+            self._stream_download(item, final_path)
+            self.metrics.add_bytes('download', size)
+            logger.info(f"  [DESCARGADO] {item.title} ({item.type}) a {final_path.name}")
+            self.manifest.record(item, final_path)
+            return final_path
+
+        # Cada descarga usa su propio directorio temporal (en el mismo sistema de archivos)
+        # para que dos elementos con el mismo nombre de archivo no colisionen
+        temp_dir = tempfile.mkdtemp(prefix=f'{STATE_DIR_NAME}-', dir=local_folder_path)
+        try:
+            # La API de ArcGIS descarga el archivo a un directorio temporal
+            with self.metrics.time('transfer'), self.profiler.span('transfer', item):
+                temp_path = Path(self.governor.call(item.download, temp_dir, timed=False))
+            self.metrics.add_bytes('download', size)
+            final_path = local_folder_path / f"{item.title}.{self._get_file_extension(item)}"
+
+            if temp_path.is_dir():
+                # Si el path devuelto es un directorio (ej. para Shapefile), se empaqueta en un
+                # zip en otro pool, para que este hilo pueda pasar a la siguiente descarga
+                zip_path = local_folder_path / f"{final_path.stem}.zip"
+                future = self._package_executor.submit(self._package_item, item, temp_path, zip_path, temp_dir)
+                temp_dir = None  # El empaquetado se encarga de eliminarlo
+                return future
+
+            # La API a veces descarga sin extensión o con un nombre temporal. os.replace
+            # sobrescribe la copia anterior (modo incremental) también en Windows
+            with self.metrics.time('rename'), self.profiler.span('rename', item):
+                self.manifest.register_write(item, temp_path, final_path)
+                os.replace(temp_path, final_path)
+        finally:
+            if temp_dir is not None:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+        logger.info(f"  [DESCARGADO] {item.title} ({item.type}) a {final_path.name}")
+        self.manifest.record(item, final_path)
+        return final_path
+
+    def _package_item(self, item, source_dir, zip_path, temp_dir):
+        """
+        Empaqueta en `zip_path` un elemento descargado como directorio y elimina el
+        directorio temporal de la descarga.
+        """
+        try:
+            with self.metrics.time('zip'), self.profiler.span('zip', item):
+                self._package_directory(source_dir, zip_path, item)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        logger.info(f"  [DESCARGADO] {item.title} ({item.type}) a {zip_path.name}")
+        self.manifest.record(item, zip_path)
+        return zip_path
+
+    def _package_directory(self, source_dir, zip_path, item=None):
+        """
+        Escribe el contenido de `source_dir` directamente en un ZIP junto al destino
+        final (archivo parcial + renombrado atómico). Los formatos ya comprimidos se
+        almacenan sin recomprimir. Con `item`, la escritura se anuncia en el manifiesto.
+        """
+        part_path = zip_path.with_name(f"{STATE_DIR_NAME}-{zip_path.name}.part")
+        try:
+            with zipfile.ZipFile(part_path, 'w', compression=zipfile.ZIP_DEFLATED,
+                                 compresslevel=self.zip_compression_level) as archive:
+                for file_path in sorted(Path(source_dir).rglob('*')):
+                    if not file_path.is_file():
+                        continue
+                    compress_type = (zipfile.ZIP_STORED if file_path.suffix.lower() in COMPRESSED_EXTENSIONS
+                                     else zipfile.ZIP_DEFLATED)
+                    archive.write(file_path, file_path.relative_to(source_dir).as_posix(),
+                                  compress_type=compress_type)
+            if item is not None:
+                self.manifest.register_write(item, part_path, zip_path)
+            os.replace(part_path, zip_path)
+        except BaseException:
+            part_path.unlink(missing_ok=True)
+            raise
+        return zip_path
+
+    def _stream_download(self, item, final_path):
+        """
+        Descarga los datos del elemento (content/items/<id>/data) en streaming a un
+        archivo parcial junto al destino, con un búfer de tamaño fijo. Si la conexión
+        se corta, reanuda con una petición HTTP Range desde el último byte recibido;
+        al terminar, renombra el archivo parcial de forma atómica.
+        """
+        part_path = final_path.with_name(f"{STATE_DIR_NAME}-{final_path.name}.part")
+        url = f"{self.gis._portal.resturl}content/items/{item.id}/data"
+        expected_size = _item_size(item)
+
+        for attempt in range(self.download_retries + 1):
+            offset = part_path.stat().st_size if part_path.exists() else 0
+            if expected_size is not None and offset == expected_size:
+                break
+            try:
+                with self.metrics.time('transfer'), self.profiler.span('transfer', item, offset=offset):
+                    self._stream_to_file(url, part_path, offset)
+                if expected_size is None or part_path.stat().st_size == expected_size:
+                    break
+                raise IOError(f"descarga incompleta ({part_path.stat().st_size} de {expected_size} bytes)")
+            except (requests.RequestException, OSError) as e:
+                if attempt == self.download_retries:
+                    raise
+                received = part_path.stat().st_size if part_path.exists() else 0
+                logger.warning(f"  [REINTENTANDO] {item.title} desde el byte {received}: {e}")
+                time.sleep(min(2 ** attempt, 30))
+
+        with self.metrics.time('rename'), self.profiler.span('rename', item):
+            self.manifest.register_write(item, part_path, final_path)
+            os.replace(part_path, final_path)
+        return final_path
+
+    def _stream_to_file(self, url, part_path, offset):
+        """
+        Escribe en `part_path` la respuesta de `url` a partir del byte `offset`.
+        """
+        headers = {'Range': f"bytes={offset}-"} if offset else {}
+        # La apertura de la respuesta pasa por el regulador (429, Retry-After, ...);
+        # un corte a mitad de la transferencia lo reintenta _stream_download
+        response = self.governor.call(self._open_stream, url, headers)
+        try:
+            if response.status_code == 416:
+                # El archivo parcial ya contiene todos los bytes
+                return
+            if offset and response.status_code != 206:
+                # El servidor no admite Range: se empieza de nuevo
+                offset = 0
+            with open(part_path, 'ab' if offset else 'wb') as f:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+        finally:
+            response.close()
+
+    def _open_stream(self, url, headers):
+        response = self.gis.session.get(url, headers=headers, stream=True)
+        if response.status_code != 416:
+            try:
+                response.raise_for_status()
+            except requests.HTTPError:
+                response.close()
+                raise
+        return response
+
+    def _get_file_extension(self, item):
+        """
+        Determina la extensión del archivo local a partir del tipo y el título del elemento.
+        """
+        return get_file_extension(item)
+
     def sync_down(self):
         """
         Realiza la sincronización de descarga (backup) de toda la organización.
+        En modo delta, tras la primera ejecución solo se consultan los elementos
+        modificados desde la anterior.
         """
-        self._prepare_local_directory()
-        
-        # 1. Descargar elementos de la carpeta raíz
-        root_count = self.download_items(folder_name=None)
-        
-        # 2. Descargar elementos de las subcarpetas
-        folders = self.user.folders
-        total_count = root_count
-        
-        for folder in folders:
-            folder_name = folder['title']
-            count = self.download_items(folder_name=folder_name)
-            total_count += count
+        started = time.perf_counter()
+        metrics_start = self.metrics.snapshot()
+        with self.profiler.span('prepare', sync_mode=self.sync_mode):
+            self._prepare_local_directory()
+        self._seen_item_ids = set()
+        self._remote_items = {}
+        self.retry_queue.exhausted.clear()
+        self._removed_count = 0
+        self._folder_ids = {folder['title']: folder['id'] for folder in self.user.folders}
+
+        high_water_mark = self.state.get_meta(HIGH_WATER_MARK_KEY) if self.sync_mode == 'delta' else None
+        if high_water_mark is not None:
+            with self.profiler.span('sync_delta'):
+                total_count = self._sync_delta(int(high_water_mark))
+        else:
+            with self.profiler.span('sync_full'):
+                total_count = self._sync_full()
+        with self.profiler.span('save_state'):
+            self.manifest.save()
+        # Cambios remotos aplicados en esta ejecución (descargas y eliminaciones)
+        self.last_change_count = total_count + self._removed_count
             
         logger.info(f"\nSincronización de descarga completada. Total de elementos descargados: {total_count}")
+        self.metrics.observe('sync_down', time.perf_counter() - started)
+        summary = self.metrics.summary(since=metrics_start)
+        if summary:
+            logger.info("Métricas de la sincronización:\n" + "\n".join(summary))
         
         return total_count
 
+    def plan(self):
+        """
+        Calcula lo que haría `sync_down` sin descargar ni borrar nada. Lista todas las
+        carpetas (también en modo delta) y devuelve un diccionario con los elementos
+        que se descargarían ('download'), las rutas locales que se eliminarían
+        ('remove'), el número de elementos al día ('unchanged') y si el directorio
+        local se vaciaría antes ('reset', modo backup).
+        """
+        reset = self.sync_mode == 'backup'
+        entries = {} if reset else self.manifest.load()
+        self._folder_ids = {folder['title']: folder['id'] for folder in self.user.folders}
+        folder_names = [None] + list(self._folder_ids)
+
+        def list_folder(folder_name):
+            return folder_name, list(self.iter_items(folder_name))
+
+        download, seen_ids, unchanged = [], set(), 0
+        with ThreadPoolExecutor(max_workers=self.folder_workers, thread_name_prefix='gisbox-folder') as executor:
+            for folder_name, items in executor.map(list_folder, folder_names):
+                for item in items:
+                    if item.type not in self.file_types:
+                        continue
+                    seen_ids.add(item.id)
+                    if not reset and self.manifest.is_current(item):
+                        unchanged += 1
+                    else:
+                        download.append({'id': item.id, 'folder': folder_name, 'title': item.title,
+                                         'type': item.type, 'size': _item_size(item)})
+        remove = sorted(entry['path'] for item_id, entry in entries.items() if item_id not in seen_ids)
+        return {'download': download, 'remove': remove, 'unchanged': unchanged, 'reset': reset}
+
+    def _sync_full(self):
+        """
+        Lista todas las carpetas y descarga lo necesario. Devuelve el número de
+        elementos descargados.
+        """
+        # Las carpetas (raíz incluida) se listan en paralelo y todas alimentan un
+        # único pool de descargas, de modo que la red no queda ociosa mientras se
+        # enumera la siguiente carpeta
+        folder_names = [None] + list(self._folder_ids)
+        total_count = 0
+
+        with self._worker_pools(), \
+             ThreadPoolExecutor(max_workers=self.folder_workers, thread_name_prefix='gisbox-folder') as folder_executor:
+            futures = [folder_executor.submit(self.download_items, folder_name=folder_name)
+                       for folder_name in folder_names]
+            for future in as_completed(futures):
+                total_count += future.result()
+        total_count += self._retry_failed_downloads()
+
+        # Eliminar localmente los elementos borrados en ArcGIS
+        if self.sync_mode != 'backup':
+            removed = self.manifest.remove_missing(self._seen_item_ids)
+            self._removed_count += len(removed)
+            if removed:
+                logger.info(f"Eliminados localmente {len(removed)} elementos borrados en ArcGIS")
+
+        # Punto de partida de la siguiente sincronización delta
+        self._save_delta_state(set(self._remote_items), max(self._remote_items.values(), default=None))
+        return total_count
+
+    def _sync_delta(self, since):
+        """
+        Sincronización delta: busca solo los elementos del usuario modificados desde
+        `since` (ms) y detecta las eliminaciones comparando el número de elementos
+        remotos con el conjunto de ids conocido. Solo si no coinciden se listan los
+        ids de todas las carpetas. Devuelve el número de elementos descargados.
+        """
+        owner_query = f'owner:"{self.user.username}"'
+        now = int(time.time() * 1000)
+        query = (f'{owner_query} AND modified:[{_search_timestamp(since - DELTA_OVERLAP_MS)} '
+                 f'TO {_search_timestamp(now + DELTA_OVERLAP_MS)}]')
+        changed = list(iter_search_items(self.gis, query, self.page_size, self.governor, self.metrics,
+                                         self.profiler))
+        logger.info(f"Sincronización delta: {len(changed)} elementos modificados desde la última ejecución")
+
+        # ownerFolder es el id de la carpeta (None para la raíz)
+        folder_titles = {folder_id: title for title, folder_id in self._folder_ids.items()}
+        by_folder = {}
+        for item in changed:
+            by_folder.setdefault(folder_titles.get(item.get('ownerFolder')), []).append(item)
+
+        total_count = 0
+        with self._worker_pools():
+            for folder_name, items in by_folder.items():
+                total_count += self.download_items(folder_name, items=items)
+            total_count += self._retry_failed_downloads()
+
+        known_ids = set(json.loads(self.state.get_meta(REMOTE_IDS_KEY) or '[]'))
+        remote_ids = known_ids | set(self._remote_items)
+        if count_search_results(self.gis, owner_query, self.governor) != len(remote_ids):
+            # Hay elementos eliminados (o el índice aún no refleja algún cambio): se
+            # comparan los ids con el listado completo de las carpetas
+            remote_ids = {item.id
+                          for folder_id in [None] + list(self._folder_ids.values())
+                          for item in iter_user_items(self.gis, self.user.username, folder_id,
+                                                      self.page_size, self.governor, self.metrics,
+                                                      self.profiler)}
+            removed = self.manifest.remove_items(known_ids - remote_ids)
+            self._removed_count += len(removed)
+            if removed:
+                logger.info(f"Eliminados localmente {len(removed)} elementos borrados en ArcGIS")
+
+        self._save_delta_state(remote_ids, max([since] + [m for m in self._remote_items.values() if m is not None]))
+        return total_count
+
+    def _save_delta_state(self, remote_ids, high_water_mark):
+        # Si algún elemento no se pudo descargar, la marca se queda por debajo de él
+        # para que la siguiente ejecución delta lo vuelva a pedir
+        failed = [self._remote_items.get(item_id) for item_id in self.retry_queue.exhausted]
+        failed = [modified for modified in failed if modified is not None]
+        if failed and high_water_mark is not None:
+            high_water_mark = min(high_water_mark, min(failed) - 1)
+        self.state.set_meta(REMOTE_IDS_KEY, json.dumps(sorted(remote_ids)))
+        if high_water_mark is not None:
+            self.state.set_meta(HIGH_WATER_MARK_KEY, high_water_mark)
+
 if __name__ == "__main__":
     try:
         # Se requiere instalar python-dotenv: pip install python-dotenv
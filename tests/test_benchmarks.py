@@ -0,0 +1,59 @@
+import pytest
+from pathlib import Path
+
+# Importar las clases a probar
+from benchmarks.fake_portal import FakeGIS, FakePortal
+from benchmarks.run_benchmarks import bench_sync_down, bench_upload_handler, run
+
+@pytest.fixture
+def portal():
+    with FakePortal(items=7, folders=2, item_size=1000) as portal:
+        yield portal
+
+# Test 1: El portal simulado exige un token válido
+def test_fake_portal_requires_token(portal):
+    with pytest.raises(Exception, match="Error Code: 400"):
+        FakeGIS(portal.url, portal.username, "wrong")
+
+    gis = FakeGIS(portal.url, portal.username, portal.password)
+    assert [folder['title'] for folder in gis.users.me.folders] == ['Folder1', 'Folder2']
+    gis.session.params = {}
+    with pytest.raises(Exception, match="Error Code: 498"):
+        gis._con.get(f"{gis._portal.resturl}search", {'q': 'owner:bench_user'})
+
+# Test 2: sync_down descarga todo el contenido simulado, en su carpeta y con sus datos
+def test_bench_sync_down(portal, tmp_path):
+    result = bench_sync_down(portal, str(tmp_path))
+
+    assert result['items'] == 7
+    assert result['items_per_s'] > 0
+    item = next(item for item in portal.items.values() if item['ownerFolder'] is not None)
+    folder = portal.folders[item['ownerFolder']]['title']
+    assert Path(tmp_path, folder, item['name']).read_bytes() == FakePortal.item_data(item['id'], 1000)
+
+# Test 3: Las subidas de UploadHandler llegan al portal
+def test_bench_upload_handler(tmp_path):
+    with FakePortal(items=0, folders=2) as portal:
+        result = bench_upload_handler(portal, str(tmp_path), events=6, file_size=500)
+        assert result['failed'] == 0
+        assert len(portal.items) == 6
+        assert {item['ownerFolder'] for item in portal.items.values()} == {None} | set(portal.folders)
+    assert result['latency_max_ms'] >= result['latency_p50_ms'] > 0
+
+# Test 4: Por lotes, la carpeta se resuelve una vez y las subidas necesitan menos peticiones
+def test_bench_upload_batch(tmp_path):
+    with FakePortal(items=0, folders=1) as portal:
+        one_by_one = bench_upload_handler(portal, str(tmp_path / "single"), events=8, file_size=500)
+    with FakePortal(items=0, folders=1) as portal:
+        batched = bench_upload_handler(portal, str(tmp_path / "batch"), events=8, file_size=500, create_window=0.1)
+        assert batched['failed'] == 0
+        assert {item['ownerFolder'] for item in portal.items.values()} == {None} | set(portal.folders)
+    assert batched['requests'] < one_by_one['requests']
+
+# Test 5: Ejecución completa a pequeña escala
+def test_run_benchmarks(tmp_path):
+    results = run([3], latency=0, item_size=100, folders=1, workdir=str(tmp_path))
+    assert [(r['benchmark'], r['items']) for r in results] == [('sync_down', 3), ('upload_handler', 3),
+                                                                ('upload_batch', 3), ('delete_handler', 3)]
+    # Las tres eliminaciones viajan en una sola petición deleteItems
+    assert results[-1]['requests'] == 1
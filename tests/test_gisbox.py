@@ -0,0 +1,118 @@
+import pytest
+import os
+import sys
+import json
+import time
+import subprocess
+from pathlib import Path
+
+# Importar la CLI a probar
+import gisbox
+from gisbox_state import StateStore
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+# Presupuesto de arranque de las rutas que solo importan módulos (sin conectarse a
+# ArcGIS). Importar `arcgis.gis` cuesta por sí solo más de un segundo.
+IMPORT_BUDGET_SECONDS = 1.0
+
+def run_python(code, **env):
+    """
+    Ejecuta `code` en un intérprete nuevo (sin módulos ya importados por pytest).
+    """
+    return subprocess.run([sys.executable, '-c', code], cwd=REPO_DIR, capture_output=True, text=True,
+                          env=dict(os.environ, **env), timeout=60)
+
+# Fixture para simular el entorno de trabajo
+@pytest.fixture
+def mock_cli_env(mocker, tmp_path):
+    mocker.patch('gisbox.load_dotenv')
+    mocker.patch.dict(os.environ, {"LOCAL_SYNC_DIR": str(tmp_path), "SYNC_MODE": "incremental"})
+    return tmp_path
+
+# Test 1: Importar los puntos de entrada no carga la API de ArcGIS y cabe en el presupuesto
+def test_import_only_paths_stay_within_budget():
+    code = ("import sys, time\n"
+            "started = time.perf_counter()\n"
+            "import gisbox, gisbox_sync, gisbox_monitor, gisbox_daemon\n"
+            "print(time.perf_counter() - started, 'arcgis' in sys.modules)")
+    # El mejor de tres intentos, para no depender de la carga puntual de la máquina
+    results = [run_python(code).stdout.split() for _ in range(3)]
+    assert all(loaded == 'False' for _, loaded in results)
+    assert min(float(seconds) for seconds, _ in results) < IMPORT_BUDGET_SECONDS
+
+# Test 2: --help responde sin importar nada pesado
+def test_help_is_fast():
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, 'gisbox.py', '--help'], cwd=REPO_DIR, capture_output=True,
+                            text=True, timeout=60)
+    assert result.returncode == 0
+    assert 'status' in result.stdout and 'plan' in result.stdout
+    assert time.perf_counter() - started < IMPORT_BUDGET_SECONDS + 0.5
+
+# Test 3: Un .env incompleto se detecta antes de importar la API de ArcGIS
+def test_config_error_before_heavy_imports():
+    result = run_python("import sys, gisbox\n"
+                        "code = gisbox.main(['sync'])\n"
+                        "print(code, 'arcgis' in sys.modules)", LOCAL_SYNC_DIR="")
+    assert result.stdout.split() == ['2', 'False']
+    assert "LOCAL_SYNC_DIR" in result.stderr
+
+# Test 4: status resume el estado guardado sin conectarse a ArcGIS
+def test_status_reports_saved_state(mock_cli_env, capsys):
+    state = StateStore.for_sync_dir(mock_cli_env)
+    state.upsert("a.csv", item_id="1", sync_status='downloaded')
+    state.upsert("b.csv", item_id="2", sync_status='downloaded')
+    state.upsert("Folder/c.pdf", item_id="3", sync_status='uploaded')
+    state.set_meta('delta_high_water_mark', 1700000000000)
+    state.save_upload_session("big.zip", {'item_id': '4', 'parts_done': [1]})
+    state.close()
+
+    assert gisbox.main(['status', '--json']) == 0
+    status = json.loads(capsys.readouterr().out)
+    assert status['items'] == 3
+    assert status['by_status'] == {'downloaded': 2, 'uploaded': 1}
+    assert status['delta_high_water_mark'] == 1700000000000
+    assert status['pending_multipart_uploads'] == 1
+
+# Test 5: plan y --mode usan GISBoxSync sin descargar nada, con el estado en solo lectura
+def test_plan_command(mock_cli_env, mocker, capsys):
+    StateStore.for_sync_dir(mock_cli_env).close()
+    sync_class = mocker.patch('gisbox_sync.GISBoxSync')
+    sync_tool = sync_class.return_value
+    sync_tool.local_sync_dir = str(mock_cli_env)
+    sync_tool.plan.return_value = {'download': [{'id': '1', 'folder': 'F', 'title': 'new', 'type': 'CSV', 'size': 5}],
+                                   'remove': ['old.pdf'], 'unchanged': 7, 'reset': False}
+
+    assert gisbox.main(['plan', '--mode', 'delta']) == 0
+    assert os.environ["SYNC_MODE"] == 'delta'
+    sync_tool.sync_down.assert_not_called()
+    assert sync_class.call_args.kwargs['state'].read_only
+    sync_tool.state.close.assert_called_once()
+    output = capsys.readouterr().out
+    assert "+ F/new (CSV, 5 bytes)" in output
+    assert "- old.pdf" in output
+    assert "1 descargas, 1 eliminaciones locales, 7 elementos al día" in output
+
+# Test 6: Sin estado guardado, status y plan no crean nada en LOCAL_SYNC_DIR
+def test_status_and_plan_without_state(mock_cli_env, mocker, capsys):
+    sync_class = mocker.patch('gisbox_sync.GISBoxSync')
+    assert gisbox.main(['status']) == 0
+    assert "Aún no hay estado guardado" in capsys.readouterr().out
+    assert gisbox.main(['plan']) == 0
+    sync_class.assert_not_called()
+    assert list(mock_cli_env.iterdir()) == []
+
+# Test 7: sync --profile escribe la traza de la ejecución
+def test_sync_profile_writes_trace(mock_cli_env, mocker):
+    sync_class = mocker.patch('gisbox_sync.GISBoxSync')
+    sync_tool = sync_class.return_value
+    sync_tool.sync_mode = 'incremental'
+    sync_class.side_effect = lambda profiler: setattr(sync_tool, 'profiler', profiler) or sync_tool
+    trace_path = mock_cli_env / "trace.json"
+
+    assert gisbox.main(['sync', '--profile', str(trace_path)]) == 0
+    sync_tool.sync_down.assert_called_once()
+    events = json.loads(trace_path.read_text(encoding='utf-8'))['traceEvents']
+    assert [event['name'] for event in events if event['ph'] == 'X'] == ['sync_down']
+    # --cprofile sin --profile es un error de uso
+    assert gisbox.main(['sync', '--cprofile']) == 2
@@ -0,0 +1,105 @@
+import pytest
+import os
+import shutil
+import requests
+from pathlib import Path
+from unittest.mock import MagicMock
+
+# Importar las clases a probar
+from gisbox_daemon import GISBoxDaemon, configure_connection_pool
+
+# Fixture para simular el entorno de trabajo
+@pytest.fixture
+def mock_daemon_env(mocker):
+    # Mockear la carga de variables de entorno
+    for module in ('gisbox_daemon', 'gisbox_sync', 'gisbox_monitor'):
+        mocker.patch(f'{module}.load_dotenv')
+    mocker.patch.dict(os.environ, {
+        "ARCGIS_URL": "https://test.arcgis.com",
+        "ARCGIS_USERNAME": "test_user",
+        "ARCGIS_PASSWORD": "test_password",
+        "ARCGIS_PROFILE": "",
+        "LOCAL_SYNC_DIR": "/tmp/gisbox_daemon_test",
+        "SYNC_MODE": "backup",
+        "HTTP_POOL_SIZE": "",
+    })
+    test_dir = Path("/tmp/gisbox_daemon_test")
+    if test_dir.exists():
+        shutil.rmtree(test_dir)
+    test_dir.mkdir(parents=True, exist_ok=True)
+    yield
+    if test_dir.exists():
+        shutil.rmtree(test_dir)
+
+# Fixture con una sesión HTTP real (adaptador compartido por http:// y https://, como EsriSession)
+@pytest.fixture
+def mock_gis(mocker):
+    gis = MagicMock()
+    gis.properties.name = "Test Org"
+    gis.users.me.username = "test_user"
+    gis._con.get.return_value = {'items': [], 'nextStart': -1}
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    gis.session = session
+    sync_gis = mocker.patch('gisbox_sync.GIS', return_value=gis)
+    monitor_gis = mocker.patch('gisbox_monitor.GIS', return_value=gis)
+    return gis, sync_gis, monitor_gis
+
+def test_daemon_shares_session_governor_and_state(mock_daemon_env, mock_gis):
+    gis, sync_gis, monitor_gis = mock_gis
+    daemon = GISBoxDaemon()
+
+    # Un único inicio de sesión, reutilizado por el monitor
+    sync_gis.assert_called_once()
+    monitor_gis.assert_not_called()
+    assert daemon.sync.gis is daemon.monitor.gis is gis
+    assert daemon.sync.governor is daemon.monitor.governor is daemon.governor
+    assert daemon.sync.state is daemon.monitor.state is daemon.state
+    # El modo backup no tiene sentido con el monitor vigilando el directorio
+    assert daemon.sync.sync_mode == 'incremental'
+
+    # Pool por defecto: una conexión por hilo de trabajo
+    expected = (daemon.sync.max_workers + daemon.sync.folder_workers
+                + (daemon.monitor.upload_workers + daemon.monitor.create_workers)
+                * daemon.monitor.multipart_workers)
+    assert daemon.pool_size == expected
+    assert gis.session.adapters['https://']._pool_maxsize == expected
+    daemon.state.close()
+
+def test_configure_connection_pool_resizes_in_place():
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    gis = MagicMock()
+    gis.session = session
+
+    configure_connection_pool(gis, 24)
+
+    # Se reconfigura el mismo adaptador, sin montar otros
+    assert session.adapters['https://'] is adapter
+    assert adapter._pool_maxsize == 24
+    assert adapter.poolmanager.connection_pool_kw['maxsize'] == 24
+    assert adapter.poolmanager.pools._maxsize == 24
+    # El tamaño se conserva al serializar el adaptador
+    assert adapter.__getstate__()['_pool_maxsize'] == 24
+
+def test_daemon_run_schedules_sync_and_stops(mock_daemon_env, mock_gis, mocker):
+    mocker.patch.dict(os.environ, {"HTTP_POOL_SIZE": "4"})
+    daemon = GISBoxDaemon()
+    assert daemon.pool_size == 4
+    start = mocker.patch.object(daemon.monitor, 'start')
+    tick = mocker.patch.object(daemon.monitor, 'tick')
+    stop = mocker.patch.object(daemon.monitor, 'stop')
+    sync_down = mocker.patch.object(daemon.sync, 'sync_down', side_effect=Exception("portal caído"))
+    mocker.patch('gisbox_daemon.time.sleep', side_effect=[None, None, KeyboardInterrupt])
+
+    daemon.run()
+
+    start.assert_called_once()
+    assert tick.call_count == 2
+    # Primera pasada al arrancar; el intervalo aún no ha vencido para la segunda
+    sync_down.assert_called_once()
+    stop.assert_called_once()
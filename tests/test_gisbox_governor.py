@@ -0,0 +1,125 @@
+import pytest
+import time
+import threading
+import requests
+from unittest.mock import MagicMock
+
+# Importar las clases a probar
+from gisbox_governor import RequestGovernor, RetryQueue, classify_error
+
+def http_error(status, retry_after=None):
+    response = requests.Response()
+    response.status_code = status
+    if retry_after is not None:
+        response.headers['Retry-After'] = retry_after
+    return requests.HTTPError(f"{status} Error", response=response)
+
+# Test 1: Clasificación de errores del portal
+def test_classify_error():
+    assert classify_error(http_error(429, "7")) == (True, True, 7.0)
+    assert classify_error(http_error(502)) == (False, True, None)
+    assert classify_error(http_error(404)) == (False, False, None)
+    assert classify_error(requests.ConnectionError("reset")) == (False, True, None)
+    # La API de ArcGIS devuelve el código dentro del mensaje
+    assert classify_error(Exception("Too many requests. Error Code: 429")) == (True, True, None)
+    assert classify_error(Exception("Item does not exist")) == (False, False, None)
+
+# Test 2: Reintentos con espera exponencial de los errores transitorios
+def test_governor_retries_transient_errors(mocker):
+    sleep = mocker.patch('gisbox_governor.time.sleep')
+    governor = RequestGovernor(max_retries=3)
+    func = MagicMock(side_effect=[requests.ConnectionError("reset"), http_error(500), "ok"])
+
+    assert governor.call(func, 'a', key='b') == "ok"
+    assert func.call_count == 3
+    func.assert_called_with('a', key='b')
+    assert sleep.call_count == 2
+    assert governor.retry_count == 2
+
+    # Un error no transitorio no se reintenta
+    func = MagicMock(side_effect=ValueError("bad"))
+    with pytest.raises(ValueError):
+        governor.call(func)
+    assert func.call_count == 1
+
+# Test 3: Una petición no idempotente (creación) solo se reintenta si el portal pidió frenar
+def test_governor_does_not_retry_non_idempotent_requests(mocker):
+    mocker.patch('gisbox_governor.time.sleep')
+    governor = RequestGovernor(max_retries=3, base_delay=0)
+    func = MagicMock(side_effect=requests.Timeout("read timed out"))
+    with pytest.raises(requests.Timeout):
+        governor.call(func, idempotent=False)
+    assert func.call_count == 1
+
+    # Un 429 indica que la petición no se aplicó
+    func = MagicMock(side_effect=[http_error(429), "created"])
+    assert governor.call(func, idempotent=False) == "created"
+    assert func.call_count == 2
+
+# Test 4: AIMD y Retry-After
+def test_governor_aimd_and_retry_after():
+    governor = RequestGovernor(max_concurrency=8, max_retries=0, base_delay=0)
+
+    with pytest.raises(requests.HTTPError):
+        governor.call(MagicMock(side_effect=http_error(429, "30")))
+    # Reducción multiplicativa y pausa global hasta que pase el Retry-After
+    assert governor.limit == 4
+    assert governor.throttle_count == 1
+    assert governor._resume_at > time.monotonic() + 25
+
+    # Aumento aditivo: +1 tras una ventana completa de respuestas correctas
+    governor._resume_at = 0
+    for _ in range(4):
+        governor.call(lambda: None)
+    assert governor.limit == pytest.approx(5)
+
+    # Una respuesta lenta también cuenta como congestión (salvo en transferencias)
+    governor.latency_target = 0.01
+    governor.call(time.sleep, 0.02, timed=False)
+    assert governor.limit > 5
+    governor.call(time.sleep, 0.02)
+    assert governor.limit == pytest.approx(2.5, abs=0.5)
+
+# Test 5: Nunca hay más peticiones en curso que el límite
+def test_governor_limits_concurrency():
+    governor = RequestGovernor(max_concurrency=2, latency_target=0)
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def request():
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.02)
+        with lock:
+            active[0] -= 1
+
+    threads = [threading.Thread(target=governor.call, args=(request,)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 2
+    assert governor.in_flight == 0
+
+# Test 6: Cola de reintentos
+def test_retry_queue(mocker):
+    governor = RequestGovernor()
+    mocker.patch.object(governor, 'backoff', return_value=0)
+    queue = RetryQueue(governor, max_attempts=2)
+    func = MagicMock()
+
+    assert queue.add('a', func, 1, error="x")
+    assert queue.next_due() == 0
+    assert queue.pop_due() == [('a', func, (1,))]
+    # La entrada sigue contando intentos mientras se reintenta
+    assert queue.next_due() is None
+    assert queue.add('a', func, 1)
+    assert queue.pop_due() == [('a', func, (1,))]
+    assert not queue.add('a', func, 1)
+    assert len(queue) == 0
+    assert queue.exhausted == {'a'}
+
+    queue.add('b', func)
+    queue.discard('b')
+    assert queue.pop_due() == []
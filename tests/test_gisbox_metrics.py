@@ -0,0 +1,81 @@
+import pytest
+import os
+import urllib.request
+import urllib.error
+
+# Importar las clases a probar
+from gisbox_metrics import NULL_METRICS, Metrics, MetricsServer, start_metrics_server
+
+# Test 1: Contadores, histogramas e indicadores en el formato de texto de Prometheus
+def test_render_prometheus_format():
+    metrics = Metrics(buckets=(0.1, 1.0))
+    metrics.observe('download', 0.05)
+    metrics.observe('download', 0.5)
+    metrics.observe('download', 5.0, 'error')
+    metrics.add_bytes('download', 2048)
+    metrics.count('items', result='unchanged')
+    metrics.gauge('upload_queue_depth', lambda: 3)
+
+    text = metrics.render()
+    assert 'gisbox_operations_total{operation="download",result="ok"} 2' in text
+    assert 'gisbox_operations_total{operation="download",result="error"} 1' in text
+    assert 'gisbox_operation_seconds_bucket{operation="download",le="0.1"} 1' in text
+    assert 'gisbox_operation_seconds_bucket{operation="download",le="1"} 2' in text
+    assert 'gisbox_operation_seconds_bucket{operation="download",le="+Inf"} 3' in text
+    assert 'gisbox_operation_seconds_count{operation="download"} 3' in text
+    assert 'gisbox_bytes_total{direction="download"} 2048' in text
+    assert 'gisbox_items_total{result="unchanged"} 1' in text
+    assert '# TYPE gisbox_upload_queue_depth gauge\ngisbox_upload_queue_depth 3' in text
+
+# Test 2: El temporizador registra la duración y marca como error las excepciones
+def test_timer_records_errors():
+    metrics = Metrics()
+    with metrics.time('upload'):
+        pass
+    with pytest.raises(RuntimeError):
+        with metrics.time('upload'):
+            raise RuntimeError("fallo")
+    snapshot = metrics.snapshot()
+    assert snapshot['results'] == {('upload', 'ok'): 1, ('upload', 'error'): 1}
+
+# Test 3: El resumen solo incluye lo ocurrido desde la instantánea
+def test_summary_since_snapshot():
+    metrics = Metrics()
+    metrics.observe('download', 0.2)
+    metrics.add_bytes('download', 1024 * 1024)
+    since = metrics.snapshot()
+    metrics.observe('download', 0.4)
+    metrics.observe('zip', 1.0)
+    metrics.add_bytes('download', 3 * 1024 * 1024)
+
+    lines = metrics.summary(since=since)
+    assert any(line.startswith("  download: 1 operaciones, 0.40 s en total") for line in lines)
+    assert any(line.startswith("  zip: 1 operaciones") for line in lines)
+    assert "  bytes (direction=download): 3.00 MB" in lines
+
+# Test 4: Sin METRICS_ENABLED no se registra nada ni se arranca el servidor
+def test_disabled_metrics_are_no_op(mocker):
+    mocker.patch.dict(os.environ, {"METRICS_ENABLED": "", "METRICS_PORT": "9100"})
+    metrics = Metrics.from_env()
+    assert metrics is NULL_METRICS
+    with metrics.time('download'):
+        metrics.count('items', result='downloaded')
+    assert metrics.summary(since=metrics.snapshot()) == []
+    assert start_metrics_server(metrics) is None
+
+    mocker.patch.dict(os.environ, {"METRICS_ENABLED": "true"})
+    assert Metrics.from_env().enabled
+
+# Test 5: El servidor expone /metrics en un puerto local
+def test_metrics_server():
+    metrics = Metrics()
+    metrics.count('events', action='modified')
+    server = MetricsServer(metrics, 0).start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics", timeout=5) as response:
+            assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+            assert 'gisbox_events_total{action="modified"} 1' in response.read().decode('utf-8')
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"http://127.0.0.1:{server.port}/", timeout=5)
+    finally:
+        server.stop()
@@ -1,12 +1,19 @@
 import pytest
 import os
 import shutil
+import threading
+import time
+import requests
 from pathlib import Path
 from unittest.mock import MagicMock, patch
-from watchdog.events import FileSystemEvent
+from watchdog.events import FileMovedEvent, FileSystemEvent
 
 # Importar las clases a probar
-from gisbox_monitor import GISBoxMonitor, UploadHandler, logger
+from gisbox_monitor import (EventDebouncer, FingerprintCache, GISBoxMonitor, ItemIndex, MultipartUploader,
+                            TombstoneQueue, UploadBatcher, UploadHandler, UploadQueue, logger)
+from gisbox_governor import RequestGovernor
+from gisbox_metrics import Metrics
+from gisbox_state import StateStore
 
 # Fixture para simular el entorno de trabajo
 @pytest.fixture
@@ -44,7 +51,10 @@ def mock_gis_monitor(mocker):
     # Mockear el usuario
     mock_user = MagicMock()
     mock_user.username = "test_user"
+    mock_user.folders = []
     mock_gis.users.me = mock_user
+    # Listado de contenido vacío (construcción del índice local)
+    mock_gis._con.get.return_value = {'items': [], 'nextStart': -1}
     
     mocker.patch('gisbox_monitor.GIS', return_value=mock_gis)
     
@@ -67,8 +77,7 @@ def test_get_arcgis_folder_subfolder(handler):
 
 def test_upload_file_new(handler, mock_gis_monitor, mocker, mock_monitor_env):
     mock_gis, mock_user = mock_gis_monitor
-    mock_gis.content.search.return_value = [] # No existe
-    mock_gis.content.add.return_value = MagicMock(title="New File")
+    mock_gis.content.add.return_value = MagicMock(title="New File", id="new_id")
     
     file_path = Path("/tmp/gisbox_monitor_test/new_file.csv")
     file_path.touch()
@@ -76,14 +85,17 @@ def test_upload_file_new(handler, mock_gis_monitor, mocker, mock_monitor_env):
     with patch.object(logger, 'info') as mock_info:
         handler._upload_file(str(file_path))
         
-    mock_gis.content.search.assert_called_once()
+    mock_gis.content.search.assert_not_called()
     mock_gis.content.add.assert_called_once()
     mock_info.assert_any_call('  [SUBIENDO] Nuevo archivo: new_file.csv...')
+    # El nuevo elemento queda indexado
+    assert handler.index.get("new_file.csv") == "new_id"
 
 def test_upload_file_update(handler, mock_gis_monitor, mocker, mock_monitor_env):
     mock_gis, mock_user = mock_gis_monitor
     mock_item = MagicMock(title="Existing File", update=MagicMock())
-    mock_gis.content.search.return_value = [mock_item] # Existe
+    mock_gis.content.get.return_value = mock_item # Existe
+    handler.index.set("Existing File.csv", "existing_id")
     
     file_path = Path("/tmp/gisbox_monitor_test/Existing File.csv")
     file_path.touch()
@@ -91,24 +103,52 @@ def test_upload_file_update(handler, mock_gis_monitor, mocker, mock_monitor_env)
     with patch.object(logger, 'info') as mock_info:
         handler._upload_file(str(file_path))
         
-    mock_gis.content.search.assert_called_once()
+    mock_gis.content.search.assert_not_called()
+    mock_gis.content.get.assert_called_once_with("existing_id")
     mock_item.update.assert_called_once()
     mock_info.assert_any_call('  [ACTUALIZANDO] Existing File...')
 
 def test_delete_item_exists(handler, mock_gis_monitor, mocker, mock_monitor_env):
     mock_gis, mock_user = mock_gis_monitor
-    mock_item = MagicMock(title="FileToDelete", delete=MagicMock())
-    mock_gis.content.search.return_value = [mock_item] # Existe
+    mock_gis._portal.resturl = "https://test.arcgis.com/sharing/rest/"
+    mock_gis._con.post.return_value = {'results': [{'itemId': 'delete_id', 'success': True}]}
+    handler.index.set("FileToDelete.csv", "delete_id")
     
+    # El evento llega cuando el archivo ya no existe
     file_path = Path("/tmp/gisbox_monitor_test/FileToDelete.csv")
-    file_path.touch() # Crear el archivo para que is_file() sea True
     
     with patch.object(logger, 'info') as mock_info:
         handler._delete_item(str(file_path))
         
-    mock_gis.content.search.assert_called_once()
-    mock_item.delete.assert_called_once()
+    # El id sale del índice local: ni búsqueda ni consulta del elemento
+    mock_gis.content.search.assert_not_called()
+    mock_gis.content.get.assert_not_called()
+    mock_gis._con.post.assert_called_once_with(
+        "https://test.arcgis.com/sharing/rest/content/users/test_user/deleteItems",
+        {'f': 'json', 'items': 'delete_id'})
     mock_info.assert_any_call('  [ELIMINADO] FileToDelete de ArcGIS.')
+    assert handler.index.get("FileToDelete.csv") is None
+
+def test_delete_unsynced_path_is_ignored(handler, mock_gis_monitor, mock_monitor_env):
+    mock_gis, _ = mock_gis_monitor
+    # Carpeta o archivo que nunca llegó a ArcGIS
+    handler._delete_item("/tmp/gisbox_monitor_test/TestFolder")
+    mock_gis._con.post.assert_not_called()
+
+def test_upload_file_stale_index_entry(handler, mock_gis_monitor, mock_monitor_env):
+    mock_gis, mock_user = mock_gis_monitor
+    # El elemento indexado ya no existe en ArcGIS: se sube como nuevo
+    mock_gis.content.get.return_value = None
+    mock_gis.content.add.return_value = MagicMock(title="Stale", id="new_id")
+    handler.index.set("TestFolder/Stale.csv", "old_id")
+
+    file_path = Path("/tmp/gisbox_monitor_test/TestFolder/Stale.csv")
+    file_path.touch()
+    handler._upload_file(str(file_path))
+
+    mock_gis.content.add.assert_called_once()
+    assert mock_gis.content.add.call_args.kwargs['folder'] == "TestFolder"
+    assert handler.index.get("TestFolder/Stale.csv") == "new_id"
 
 def test_on_created_file(handler, mocker):
     mock_upload = mocker.patch.object(handler, '_upload_file')
@@ -131,6 +171,510 @@ def test_on_modified_file(handler, mocker):
     handler.on_modified(event)
     mock_upload.assert_called_once_with("/tmp/gisbox_monitor_test/modified.txt")
 
+def synced_file(handler, relative_path, content, item_id):
+    """Crea un archivo local y lo registra como ya sincronizado con `item_id`."""
+    file_path = Path("/tmp/gisbox_monitor_test", relative_path)
+    file_path.write_bytes(content)
+    handler.index.set(handler._index_key(file_path), item_id)
+    key = handler._relative_key(file_path)
+    handler.fingerprints.record(key, handler.fingerprints.compute(key, file_path))
+    return file_path
+
+def test_move_item_rename_updates_title_only(mock_gis_monitor, mock_monitor_env):
+    mock_gis, _ = mock_gis_monitor
+    mock_item = MagicMock(title="old", id="item1", type='CSV', modified=1000)
+    renamed_item = MagicMock(title="new", id="item1", type='CSV', modified=2000)
+    mock_gis.content.get.side_effect = [mock_item, renamed_item]
+    state = StateStore.for_sync_dir("/tmp/gisbox_monitor_test")
+    handler = UploadHandler(mock_gis, "/tmp/gisbox_monitor_test", state=state, fingerprints=FingerprintCache(state))
+    src = synced_file(handler, "TestFolder/old.csv", b"a,b", "item1")
+    dest = src.with_name("new.csv")
+    src.rename(dest)
+
+    handler._move_item(str(src), str(dest))
+
+    mock_item.update.assert_called_once_with(item_properties={'title': 'new'})
+    mock_item.move.assert_not_called()
+    mock_gis.content.add.assert_not_called()
+    assert handler.index.get("TestFolder/old.csv") is None
+    assert handler.index.get("TestFolder/new.csv") == "item1"
+    # La fila guarda el elemento tras el cambio: sync_down no vuelve a descargarlo
+    row = state.get("TestFolder/new.csv")
+    assert (row['remote_modified'], row['title'], row['folder']) == (2000, "new", "TestFolder")
+    assert state.get("TestFolder/old.csv") is None
+    state.close()
+
+def test_move_item_across_folders(handler, mock_gis_monitor, mock_monitor_env):
+    mock_gis, mock_user = mock_gis_monitor
+    mock_user.folders = [{'title': 'TestFolder', 'id': 'f1'}]
+    mock_item = MagicMock(title="data", id="item1")
+    mock_gis.content.get.return_value = mock_item
+    src = synced_file(handler, "data.csv", b"a,b", "item1")
+    dest = Path("/tmp/gisbox_monitor_test/TestFolder/data.csv")
+    src.rename(dest)
+
+    handler._move_item(str(src), str(dest))
+
+    mock_item.move.assert_called_once_with({'id': 'f1'})
+    mock_item.update.assert_not_called()
+    assert handler.index.get("TestFolder/data.csv") == "item1"
+    # El elemento se vuelve a leer tras moverlo
+    assert mock_gis.content.get.call_count == 2
+
+def test_on_moved_dispatches_move(handler, mocker):
+    mock_move = mocker.patch.object(handler, '_move_item')
+    handler.on_moved(FileMovedEvent("/tmp/gisbox_monitor_test/a.csv", "/tmp/gisbox_monitor_test/b.csv"))
+    mock_move.assert_called_once_with("/tmp/gisbox_monitor_test/a.csv", "/tmp/gisbox_monitor_test/b.csv")
+
+def test_delete_and_create_with_same_content_is_a_move(mock_gis_monitor, mock_monitor_env):
+    gis, _ = mock_gis_monitor
+    handler = UploadHandler(gis, "/tmp/gisbox_monitor_test", debounce_seconds=1, move_window=3)
+    emitted = []
+    handler.debouncer.emit = lambda *operation: emitted.append(operation)
+    src = synced_file(handler, "old.csv", b"same content", "item1")
+    dest = Path("/tmp/gisbox_monitor_test/TestFolder/new.csv")
+    src.rename(dest)
+
+    handler.debouncer.push('delete', str(src), now=0)
+    handler.debouncer.push('upload', str(dest), now=0.1)
+    assert handler.debouncer.flush_ready(now=1.5) == []    # primera comprobación del destino
+    handler.debouncer.flush_ready(now=2)
+
+    assert emitted == [('move', str(dest), str(src))]
+
+def test_debouncer_move_then_modify_stays_a_move(mock_monitor_env):
+    debouncer = EventDebouncer(lambda *operation: None, quiet_seconds=1)
+    dest = Path("/tmp/gisbox_monitor_test/b.csv")
+    dest.write_text("x")
+    debouncer.push('move', str(dest), now=0, moved_from="/tmp/gisbox_monitor_test/a.csv")
+    debouncer.push('upload', str(dest), now=0.5)
+
+    debouncer.flush_ready(now=2)
+    assert debouncer.flush_ready(now=3) == [('move', str(dest), "/tmp/gisbox_monitor_test/a.csv")]
+
+def test_debouncer_hashes_move_candidates_without_blocking_push(mock_monitor_env):
+    hashing, release = threading.Event(), threading.Event()
+    def find_moved_from(new_path, deleted_paths):
+        # Simula el hash de un archivo grande
+        hashing.set()
+        release.wait(5)
+        return deleted_paths[0]
+    debouncer = EventDebouncer(lambda *operation: None, quiet_seconds=1, move_window=5,
+                               find_moved_from=find_moved_from)
+    old, new, other = (f"/tmp/gisbox_monitor_test/{name}.csv" for name in ("old", "new", "other"))
+    Path(new).write_text("x")
+    debouncer.push('delete', old, now=0)
+    debouncer.push('upload', new, now=0)
+    debouncer.flush_ready(now=2)                    # Primera comprobación del tamaño
+
+    results = []
+    flusher = threading.Thread(target=lambda: results.append(debouncer.flush_ready(now=3)), daemon=True)
+    flusher.start()
+    assert hashing.wait(5)
+    # El observador puede seguir registrando eventos mientras se calcula el hash
+    pusher = threading.Thread(target=debouncer.push, args=('upload', other), daemon=True)
+    pusher.start()
+    pusher.join(timeout=1)
+    assert not pusher.is_alive()
+    release.set()
+    flusher.join(timeout=5)
+    assert results == [[('move', new, old)]]
+
+def test_debouncer_rechecks_candidate_after_hashing(mock_monitor_env):
+    calls = []
+    def find_moved_from(new_path, deleted_paths):
+        calls.append(new_path)
+        if len(calls) == 1:
+            # Llega otro evento de la misma ruta (desde el observador) mientras se calcula el hash
+            pusher = threading.Thread(target=debouncer.push, args=('upload', new_path, 3), daemon=True)
+            pusher.start()
+            pusher.join(timeout=1)
+        return deleted_paths[0]
+    debouncer = EventDebouncer(lambda *operation: None, quiet_seconds=1, move_window=10,
+                               find_moved_from=find_moved_from)
+    old, new = "/tmp/gisbox_monitor_test/old.csv", "/tmp/gisbox_monitor_test/new.csv"
+    Path(new).write_text("x")
+    debouncer.push('delete', old, now=0)
+    debouncer.push('upload', new, now=0)
+    debouncer.flush_ready(now=2)
+    # El resultado del hash ya no vale: nada se emite y la ruta se vuelve a comprobar
+    assert debouncer.flush_ready(now=3) == []
+    debouncer.flush_ready(now=4.5)
+    assert debouncer.flush_ready(now=5) == [('move', new, old)]
+    assert len(calls) == 2
+
+def test_reconcile_dispatches_only_real_differences(handler, mock_monitor_env, mocker):
+    unchanged = synced_file(handler, "TestFolder/unchanged.csv", b"a", "item1")
+    modified = synced_file(handler, "modified.csv", b"b", "item2")
+    modified.write_bytes(b"bb")
+    deleted = synced_file(handler, "deleted.csv", b"c", "item3")
+    deleted.unlink()
+    new_file = Path("/tmp/gisbox_monitor_test/TestFolder/new.csv")
+    new_file.write_bytes(b"d")
+    internal = Path("/tmp/gisbox_monitor_test/.gisbox/fingerprints.json")
+    internal.parent.mkdir()
+    internal.write_text("{}")
+    mock_dispatch = mocker.patch.object(handler, '_dispatch_action')
+
+    assert handler.reconcile() == (2, 1)
+
+    dispatched = sorted(c.args for c in mock_dispatch.call_args_list)
+    assert dispatched == sorted([('delete', str(deleted)), ('upload', str(modified)), ('upload', str(new_file))])
+    assert str(unchanged) not in [c.args[1] for c in mock_dispatch.call_args_list]
+
+def test_reconcile_does_not_reupload_remote_deletes(mock_gis_monitor, mock_monitor_env, mocker):
+    mock_gis, _ = mock_gis_monitor
+    state = StateStore.for_sync_dir("/tmp/gisbox_monitor_test")
+    handler = UploadHandler(mock_gis, "/tmp/gisbox_monitor_test", state=state, fingerprints=FingerprintCache(state))
+    # Sincronizados antes; sus elementos se eliminaron en ArcGIS con el monitor detenido
+    for name, content, item_id in [("gone.csv", b"a", "item1"), ("touched.csv", b"b", "item2"),
+                                   ("edited.csv", b"c", "item3")]:
+        file_path = synced_file(handler, name, content, item_id)
+        handler.fingerprints.record(name, handler.fingerprints.compute(name, file_path), item_id=item_id)
+        handler.index.pop(name)
+    touched = Path("/tmp/gisbox_monitor_test/touched.csv")
+    os.utime(touched, ns=(touched.stat().st_atime_ns, touched.stat().st_mtime_ns + 10**9))
+    edited = Path("/tmp/gisbox_monitor_test/edited.csv")
+    edited.write_bytes(b"cc")
+    mock_dispatch = mocker.patch.object(handler, '_dispatch_action')
+
+    assert handler.reconcile() == (1, 0)
+
+    # Solo el archivo cuyo contenido cambió se sube (como nuevo)
+    mock_dispatch.assert_called_once_with('upload', str(edited))
+    # Las filas se conservan para que sync_down resuelva la eliminación remota
+    assert state.get("gone.csv")['item_id'] == "item1"
+    state.close()
+
+# --- Pruebas para UploadQueue ---
+
+def test_upload_queue_preserves_order_per_path():
+    upload_queue = UploadQueue(num_workers=3)
+    upload_queue.start()
+    calls = []
+    for i in range(20):
+        upload_queue.put("/tmp/gisbox_monitor_test/a.csv", calls.append, ("a", i))
+        upload_queue.put("/tmp/gisbox_monitor_test/b.csv", calls.append, ("b", i))
+    upload_queue.stop()
+
+    assert [i for name, i in calls if name == "a"] == list(range(20))
+    assert [i for name, i in calls if name == "b"] == list(range(20))
+
+def test_upload_queue_isolates_errors():
+    upload_queue = UploadQueue(num_workers=1)
+    upload_queue.start()
+    calls = []
+    def fail(path):
+        raise Exception("Upload failed")
+
+    with patch.object(logger, 'error') as mock_error:
+        upload_queue.put("/tmp/x.csv", fail, "/tmp/x.csv")
+        upload_queue.put("/tmp/y.csv", calls.append, "/tmp/y.csv")
+        upload_queue.stop()
+
+    mock_error.assert_called_once_with("Error al sincronizar /tmp/x.csv: Upload failed")
+    assert calls == ["/tmp/y.csv"]
+
+def test_handler_with_queue_only_enqueues(mock_gis_monitor, mocker):
+    gis, _ = mock_gis_monitor
+    upload_queue = UploadQueue(num_workers=1)
+    upload_queue.start()
+    handler = UploadHandler(gis, "/tmp/gisbox_monitor_test", upload_queue=upload_queue)
+
+    # La subida se bloquea hasta que se libera el evento: el callback no debe esperar
+    release = threading.Event()
+    mock_upload = mocker.patch.object(handler, '_upload_file', side_effect=lambda path: release.wait(5))
+    event = FileSystemEvent("/tmp/gisbox_monitor_test/created.txt")
+    event.is_directory = False
+    handler.on_created(event)
+    handler.on_modified(event)
+
+    assert upload_queue.pending() >= 1
+    release.set()
+    upload_queue.stop()
+    assert mock_upload.call_count == 2
+
+# --- Pruebas para EventDebouncer ---
+
+def test_debouncer_coalesces_burst_into_one_upload(mock_monitor_env):
+    emitted = []
+    debouncer = EventDebouncer(lambda action, path: emitted.append((action, path)), quiet_seconds=2)
+    file_path = "/tmp/gisbox_monitor_test/saved.csv"
+    Path(file_path).write_text("a,b")
+
+    # Un guardado: un 'created' y varios 'modified'
+    for t in (0.0, 0.1, 0.2, 0.5):
+        debouncer.push('upload', file_path, now=t)
+
+    assert debouncer.flush_ready(now=1.0) == []   # aún dentro de la ventana
+    assert debouncer.flush_ready(now=3.0) == []   # primera comprobación de tamaño/mtime
+    assert debouncer.flush_ready(now=3.5) == [('upload', file_path)]
+    assert emitted == [('upload', file_path)]
+    assert debouncer.operations_emitted == 1
+    assert debouncer.events_received == 4
+
+def test_debouncer_waits_for_stable_file(mock_monitor_env):
+    debouncer = EventDebouncer(lambda action, path: None, quiet_seconds=1)
+    file_path = Path("/tmp/gisbox_monitor_test/growing.csv")
+    file_path.write_text("a")
+    debouncer.push('upload', str(file_path), now=0)
+
+    assert debouncer.flush_ready(now=2) == []
+    file_path.write_text("a,b,c")   # sigue creciendo sin nuevo evento
+    assert debouncer.flush_ready(now=3) == []
+    assert debouncer.flush_ready(now=4) == [('upload', str(file_path))]
+
+def test_debouncer_delete_wins_and_missing_file_is_delete(mock_monitor_env):
+    debouncer = EventDebouncer(lambda action, path: None, quiet_seconds=1)
+    debouncer.push('upload', "/tmp/gisbox_monitor_test/gone.csv", now=0)
+    debouncer.push('upload', "/tmp/gisbox_monitor_test/tmp.csv", now=0)
+    debouncer.push('delete', "/tmp/gisbox_monitor_test/tmp.csv", now=0.5)
+
+    ready = debouncer.flush_ready(now=2)
+    assert sorted(ready) == [('delete', "/tmp/gisbox_monitor_test/gone.csv"),
+                             ('delete', "/tmp/gisbox_monitor_test/tmp.csv")]
+
+def test_handler_with_debouncer_flushes_on_stop(mock_gis_monitor, mocker):
+    gis, _ = mock_gis_monitor
+    handler = UploadHandler(gis, "/tmp/gisbox_monitor_test", debounce_seconds=60)
+    mock_upload = mocker.patch.object(handler, '_upload_file')
+    event = FileSystemEvent("/tmp/gisbox_monitor_test/created.txt")
+    event.is_directory = False
+    handler.on_created(event)
+    handler.on_modified(event)
+    mock_upload.assert_not_called()
+
+    handler.debouncer.stop()
+    mock_upload.assert_called_once_with("/tmp/gisbox_monitor_test/created.txt")
+
+# --- Pruebas para ItemIndex ---
+
+def test_item_index_build(mock_gis_monitor, mocker):
+    mock_gis, mock_user = mock_gis_monitor
+    mock_user.folders = [{'title': 'TestFolder', 'id': 'f1'}]
+    listing = {
+        None: [MagicMock(id='1', title='root_file', type='CSV')],
+        'f1': [MagicMock(id='2', title='folder_file', type='PDF')],
+    }
+    mocker.patch('gisbox_monitor.iter_user_items',
+                 side_effect=lambda gis, username, folder_id, page_size, governor, metrics=None: iter(listing[folder_id]))
+
+    index = ItemIndex()
+    index.build(mock_gis, mock_user)
+
+    assert len(index) == 2
+    assert index.get('root_file.csv') == '1'
+    assert index.get('TestFolder/folder_file.pdf') == '2'
+    mock_gis.content.search.assert_not_called()
+
+def test_item_index_ignores_services_with_the_same_title(mock_gis_monitor, mock_monitor_env, mocker):
+    mock_gis, mock_user = mock_gis_monitor
+    # Un servicio de entidades y un CSV con el mismo título (el servicio, el último del listado)
+    listing = [MagicMock(id='csv1', title='roads', type='CSV'), MagicMock(id='fs1', title='roads', type='Feature Service'),
+               MagicMock(id='img1', title='photo', type='Image')]
+    mocker.patch('gisbox_monitor.iter_user_items',
+                 side_effect=lambda gis, username, folder_id, page_size, governor: iter(listing))
+    state = StateStore.for_sync_dir("/tmp/gisbox_monitor_test")
+    # Imagen subida por el monitor (tipo que no descarga sync_down) y archivo cuyo elemento ya no existe
+    state.upsert('photo.png', item_id='img1')
+    state.upsert('gone.csv', item_id='gone1')
+
+    index = ItemIndex()
+    index.build(mock_gis, mock_user, state=state)
+    state.close()
+
+    assert index.get('roads.csv') == 'csv1'
+    assert index.get('photo.png') == 'img1'
+    assert index.get('gone.csv') is None
+    assert len(index) == 2
+
+    # Editar o borrar roads.csv nunca toca el servicio
+    mock_gis._portal.resturl = "https://test.arcgis.com/sharing/rest/"
+    mock_gis._con.post.return_value = {'results': [{'itemId': 'csv1', 'success': True}]}
+    handler = UploadHandler(mock_gis, "/tmp/gisbox_monitor_test", index=index)
+    handler._delete_item("/tmp/gisbox_monitor_test/roads.csv")
+    assert mock_gis._con.post.call_args.args[1]['items'] == 'csv1'
+
+# --- Pruebas para FingerprintCache ---
+
+def test_fingerprint_cache_skips_hash_when_stat_unchanged(mock_monitor_env, mocker):
+    cache = FingerprintCache()
+    file_path = Path("/tmp/gisbox_monitor_test/data.csv")
+    file_path.write_text("a,b")
+    hash_file = mocker.spy(FingerprintCache, '_hash_file')
+
+    fingerprint = cache.compute("data.csv", file_path)
+    cache.record("data.csv", fingerprint)
+    assert cache.compute("data.csv", file_path) == fingerprint
+    assert hash_file.call_count == 1
+
+    # 'touch': cambia la fecha pero no el contenido
+    os.utime(file_path, ns=(0, 0))
+    touched = cache.compute("data.csv", file_path)
+    assert hash_file.call_count == 2
+    assert cache.is_unchanged("data.csv", touched)
+
+    file_path.write_text("a,b,c")
+    assert not cache.is_unchanged("data.csv", cache.compute("data.csv", file_path))
+
+def test_fingerprint_cache_persists(mock_monitor_env):
+    store = StateStore.for_sync_dir("/tmp/gisbox_monitor_test")
+    cache = FingerprintCache(store)
+    cache.record("data.csv", {'size': 3, 'mtime_ns': 1, 'sha256': 'abc'}, item_id='id1')
+    cache.save()
+    store.close()
+
+    reopened = StateStore.for_sync_dir("/tmp/gisbox_monitor_test")
+    assert FingerprintCache(reopened).load().get("data.csv") == {'size': 3, 'mtime_ns': 1, 'sha256': 'abc'}
+    assert reopened.get("data.csv")['item_id'] == 'id1'
+    reopened.close()
+
+def test_upload_file_skips_identical_content(handler, mock_gis_monitor, mock_monitor_env):
+    mock_gis, mock_user = mock_gis_monitor
+    mock_item = MagicMock(title="Same", update=MagicMock())
+    mock_gis.content.get.return_value = mock_item
+    handler.index.set("Same.csv", "same_id")
+
+    file_path = Path("/tmp/gisbox_monitor_test/Same.csv")
+    file_path.write_text("a,b")
+    handler._upload_file(str(file_path))
+    os.utime(file_path, ns=(0, 0))
+    handler._upload_file(str(file_path))
+    mock_item.update.assert_called_once()
+
+    file_path.write_text("a,b,c")
+    handler._upload_file(str(file_path))
+    assert mock_item.update.call_count == 2
+
+def test_handler_ignores_internal_paths(handler, mocker):
+    mock_upload = mocker.patch.object(handler, '_upload_file')
+    event = FileSystemEvent("/tmp/gisbox_monitor_test/.gisbox/fingerprints.json")
+    event.is_directory = False
+    handler.on_modified(event)
+    mock_upload.assert_not_called()
+
+# --- Pruebas para MultipartUploader ---
+
+@pytest.fixture
+def multipart_gis(mock_gis_monitor):
+    mock_gis, _ = mock_gis_monitor
+    mock_gis._portal.resturl = "https://test.arcgis.com/sharing/rest/"
+    def post(url, params):
+        if url.endswith("addItem"):
+            return {'success': True, 'id': 'mp1'}
+        if url.endswith("status"):
+            return {'status': 'completed'}
+        return {'success': True}
+    mock_gis._con.post.side_effect = post
+    mock_gis._con.post_multipart.return_value = {'success': True}
+    return mock_gis
+
+def posted_urls(mock_gis):
+    return [c.args[0].rsplit('/', 1)[1] for c in mock_gis._con.post.call_args_list]
+
+def test_multipart_upload_new_item(multipart_gis, mock_monitor_env):
+    file_path = Path("/tmp/gisbox_monitor_test/TestFolder/big.sd")
+    file_path.write_bytes(b"0123456789")
+    state = StateStore.for_sync_dir("/tmp/gisbox_monitor_test")
+    uploader = MultipartUploader(multipart_gis, "test_user", state, part_size=4, part_workers=2)
+
+    item_id = uploader.upload("TestFolder/big.sd", file_path, {'title': 'big'}, folder_id='f1')
+
+    assert item_id == 'mp1'
+    assert posted_urls(multipart_gis) == ['addItem', 'commit', 'status']
+    assert multipart_gis._con.post.call_args_list[0].args[0].endswith("/test_user/f1/addItem")
+    parts = sorted(c.kwargs['params']['partNum'] for c in multipart_gis._con.post_multipart.call_args_list)
+    assert parts == [1, 2, 3]
+    assert uploader.pending_keys() == []
+    assert state.upload_sessions() == {}
+    state.close()
+
+def test_multipart_governs_each_request(multipart_gis, mock_monitor_env, mocker):
+    file_path = Path("/tmp/gisbox_monitor_test/big.sd")
+    file_path.write_bytes(b"0123456789")
+    governor = RequestGovernor(max_concurrency=1)
+    call = mocker.spy(governor, 'call')
+    uploader = MultipartUploader(multipart_gis, "test_user", governor=governor, part_size=4, part_workers=2)
+
+    uploader.upload("big.sd", file_path, {'title': 'big'})
+
+    # addItem, tres addPart, commit y status: una plaza del regulador por petición
+    assert call.call_count == 6
+    assert governor.in_flight == 0
+
+def test_multipart_upload_resumes_from_last_part(multipart_gis, mock_monitor_env):
+    file_path = Path("/tmp/gisbox_monitor_test/big.sd")
+    file_path.write_bytes(b"0123456789")
+    stat = file_path.stat()
+    # Sesión que dejó a medias una ejecución anterior del monitor
+    state = StateStore.for_sync_dir("/tmp/gisbox_monitor_test")
+    state.save_upload_session("big.sd", {
+        'item_id': 'mp1', 'mode': 'add', 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+        'part_size': 4, 'parts_done': [1, 2]})
+    state.close()
+
+    state = StateStore.for_sync_dir("/tmp/gisbox_monitor_test")
+    uploader = MultipartUploader(multipart_gis, "test_user", state, part_size=4)
+    assert uploader.pending_keys() == ["big.sd"]
+    uploader.upload("big.sd", file_path, {'title': 'big'})
+    assert state.upload_sessions() == {}
+    state.close()
+
+    # No se vuelve a crear el elemento y solo se envía la parte que faltaba
+    assert posted_urls(multipart_gis) == ['commit', 'status']
+    multipart_gis._con.post_multipart.assert_called_once()
+    assert multipart_gis._con.post_multipart.call_args.kwargs['params']['partNum'] == 3
+
+def test_multipart_failed_part_keeps_session(multipart_gis, mock_monitor_env):
+    file_path = Path("/tmp/gisbox_monitor_test/big.sd")
+    file_path.write_bytes(b"0123456789")
+    multipart_gis._con.post_multipart.side_effect = lambda path, params, files: {'success': params['partNum'] != 2}
+    state = StateStore.for_sync_dir("/tmp/gisbox_monitor_test")
+    uploader = MultipartUploader(multipart_gis, "test_user", state, part_size=4, part_workers=1)
+
+    with pytest.raises(Exception, match="addPart 2"):
+        uploader.upload("big.sd", file_path, {'title': 'big'})
+    assert uploader.pending_keys() == ["big.sd"]
+    # Las partes confirmadas quedan guardadas en el almacén de estado; la fallida no
+    assert sorted(state.upload_sessions()["big.sd"]['parts_done']) == [1, 3]
+    state.close()
+
+def test_upload_file_large_uses_multipart(mock_gis_monitor, mock_monitor_env):
+    mock_gis, _ = mock_gis_monitor
+    multipart = MagicMock()
+    multipart.upload.return_value = 'mp1'
+    mock_gis.content.get.return_value = MagicMock(title="big", id='mp1')
+    handler = UploadHandler(mock_gis, "/tmp/gisbox_monitor_test", multipart=multipart, multipart_threshold=5)
+
+    file_path = Path("/tmp/gisbox_monitor_test/big.sd")
+    file_path.write_bytes(b"0123456789")
+    handler._upload_file(str(file_path))
+
+    mock_gis.content.add.assert_not_called()
+    multipart.upload.assert_called_once()
+    assert handler.index.get("big.sd") == 'mp1'
+
+def test_multipart_update_records_modified_after_upload(mock_gis_monitor, mock_monitor_env):
+    mock_gis, _ = mock_gis_monitor
+    multipart = MagicMock()
+    before = MagicMock(title="big", id='mp1', type='Service Definition', modified=1000)
+    after = MagicMock(title="big", id='mp1', type='Service Definition', modified=2000)
+    mock_gis.content.get.side_effect = [before, after]
+    state = StateStore.for_sync_dir("/tmp/gisbox_monitor_test")
+    handler = UploadHandler(mock_gis, "/tmp/gisbox_monitor_test", state=state, fingerprints=FingerprintCache(state),
+                            multipart=multipart, multipart_threshold=5)
+    handler.index.set("big.sd", "mp1")
+
+    file_path = Path("/tmp/gisbox_monitor_test/big.sd")
+    file_path.write_bytes(b"0123456789")
+    handler._upload_file(str(file_path))
+
+    multipart.upload.assert_called_once()
+    state.flush()
+    # La fecha guardada es la posterior a la subida: sync_down no volverá a descargar el archivo
+    assert state.get("big.sd")['remote_modified'] == 2000
+    state.close()
+
 # --- Pruebas para GISBoxMonitor ---
 
 def test_gisbox_monitor_initialization(mock_monitor_env, mock_gis_monitor):
@@ -156,3 +700,331 @@ def test_gisbox_monitor_start_monitoring(mock_monitor_env, mock_gis_monitor, moc
     mock_observer.join.assert_called_once()
     mock_info.assert_any_call("GISBox Monitor iniciado. Presiona CTRL+C para detener.")
     mock_info.assert_any_call("GISBox Monitor detenido.")
+
+# --- Pruebas de reintentos ---
+
+def test_failed_operation_goes_to_retry_queue(handler, mock_gis_monitor, mock_monitor_env, mocker):
+    mock_gis, _ = mock_gis_monitor
+    mocker.patch.object(handler.governor, 'backoff', return_value=0)
+    mock_gis.content.add.side_effect = [Exception("Item could not be added"), MagicMock(title="data", id="id1")]
+    file_path = Path("/tmp/gisbox_monitor_test/data.csv")
+    file_path.write_text("a,b")
+
+    with patch.object(logger, 'error') as mock_error:
+        handler._dispatch_action('upload', str(file_path))
+    mock_error.assert_called_once_with(f"Error al sincronizar {file_path}: Item could not be added")
+    assert handler.retry_queue.keys() == [str(file_path)]
+
+    assert handler.retry_due() == 1
+    assert mock_gis.content.add.call_count == 2
+    assert handler.index.get("data.csv") == "id1"
+    assert len(handler.retry_queue) == 0
+
+def test_timed_out_create_is_looked_up_before_retrying(handler, mock_gis_monitor, mock_monitor_env, mocker):
+    mock_gis, _ = mock_gis_monitor
+    mocker.patch.object(handler.governor, 'backoff', return_value=0)
+    # El addItem se aplicó pero la respuesta no llegó: el regulador no lo repite
+    mock_gis.content.add.side_effect = requests.Timeout("read timed out")
+    file_path = Path("/tmp/gisbox_monitor_test/data.csv")
+    file_path.write_text("a,b")
+    handler._dispatch_action('upload', str(file_path))
+    assert mock_gis.content.add.call_count == 1
+    assert handler.retry_queue.keys() == [str(file_path)]
+
+    # El reintento encuentra el elemento creado en la carpeta y lo actualiza en lugar de duplicarlo
+    mock_gis._con.get.return_value = {'items': [{'id': 'id1', 'title': 'data', 'name': 'data.csv', 'type': 'CSV'}],
+                                      'nextStart': -1}
+    created = MagicMock(title="data", id="id1", type='CSV', modified=1000)
+    created.name = 'data.csv'
+    mocker.patch('gisbox_sync.Item', side_effect=lambda gis, item_id, item_dict: created)
+    assert handler.retry_due() == 1
+    assert mock_gis.content.add.call_count == 1
+    created.update.assert_called_once()
+    assert handler.index.get("data.csv") == "id1"
+    assert len(handler.retry_queue) == 0
+
+def test_new_event_replaces_pending_retry(handler, mock_gis_monitor, mock_monitor_env, mocker):
+    mock_gis, _ = mock_gis_monitor
+    mock_gis.content.add.side_effect = Exception("Item could not be added")
+    file_path = Path("/tmp/gisbox_monitor_test/data.csv")
+    file_path.write_text("a,b")
+    handler._dispatch_action('upload', str(file_path))
+    assert len(handler.retry_queue) == 1
+
+    file_path.unlink()
+    handler._dispatch_action('delete', str(file_path))
+    assert len(handler.retry_queue) == 0
+
+# --- Pruebas de supresión de ecos ---
+
+def test_sync_writes_are_not_uploaded_back(mock_gis_monitor, mock_monitor_env):
+    mock_gis, _ = mock_gis_monitor
+    state = StateStore.for_sync_dir("/tmp/gisbox_monitor_test")
+    handler = UploadHandler(mock_gis, "/tmp/gisbox_monitor_test", state=state,
+                            fingerprints=FingerprintCache(state))
+    file_path = Path("/tmp/gisbox_monitor_test/TestFolder/report.pdf")
+    file_path.write_bytes(b"remote content")
+    # sync_down anuncia la descarga justo antes de renombrar el archivo
+    state.register_write("TestFolder/report.pdf", FingerprintCache._hash_file(file_path), item_id="r1")
+
+    handler._upload_file(str(file_path))
+    mock_gis.content.add.assert_not_called()
+    assert handler.index.get("TestFolder/report.pdf") == "r1"
+
+    # Una edición real del usuario sí se sube (como actualización del mismo elemento)
+    mock_item = MagicMock(title="report", id="r1", type="PDF", modified=5)
+    mock_gis.content.get.return_value = mock_item
+    file_path.write_bytes(b"edited by the user")
+    handler._upload_file(str(file_path))
+    mock_item.update.assert_called_once()
+
+    # Un borrado hecho por sync_down no elimina el elemento en ArcGIS
+    state.register_write("TestFolder/report.pdf")
+    file_path.unlink()
+    handler._delete_item(str(file_path))
+    mock_item.delete.assert_not_called()
+    assert handler.index.get("TestFolder/report.pdf") is None
+    state.close()
+
+# --- Pruebas de eliminaciones por lotes ---
+
+def test_tombstone_queue_batches_by_window_and_size():
+    sent = []
+    tombstones = TombstoneQueue(sent.append, window=1.0, max_batch=3)
+
+    tombstones.add("a", "1", now=0)
+    tombstones.add("b", "2", now=0.5)
+    assert tombstones.flush(now=0.9) == 0        # La más antigua aún no cumple la ventana
+    assert tombstones.discard("b")              # El archivo ha vuelto a aparecer
+    assert tombstones.flush(now=1.0) == 1
+    assert sent == [[("a", "1")]]
+
+    for index in range(4):                      # Un lote completo no espera a la ventana
+        tombstones.add(f"f{index}", str(index), now=2)
+    assert len(sent) == 1                       # ...pero lo envía el hilo, no quien lo anota
+    assert tombstones.flush(now=2) == 3
+    assert sent[-1] == [("f0", "0"), ("f1", "1"), ("f2", "2")]
+    assert len(tombstones) == 1
+    tombstones.stop()
+    assert sent[-1] == [("f3", "3")]
+
+def test_folder_delete_is_sent_in_bulk(mock_gis_monitor, mock_monitor_env):
+    mock_gis, _ = mock_gis_monitor
+    handler = UploadHandler(mock_gis, "/tmp/gisbox_monitor_test", delete_window=60, delete_batch_size=100)
+    for index in range(5):
+        handler.index.set(f"TestFolder/file{index}.csv", f"id{index}")
+    # Un elemento ya no existía en ArcGIS (cuenta como eliminado) y otro falla
+    mock_gis._con.post.return_value = {'results': [
+        {'itemId': 'id0', 'success': True}, {'itemId': 'id1', 'success': True},
+        {'itemId': 'id2', 'success': False, 'error': {'message': 'Item does not exist or is inaccessible.'}},
+        {'itemId': 'id3', 'success': False, 'error': {'message': 'Unable to delete item. Delete protection is turned on.'}},
+        {'itemId': 'id4', 'success': True}]}
+
+    for index in range(5):
+        handler._dispatch_action('delete', f"/tmp/gisbox_monitor_test/TestFolder/file{index}.csv")
+    mock_gis._con.post.assert_not_called()      # Aún dentro de la ventana
+    handler.tombstones.flush(force=True)
+
+    mock_gis._con.post.assert_called_once()
+    assert mock_gis._con.post.call_args[0][1]['items'] == 'id0,id1,id2,id3,id4'
+    assert [index for index in range(5) if handler.index.get(f"TestFolder/file{index}.csv")] == [3]
+    # Solo el archivo que falló queda pendiente de reintento
+    assert handler.retry_queue.keys() == ["/tmp/gisbox_monitor_test/TestFolder/file3.csv"]
+
+def test_recreated_file_cancels_pending_delete(mock_gis_monitor, mock_monitor_env):
+    mock_gis, _ = mock_gis_monitor
+    handler = UploadHandler(mock_gis, "/tmp/gisbox_monitor_test", delete_window=60)
+    handler.index.set("data.csv", "id1")
+    mock_item = MagicMock(title="data", id="id1", type="CSV", modified=1)
+    mock_gis.content.get.return_value = mock_item
+
+    file_path = Path("/tmp/gisbox_monitor_test/data.csv")
+    handler._dispatch_action('delete', str(file_path))
+    assert len(handler.tombstones) == 1
+
+    # Guardado "atómico" de un editor: borrar y volver a crear el archivo
+    file_path.write_text("a,b")
+    handler._dispatch_action('upload', str(file_path))
+    assert len(handler.tombstones) == 0
+    mock_item.update.assert_called_once()
+    handler.tombstones.flush(force=True)
+    mock_gis._con.post.assert_not_called()
+    assert handler.index.get("data.csv") == "id1"
+
+def test_full_tombstone_batch_does_not_deadlock_with_one_request_slot(mock_gis_monitor, mock_monitor_env):
+    mock_gis, _ = mock_gis_monitor
+    mock_gis._con.post.return_value = {'results': [{'itemId': 'id1', 'success': True}]}
+    handler = UploadHandler(mock_gis, "/tmp/gisbox_monitor_test", governor=RequestGovernor(max_concurrency=1),
+                            delete_window=60, delete_batch_size=1)
+    handler.index.set("data.csv", "id1")
+    handler.tombstones.start()
+    try:
+        # La eliminación ocupa la única plaza del regulador mientras anota la lápida
+        worker = threading.Thread(target=handler._run, args=(handler._delete_item, "/tmp/gisbox_monitor_test/data.csv"),
+                                  daemon=True)
+        worker.start()
+        worker.join(timeout=5)
+        assert not worker.is_alive()
+        for _ in range(50):
+            if mock_gis._con.post.called:
+                break
+            time.sleep(0.1)
+        mock_gis._con.post.assert_called_once()
+    finally:
+        handler.tombstones.stop()
+    assert handler.index.get("data.csv") is None
+
+def test_recreated_file_waits_for_in_flight_delete_without_blocking(mock_gis_monitor, mock_monitor_env):
+    mock_gis, _ = mock_gis_monitor
+    release = threading.Event()
+    def post(url, params):
+        release.wait(5)
+        return {'results': [{'itemId': 'id1', 'success': True}]}
+    mock_gis._con.post.side_effect = post
+    mock_gis.content.add.return_value = MagicMock(title="data", id="id2", type="CSV", modified=1)
+    handler = UploadHandler(mock_gis, "/tmp/gisbox_monitor_test", governor=RequestGovernor(max_concurrency=1),
+                            delete_window=60)
+    handler.index.set("data.csv", "id1")
+    file_path = Path("/tmp/gisbox_monitor_test/data.csv")
+    handler._dispatch_action('delete', str(file_path))
+    sender = threading.Thread(target=handler.tombstones.flush, kwargs={'force': True}, daemon=True)
+    sender.start()
+    for _ in range(50):
+        if mock_gis._con.post.called:
+            break
+        time.sleep(0.1)
+
+    # El archivo reaparece mientras se envía su eliminación: la subida no espera aquí
+    file_path.write_text("a,b")
+    handler._upload_file(str(file_path))
+    mock_gis.content.add.assert_not_called()
+    release.set()
+    sender.join(timeout=5)
+    # Al terminar la eliminación, el archivo se sube como un elemento nuevo
+    mock_gis.content.add.assert_called_once()
+    assert handler.index.get("data.csv") == "id2"
+
+# --- Pruebas de creaciones por lotes ---
+
+def test_stop_runs_operations_waiting_for_the_last_delete_batch(mock_monitor_env, mock_gis_monitor, mocker):
+    mock_gis, _ = mock_gis_monitor
+    monitor = GISBoxMonitor()
+    monitor.observer = MagicMock()
+    monitor.fingerprints = FingerprintCache()
+    monitor.upload_queue = UploadQueue(1)
+    monitor.upload_queue.start()
+    handler = monitor.event_handler = UploadHandler(mock_gis, "/tmp/gisbox_monitor_test",
+                                                    upload_queue=monitor.upload_queue, delete_window=60)
+    upload = mocker.patch.object(handler, '_upload_file')
+    path = "/tmp/gisbox_monitor_test/data.csv"
+    handler.tombstones.add(path, "id1")
+
+    def delete_items(tombstones):
+        # El archivo vuelve a aparecer mientras se envía el último lote
+        handler._cancel_tombstone(path, handler._upload_file, path)
+        return []
+    mocker.patch.object(handler, '_delete_items', side_effect=delete_items)
+
+    monitor.stop()
+    # La subida que esperaba al lote se ejecuta antes de parar la cola
+    upload.assert_called_once_with(path)
+
+def test_upload_batcher_uploads_smallest_first(mock_monitor_env):
+    root = Path("/tmp/gisbox_monitor_test")
+    for name, size in (("big.csv", 300), ("small.csv", 10), ("medium.csv", 100), ("gone.csv", 1)):
+        (root / name).write_bytes(b"x" * size)
+    prepared, uploaded, followups = [], [], []
+
+    def upload(src_path):
+        uploaded.append(Path(src_path).name)
+        if src_path.endswith("medium.csv"):
+            batcher.absorb('upload', src_path)   # Modificado mientras se sube
+
+    batcher = UploadBatcher(prepared.append, upload, on_complete=lambda *args: followups.append(args),
+                            window=1.0, num_workers=1)
+    for name in ("big.csv", "small.csv", "medium.csv", "gone.csv"):
+        batcher.hold(str(root / name), now=0)
+    batcher.hold(str(root / "small.csv"), now=0.5)   # Evento repetido: se absorbe
+    assert batcher.absorb('delete', str(root / "gone.csv"))  # Borrado antes de subirlo
+    assert batcher.flush(now=0.9) == 0
+    assert batcher.flush(now=1.0) == 3
+
+    batcher.start()
+    batcher.join()
+    batcher.stop()
+    assert prepared == [[str(root / "big.csv"), str(root / "small.csv"), str(root / "medium.csv")]]
+    assert uploaded == ["small.csv", "medium.csv", "big.csv"]
+    # El evento recibido durante la subida se devuelve al terminarla
+    assert followups == [('upload', str(root / "medium.csv"))]
+    assert batcher.pending() == 0
+
+def test_full_batch_is_prepared_off_the_event_thread(mock_monitor_env):
+    root = Path("/tmp/gisbox_monitor_test")
+    threads = []
+    prepared = threading.Event()
+
+    def prepare(paths):
+        threads.append(threading.current_thread())
+        prepared.set()
+
+    batcher = UploadBatcher(prepare, lambda src_path: None, window=60, max_batch=2, num_workers=1)
+    batcher.start()
+    batcher.hold(str(root / "a.csv"))
+    batcher.hold(str(root / "b.csv"))   # Lote completo: no se prepara en este hilo
+    assert prepared.wait(5)
+    batcher.stop()
+    assert threads and threading.current_thread() not in threads
+
+def test_burst_of_new_files_resolves_folder_once(mock_gis_monitor, mock_monitor_env):
+    mock_gis, _ = mock_gis_monitor
+    mock_gis._portal.resturl = "https://test.arcgis.com/sharing/rest/"
+    mock_gis.content.create_folder.return_value = {'id': 'f1', 'title': 'TestFolder'}
+    mock_gis._con.post_multipart.side_effect = [{'success': True, 'id': f"id{index}"} for index in range(5)]
+    # El elemento creado se lee directamente (content/items/<id>), con su tipo real
+    mock_gis._con.get.side_effect = lambda url, params: {
+        'id': url.rsplit('/', 1)[1], 'title': 'file', 'type': 'CSV', 'modified': 100 + int(url[-1])}
+    state = StateStore.for_sync_dir("/tmp/gisbox_monitor_test")
+    handler = UploadHandler(mock_gis, "/tmp/gisbox_monitor_test", state=state, fingerprints=FingerprintCache(state),
+                            create_window=60, create_workers=2)
+    for index in range(5):
+        file_path = Path(f"/tmp/gisbox_monitor_test/TestFolder/file{index}.csv")
+        file_path.write_text("a,b\n" * (index + 1))
+        handler._dispatch_action('upload', str(file_path))
+    mock_gis._con.post_multipart.assert_not_called()    # Aún dentro de la ventana
+
+    handler.batcher.start()
+    handler.batcher.stop()
+    # Una sola resolución de carpeta para todo el lote y un addItem directo por archivo
+    mock_gis.content.create_folder.assert_called_once_with("TestFolder")
+    mock_gis.content.add.assert_not_called()
+    urls = {call[0][0] for call in mock_gis._con.post_multipart.call_args_list}
+    assert urls == {"https://test.arcgis.com/sharing/rest/content/users/test_user/f1/addItem"}
+    assert sorted(handler.index.get(f"TestFolder/file{index}.csv") for index in range(5)) == [f"id{index}" for index in range(5)]
+    # La fecha remota se guarda al subir cada archivo, sin depender del índice de búsqueda
+    gets = {call[0][0] for call in mock_gis._con.get.call_args_list}
+    assert gets == {f"https://test.arcgis.com/sharing/rest/content/items/id{index}" for index in range(5)}
+    state.flush()
+    row = state.get("TestFolder/file0.csv")
+    assert row['item_id'] == handler.index.get("TestFolder/file0.csv")
+    assert row['remote_modified'] == 100 + int(row['item_id'][2:])
+    assert row['item_type'] == 'CSV'
+    state.close()
+
+def test_handler_records_upload_metrics(mock_gis_monitor, mock_monitor_env):
+    mock_gis, _ = mock_gis_monitor
+    mock_gis.content.add.return_value = MagicMock(title="Report", id="new_id")
+    metrics = Metrics()
+    handler = UploadHandler(mock_gis, "/tmp/gisbox_monitor_test", metrics=metrics)
+
+    file_path = Path("/tmp/gisbox_monitor_test/Report.csv")
+    file_path.write_text("a,b")
+    handler.on_created(FileSystemEvent(str(file_path)))
+    handler._upload_file(str(file_path))
+
+    text = metrics.render()
+    assert 'gisbox_events_total{action="upload"} 1' in text
+    assert 'gisbox_uploads_total{result="created"} 1' in text
+    assert 'gisbox_uploads_total{result="unchanged"} 1' in text
+    assert 'gisbox_operations_total{operation="create",result="ok"} 1' in text
+    assert 'gisbox_operations_total{operation="hash",result="ok"} 2' in text
+    assert 'gisbox_bytes_total{direction="upload"} 3' in text
@@ -0,0 +1,87 @@
+import pytest
+import json
+import time
+import pstats
+import cProfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+# Importar las clases a probar
+from gisbox_profile import NULL_PROFILER, Profiler
+
+def busy(seconds):
+    # Consume CPU (a diferencia de time.sleep)
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+# Test 1: Cada intervalo guarda su duración, su tiempo de CPU y el elemento asociado
+def test_span_records_wall_and_cpu_time(tmp_path):
+    profiler = Profiler(tmp_path / "trace.json")
+    item = MagicMock(id='abc', type='PDF')
+    with profiler.span('download', item, folder='F'):
+        with profiler.span('transfer', item):
+            time.sleep(0.05)
+        with profiler.span('zip', item):
+            busy(0.05)
+    with pytest.raises(ValueError):
+        with profiler.span('rename', item):
+            raise ValueError("fallo")
+    profiler.stop()
+
+    trace = json.loads((tmp_path / "trace.json").read_text(encoding='utf-8'))
+    events = {event['name']: event for event in trace['traceEvents'] if event['ph'] == 'X'}
+    assert set(events) == {'download', 'transfer', 'zip', 'rename'}
+    assert events['download']['args']['item_id'] == 'abc'
+    assert events['download']['args']['item_type'] == 'PDF'
+    assert events['download']['args']['folder'] == 'F'
+    # La espera no consume CPU; el bucle sí
+    assert events['transfer']['dur'] >= 50000 and events['transfer']['args']['cpu_ms'] < 25
+    assert events['zip']['args']['cpu_ms'] >= 25
+    assert events['rename']['args']['error'] == 'ValueError'
+    # Los intervalos anidados quedan dentro del que los contiene
+    assert events['download']['ts'] <= events['transfer']['ts']
+    assert events['zip']['ts'] + events['zip']['dur'] <= events['download']['ts'] + events['download']['dur'] + 1
+    assert any(event['ph'] == 'M' and event['name'] == 'thread_name' for event in trace['traceEvents'])
+
+# Test 2: cProfile cubre también los hilos creados durante la ejecución (en
+# Python 3.12+ con un solo perfilador; antes, con uno por hilo)
+def test_cprofile_covers_worker_threads(tmp_path):
+    profiler = Profiler(tmp_path / "trace.json", tmp_path / "trace.prof").start()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(busy, 0.05) for _ in range(4)]
+        for future in futures:
+            future.result(timeout=10)
+    profiler.stop()
+
+    stats = pstats.Stats(str(tmp_path / "trace.prof"))
+    assert any(function == 'busy' for _, _, function in stats.stats)
+
+# Test 3: Si no se puede perfilar un hilo (otra herramienta activa), el hilo funciona igual
+def test_thread_that_cannot_be_profiled_still_runs(tmp_path, mocker):
+    mocker.patch('gisbox_profile.PROFILER_SEES_ALL_THREADS', False)
+    real_profile = cProfile.Profile
+    def make_profile():
+        if not make_profile.calls:
+            make_profile.calls += 1
+            return real_profile()
+        profile = MagicMock()
+        profile.enable.side_effect = ValueError("Another profiling tool is already active")
+        return profile
+    make_profile.calls = 0
+    mocker.patch('gisbox_profile.cProfile.Profile', side_effect=make_profile)
+    warning = mocker.patch('gisbox_profile.logger.warning')
+
+    profiler = Profiler(tmp_path / "trace.json", tmp_path / "trace.prof").start()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert executor.submit(lambda: 42).result(timeout=10) == 42
+    profiler.stop()
+    warning.assert_called_once()
+    assert (tmp_path / "trace.prof").exists()
+
+# Test 4: Sin perfilado, los intervalos no hacen nada
+def test_null_profiler_is_no_op():
+    with NULL_PROFILER.span('download', MagicMock()) as span:
+        span.item(MagicMock())
+    assert not NULL_PROFILER.enabled
+    NULL_PROFILER.stop()
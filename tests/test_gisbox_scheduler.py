@@ -0,0 +1,70 @@
+import pytest
+import os
+from unittest.mock import MagicMock
+
+# Importar las clases a probar
+from gisbox_scheduler import SYNC_JOB_ID, AdaptiveInterval, GISBoxScheduler
+
+@pytest.fixture
+def mock_sync(mocker):
+    mocker.patch('gisbox_scheduler.load_dotenv')
+    mocker.patch.dict(os.environ, {
+        "SYNC_INTERVAL_SECONDS": "300",
+        "SYNC_MIN_INTERVAL_SECONDS": "60",
+        "SYNC_MAX_INTERVAL_SECONDS": "900",
+        "SYNC_BUSY_CHANGES": "5",
+    })
+    sync = MagicMock()
+    sync.sync_mode = 'backup'
+    return sync
+
+# Test 1: El intervalo se reduce con mucha actividad y crece sin cambios, dentro de sus límites
+def test_adaptive_interval():
+    interval = AdaptiveInterval(initial=300, minimum=60, maximum=900, busy_changes=5)
+
+    assert interval.update(12) == 150
+    assert interval.update(5) == 75
+    assert interval.update(50) == 60      # Nunca por debajo del mínimo
+    assert interval.update(3) == 60       # Actividad moderada: se mantiene
+    assert interval.update(0) == 90
+    for _ in range(10):
+        interval.update(0)
+    assert interval.seconds == 900        # Nunca por encima del máximo
+
+    with pytest.raises(ValueError):
+        AdaptiveInterval(minimum=100, maximum=50)
+
+# Test 2: El trabajo se programa sin solapamientos y en modo incremental
+def test_scheduler_start_adds_non_overlapping_job(mock_sync):
+    scheduler = MagicMock()
+    tool = GISBoxScheduler(sync=mock_sync, scheduler=scheduler)
+
+    assert mock_sync.sync_mode == 'incremental'
+    tool.start()
+
+    args, kwargs = scheduler.add_job.call_args
+    assert args == (tool.run_once, 'interval')
+    assert kwargs['seconds'] == 300
+    assert kwargs['id'] == SYNC_JOB_ID
+    assert kwargs['max_instances'] == 1
+    assert kwargs['coalesce'] is True
+    assert kwargs['next_run_time'] is not None  # Primera ejecución inmediata
+    scheduler.start.assert_called_once()
+
+# Test 3: Cada ejecución reprograma la siguiente según los cambios encontrados
+def test_scheduler_run_once_adapts_interval(mock_sync):
+    scheduler = MagicMock()
+    tool = GISBoxScheduler(sync=mock_sync, scheduler=scheduler)
+
+    mock_sync.last_change_count = 8
+    assert tool.run_once() == 8
+    scheduler.reschedule_job.assert_called_with(SYNC_JOB_ID, trigger='interval', seconds=150)
+
+    mock_sync.last_change_count = 0
+    tool.run_once()
+    scheduler.reschedule_job.assert_called_with(SYNC_JOB_ID, trigger='interval', seconds=225)
+
+    # Un error no detiene la programación ni altera el intervalo
+    mock_sync.sync_down.side_effect = Exception("portal caído")
+    assert tool.run_once() is None
+    scheduler.reschedule_job.assert_called_with(SYNC_JOB_ID, trigger='interval', seconds=225)
@@ -0,0 +1,132 @@
+import pytest
+import time
+import shutil
+import sqlite3
+import threading
+from pathlib import Path
+
+# Importar la clase a probar
+from gisbox_state import STATE_DIR_NAME, StateStore
+
+# Fixture con un almacén de estado en un directorio temporal
+@pytest.fixture
+def store():
+    test_dir = Path("/tmp/gisbox_state_test")
+    if test_dir.exists():
+        shutil.rmtree(test_dir)
+    store = StateStore.for_sync_dir(test_dir, batch_size=3, flush_interval=3600)
+    yield store
+    store.close()
+    shutil.rmtree(test_dir)
+
+# Test 1: Esquema, modo WAL e índices
+def test_state_store_schema(store):
+    assert store.path == Path("/tmp/gisbox_state_test", STATE_DIR_NAME, "state.db")
+    connection = sqlite3.connect(store.path)
+    assert connection.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    indexes = {row[1] for row in connection.execute("PRAGMA index_list('items')")}
+    assert {'idx_items_path', 'idx_items_item_id'} <= indexes
+    connection.close()
+
+# Test 2: Las escrituras se aplican por lotes
+def test_state_store_batches_writes(store):
+    external = sqlite3.connect(store.path)
+    count = lambda: external.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    store.upsert("a.csv", item_id="1", size=10)
+    store.upsert("b.csv", item_id="2", size=20)
+    assert count() == 0  # Aún en memoria
+
+    store.upsert("c.csv", item_id="3", size=30)  # Se alcanza el tamaño de lote
+    assert count() == 3
+    external.close()
+
+# Test 3: upsert parcial, búsqueda por id, renombrado y borrado
+def test_state_store_upsert_rename_delete(store):
+    store.upsert("Folder1/data.csv", item_id="abc", folder="Folder1", title="data", size=3)
+    store.upsert("Folder1/data.csv", content_hash="ff", local_mtime=5)
+
+    row = store.get("Folder1/data.csv")
+    assert (row['item_id'], row['size'], row['content_hash']) == ("abc", 3, "ff")
+    assert [r['path'] for r in store.get_by_item_id("abc")] == ["Folder1/data.csv"]
+
+    store.rename("Folder1/data.csv", "data.csv")
+    assert store.get("Folder1/data.csv") is None
+    assert store.get("data.csv")['item_id'] == "abc"
+
+    # Renombrar un origen inexistente no pisa el destino
+    store.rename("missing.csv", "data.csv")
+    assert store.get("data.csv")['item_id'] == "abc"
+
+    store.delete("data.csv")
+    assert store.count() == 0
+
+    with pytest.raises(ValueError, match="Columnas desconocidas"):
+        store.upsert("x.csv", unknown=1)
+
+# Test 4: Metadatos y limpieza
+def test_state_store_meta_and_clear(store):
+    store.set_meta("last_sync", 123)
+    store.upsert("a.csv", item_id="1")
+    store.clear()
+
+    assert store.count() == 0
+    assert store.get_meta("last_sync") == "123"
+    assert store.get_meta("missing", "x") == "x"
+
+# Test 5: Un lector concurrente no bloquea al que escribe (ni al revés)
+def test_state_store_concurrent_reader(store):
+    store.upsert("a.csv", item_id="1")
+    store.flush()
+
+    reader = sqlite3.connect(store.path)
+    reader.execute("BEGIN")
+    assert reader.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 1
+
+    # Con una transacción de lectura abierta, la escritura se completa igualmente
+    writer = threading.Thread(target=lambda: (store.upsert("b.csv", item_id="2"), store.flush()))
+    writer.start()
+    writer.join(timeout=5)
+    assert not writer.is_alive()
+
+    # El lector conserva su instantánea hasta terminar la transacción
+    assert reader.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 1
+    reader.execute("COMMIT")
+    assert reader.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 2
+    reader.close()
+
+# Test 6: Registro de escrituras propias (supresión de ecos)
+def test_state_store_self_writes(store, mocker):
+    store.register_write("data.csv", "abc", item_id="1")
+    store.register_write("old.csv")  # Borrado
+
+    # Otro proceso (otra conexión) ve el registro al instante, sin esperar al lote
+    other = StateStore(store.path)
+    assert other.consume_write("data.csv", "def") is None  # Contenido distinto: edición real
+    assert other.consume_write("data.csv", "abc")['item_id'] == "1"
+    assert other.consume_write("data.csv", "abc") is None  # Solo se consume una vez
+    assert other.consume_write("old.csv") is not None
+    other.close()
+
+    # Los registros caducan
+    store.register_write("late.csv", "abc", ttl=10)
+    mocker.patch('gisbox_state.time.time', return_value=time.time() + 11)
+    assert store.consume_write("late.csv", "abc") is None
+
+# Test 7: En solo lectura no se crea nada y las escrituras fallan
+def test_state_store_read_only(store):
+    missing_dir = Path("/tmp/gisbox_state_test/missing")
+    assert not StateStore.exists_for_sync_dir(missing_dir)
+    with pytest.raises(FileNotFoundError):
+        StateStore.for_sync_dir(missing_dir, read_only=True)
+    assert not missing_dir.exists()
+
+    store.upsert("a.csv", item_id="1")
+    store.flush()
+    assert StateStore.exists_for_sync_dir("/tmp/gisbox_state_test")
+    reader = StateStore.for_sync_dir("/tmp/gisbox_state_test", read_only=True)
+    assert [row['item_id'] for row in reader.rows()] == ["1"]
+    reader.upsert("b.csv", item_id="2")
+    with pytest.raises(sqlite3.OperationalError):
+        reader.flush()
+    reader.close()
@@ -1,11 +1,19 @@
 import pytest
 import os
+import json
+import hashlib
 import shutil
+import threading
+import requests
+import zipfile
 from pathlib import Path
 from unittest.mock import MagicMock, patch
 
 # Importar la clase a probar
 # Se asume que python-dotenv está instalado para cargar el .env
+from gisbox_metrics import Metrics
+from gisbox_monitor import FingerprintCache, UploadHandler
+from gisbox_profile import Profiler
 from gisbox_sync import GISBoxSync, logger
 
 # Fixture para simular el entorno de trabajo
@@ -50,6 +58,14 @@ def mock_gis_user(mocker):
     
     return mock_gis, mock_user
 
+# Fixture para que el listado paginado de cada carpeta devuelva los elementos
+# definidos en mock_user.items
+@pytest.fixture
+def mock_listing(mocker, mock_gis_user):
+    mock_user = mock_gis_user[1]
+    mocker.patch.object(GISBoxSync, 'iter_items', autospec=True,
+                        side_effect=lambda self, folder_name=None: iter(mock_user.items(folder=folder_name)))
+
 # Test 1: Inicialización correcta
 def test_gisbox_sync_initialization(mock_env, mock_gis_user):
     sync_tool = GISBoxSync()
@@ -80,12 +96,13 @@ def test_prepare_local_directory(mock_env, mock_gis_user, mocker):
     assert not Path(sync_tool.local_sync_dir, "old_file.txt").exists()
 
 # Test 4: Descarga de un item con éxito
-def test_download_items_success(mock_env, mock_gis_user, mocker):
+def test_download_items_success(mock_env, mock_gis_user, mock_listing, mocker):
     sync_tool = GISBoxSync()
     mock_user = mock_gis_user[1]
     
     # Mockear un item descargable
     mock_item = MagicMock()
+    mock_item.id = 'doc1'
     mock_item.type = 'PDF'
     mock_item.title = 'Test Document'
     
@@ -96,8 +113,8 @@ def test_download_items_success(mock_env, mock_gis_user, mocker):
     
     mock_user.items.return_value = [mock_item]
     
-    # Mockear os.rename para verificar el renombrado
-    mocker.patch('os.rename')
+    # Mockear os.replace para verificar el renombrado
+    mocker.patch('os.replace')
     
     # Ejecutar la descarga
     count = sync_tool.download_items()
@@ -107,10 +124,10 @@ def test_download_items_success(mock_env, mock_gis_user, mocker):
     
     # Verificar que se intentó renombrar al formato final
     expected_final_path = Path(sync_tool.local_sync_dir, "Test Document.pdf")
-    os.rename.assert_called_with(temp_file_path, expected_final_path)
+    os.replace.assert_called_with(temp_file_path, expected_final_path)
 
 # Test 5: Descarga de un item con error
-def test_download_items_failure(mock_env, mock_gis_user, mocker):
+def test_download_items_failure(mock_env, mock_gis_user, mock_listing, mocker):
     sync_tool = GISBoxSync()
     mock_user = mock_gis_user[1]
     
@@ -151,3 +168,518 @@ def test_sync_down_flow(mock_env, mock_gis_user, mocker):
     mock_download.assert_any_call(folder_name='Folder1')
     
     assert total_count == 3
+
+# Test 7: En modo incremental no se borra el directorio local
+def test_prepare_local_directory_incremental(mock_env, mock_gis_user, mocker):
+    mocker.patch.dict(os.environ, {"SYNC_MODE": "incremental"})
+    sync_tool = GISBoxSync()
+    Path(sync_tool.local_sync_dir, "old_file.txt").touch()
+
+    sync_tool._prepare_local_directory()
+
+    assert Path(sync_tool.local_sync_dir, "old_file.txt").exists()
+
+# Test 8: Sincronización incremental (solo elementos nuevos o modificados)
+def test_sync_down_incremental(mock_env, mock_gis_user, mock_listing, mocker):
+    mocker.patch.dict(os.environ, {"SYNC_MODE": "incremental"})
+    mock_user = mock_gis_user[1]
+    mock_user.folders = []
+
+    def make_item(item_id, title, modified):
+        item = MagicMock(id=item_id, title=title, type='PDF', modified=modified, size=10)
+        def download(save_path):
+            temp = Path(save_path, f"tmp_{item_id}")
+            temp.write_text(title)
+            return str(temp)
+        item.download.side_effect = download
+        return item
+
+    unchanged = make_item('a', 'Unchanged', 1000)
+    changed = make_item('b', 'Changed', 2000)
+    deleted = make_item('c', 'Deleted', 3000)
+
+    # Primera ejecución: se descarga todo
+    mock_user.items.return_value = [unchanged, changed, deleted]
+    assert GISBoxSync().sync_down() == 3
+
+    # Segunda ejecución: 'b' modificado, 'c' eliminado en ArcGIS
+    changed.modified = 2500
+    mock_user.items.return_value = [unchanged, changed]
+    unchanged.download.reset_mock()
+    sync_tool = GISBoxSync()
+    assert sync_tool.sync_down() == 1
+    # Cambios remotos: una descarga y una eliminación
+    assert sync_tool.last_change_count == 2
+
+    unchanged.download.assert_not_called()
+    assert Path(sync_tool.local_sync_dir, "Unchanged.pdf").exists()
+    assert Path(sync_tool.local_sync_dir, "Changed.pdf").exists()
+    assert not Path(sync_tool.local_sync_dir, "Deleted.pdf").exists()
+
+# Test 9: Descargas concurrentes con errores aislados por elemento
+def test_download_items_concurrent(mock_env, mock_gis_user, mock_listing, mocker):
+    mocker.patch.dict(os.environ, {"MAX_WORKERS": "3"})
+    sync_tool = GISBoxSync()
+    mock_user = mock_gis_user[1]
+    assert sync_tool.max_workers == 3
+
+    # Las tres descargas deben estar en curso a la vez para superar la barrera
+    barrier = threading.Barrier(3, timeout=5)
+
+    def make_item(title, fail=False):
+        item = MagicMock(id=title, title=title, type='CSV')
+        def download(save_path):
+            barrier.wait()
+            if fail:
+                raise Exception("Download failed")
+            temp = Path(save_path, "data")
+            temp.touch()
+            return str(temp)
+        item.download.side_effect = download
+        return item
+
+    mock_user.items.return_value = [make_item('A'), make_item('B'), make_item('C', fail=True)]
+
+    with patch.object(logger, 'error') as mock_error:
+        count = sync_tool.download_items()
+
+    assert count == 2
+    mock_error.assert_called_once_with("Error al descargar C: Download failed")
+    assert Path(sync_tool.local_sync_dir, "A.csv").exists()
+    assert Path(sync_tool.local_sync_dir, "B.csv").exists()
+
+# Test 10: MAX_WORKERS no válido
+def test_gisbox_sync_invalid_max_workers(mock_env, mock_gis_user, mocker):
+    mocker.patch.dict(os.environ, {"MAX_WORKERS": "0"})
+    with pytest.raises(ValueError, match="MAX_WORKERS"):
+        GISBoxSync()
+
+# Test 11: El listado de carpetas no espera a las descargas de otras carpetas
+def test_sync_down_pipelined_listing(mock_env, mock_gis_user, mock_listing, mocker):
+    sync_tool = GISBoxSync()
+    mock_user = mock_gis_user[1]
+    mocker.patch.object(GISBoxSync, '_prepare_local_directory')
+    folder_listed = threading.Event()
+
+    root_item = MagicMock(id='root', title='Root', type='CSV')
+    def download(save_path):
+        # Solo termina si 'Folder1' se ha listado mientras esta descarga sigue en curso
+        assert folder_listed.wait(timeout=5)
+        temp = Path(save_path, "data")
+        temp.touch()
+        return str(temp)
+    root_item.download.side_effect = download
+
+    def items(folder=None):
+        if folder == 'Folder1':
+            folder_listed.set()
+            return []
+        return [root_item]
+    mock_user.items.side_effect = items
+
+    with patch.object(logger, 'error') as mock_error:
+        total_count = sync_tool.sync_down()
+
+    mock_error.assert_not_called()
+    assert total_count == 1
+    assert sync_tool._download_executor is None
+
+# Test 12: Enumeración paginada del contenido de una carpeta
+def test_iter_items_paginated(mock_env, mock_gis_user, mocker):
+    mocker.patch.dict(os.environ, {"PAGE_SIZE": "2"})
+    mock_gis = mock_gis_user[0]
+    mock_gis._portal.resturl = "https://test.arcgis.com/sharing/rest/"
+    mocker.patch('gisbox_sync.Item', side_effect=lambda gis, item_id, item_dict: item_dict['title'])
+    pages = {
+        1: {'items': [{'id': '1', 'title': 'A'}, {'id': '2', 'title': 'B'}], 'nextStart': 3},
+        3: {'items': [{'id': '3', 'title': 'C'}], 'nextStart': -1},
+    }
+    mock_gis._con.get.side_effect = lambda url, params: pages[params['start']]
+
+    sync_tool = GISBoxSync()
+    items = sync_tool.iter_items('Folder1')
+
+    assert next(items) == 'A'
+    # Solo se ha pedido la primera página
+    assert mock_gis._con.get.call_count == 1
+    assert list(items) == ['B', 'C']
+    mock_gis._con.get.assert_called_with(
+        "https://test.arcgis.com/sharing/rest/content/users/test_user/id1", {'start': 3, 'num': 2})
+
+# Test 13: La primera descarga empieza antes de terminar la enumeración
+def test_download_items_streams_pages(mock_env, mock_gis_user, mocker):
+    sync_tool = GISBoxSync()
+    first_downloaded = threading.Event()
+
+    first_item = MagicMock(id='1', title='First', type='CSV')
+    def download(save_path):
+        first_downloaded.set()
+        temp = Path(save_path, "data")
+        temp.touch()
+        return str(temp)
+    first_item.download.side_effect = download
+
+    def iter_items(folder_name=None):
+        yield first_item
+        # La segunda página no llega hasta que la primera descarga ha terminado
+        assert first_downloaded.wait(timeout=5)
+    mocker.patch.object(sync_tool, 'iter_items', side_effect=iter_items)
+
+    assert sync_tool.download_items() == 1
+
+class FakeResponse:
+    """Respuesta HTTP en streaming que puede cortarse tras enviar algunos bytes."""
+    def __init__(self, data, status_code=200, fail_after=None):
+        self.data = data
+        self.status_code = status_code
+        self.fail_after = fail_after
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.data), 2):
+            if self.fail_after is not None and i >= self.fail_after:
+                raise requests.ConnectionError("Connection reset")
+            yield self.data[i:i + 2]
+
+    def close(self):
+        pass
+
+# Test 14: Descarga en streaming reanudada con Range tras un corte
+def test_stream_download_resumes_with_range(mock_env, mock_gis_user, mocker):
+    mocker.patch.dict(os.environ, {"STREAM_THRESHOLD_MB": "0"})
+    mocker.patch('gisbox_sync.time.sleep')
+    mock_gis = mock_gis_user[0]
+    mock_gis._portal.resturl = "https://test.arcgis.com/sharing/rest/"
+    data = b"0123456789"
+    mock_gis.session.get.side_effect = [
+        FakeResponse(data, fail_after=6),
+        FakeResponse(data[6:], status_code=206),
+    ]
+    sync_tool = GISBoxSync()
+    item = MagicMock(id='big', title='Big', type='Service Definition', size=len(data))
+
+    final_path = sync_tool._download_item(item, Path(sync_tool.local_sync_dir))
+
+    assert final_path == Path(sync_tool.local_sync_dir, "Big.sd")
+    assert final_path.read_bytes() == data
+    item.download.assert_not_called()
+    first, second = mock_gis.session.get.call_args_list
+    assert first.args[0] == "https://test.arcgis.com/sharing/rest/content/items/big/data"
+    assert first.kwargs['headers'] == {}
+    assert second.kwargs['headers'] == {'Range': 'bytes=6-'}
+    # No quedan archivos parciales
+    assert list(Path(sync_tool.local_sync_dir).glob("*.part")) == []
+
+# Test 15: Si el servidor ignora Range, la descarga empieza de nuevo
+def test_stream_download_restarts_without_range_support(mock_env, mock_gis_user, mocker):
+    mocker.patch('gisbox_sync.time.sleep')
+    mock_gis = mock_gis_user[0]
+    data = b"0123456789"
+    mock_gis.session.get.side_effect = [
+        FakeResponse(data, fail_after=4),
+        FakeResponse(data, status_code=200),
+    ]
+    sync_tool = GISBoxSync()
+    item = MagicMock(id='big', title='Big', type='PDF', size=len(data))
+    final_path = Path(sync_tool.local_sync_dir, "Big.pdf")
+
+    sync_tool._stream_download(item, final_path)
+
+    assert final_path.read_bytes() == data
+
+# Test 16: Las descargas que llegan como directorio se empaquetan en el destino final
+def test_download_items_packages_directory(mock_env, mock_gis_user, mock_listing, mocker):
+    mocker.patch.dict(os.environ, {"ZIP_COMPRESSION_LEVEL": "9"})
+    sync_tool = GISBoxSync()
+    mock_user = mock_gis_user[1]
+    mock_user.folders = [{'title': 'Folder1', 'id': 'id1'}]
+
+    item = MagicMock(id='shp', title='Roads', type='Shapefile')
+    def download(save_path):
+        shape_dir = Path(save_path, "roads")
+        shape_dir.mkdir()
+        (shape_dir / "roads.shp").write_bytes(b"x" * 1000)
+        (shape_dir / "preview.png").write_bytes(b"y" * 1000)
+        return str(shape_dir)
+    item.download.side_effect = download
+    mock_user.items.side_effect = lambda folder=None: [item] if folder == 'Folder1' else []
+
+    package_threads = []
+    package_directory = sync_tool._package_directory
+    def spy_package(source_dir, zip_path, item=None):
+        package_threads.append(threading.current_thread().name)
+        return package_directory(source_dir, zip_path, item)
+    mocker.patch.object(sync_tool, '_package_directory', side_effect=spy_package)
+    count = sync_tool.download_items(folder_name='Folder1')
+
+    assert count == 1
+    # El empaquetado se ejecuta en el pool de empaquetado, no en el de descargas
+    assert len(package_threads) == 1 and package_threads[0].startswith('gisbox-package')
+    folder_path = Path(sync_tool.local_sync_dir, "Folder1")
+    zip_path = folder_path / "Roads.zip"
+    assert sorted(p.name for p in folder_path.iterdir()) == ["Roads.zip"]
+    assert not Path("Roads.zip").exists()
+    with zipfile.ZipFile(zip_path) as archive:
+        infos = {info.filename: info for info in archive.infolist()}
+    assert infos["roads.shp"].compress_type == zipfile.ZIP_DEFLATED
+    assert infos["preview.png"].compress_type == zipfile.ZIP_STORED
+    assert sync_tool.manifest.entries['shp']['path'] == "Folder1/Roads.zip"
+
+# Test 17: Un error al empaquetar se aísla y no deja archivos parciales
+def test_download_items_package_failure(mock_env, mock_gis_user, mock_listing, mocker):
+    sync_tool = GISBoxSync()
+    mock_user = mock_gis_user[1]
+    item = MagicMock(id='shp', title='Roads', type='Shapefile')
+    def download(save_path):
+        shape_dir = Path(save_path, "roads")
+        shape_dir.mkdir()
+        (shape_dir / "roads.shp").touch()
+        return str(shape_dir)
+    item.download.side_effect = download
+    mock_user.items.return_value = [item]
+    mocker.patch('gisbox_sync.zipfile.ZipFile.write', side_effect=OSError("Disk full"))
+
+    with patch.object(logger, 'error') as mock_error:
+        count = sync_tool.download_items()
+
+    assert count == 0
+    mock_error.assert_called_once_with("Error al descargar Roads: Disk full")
+    assert [p.name for p in Path(sync_tool.local_sync_dir).iterdir()] == ['.gisbox']
+
+# Test 18: El manifiesto se guarda en el almacén de estado compartido con el monitor
+def test_sync_down_records_state(mock_env, mock_gis_user, mock_listing, mocker):
+    mock_user = mock_gis_user[1]
+    mock_user.folders = []
+    item = MagicMock(id='a', title='Report', type='PDF', modified=1000, size=10)
+    def download(save_path):
+        temp = Path(save_path, "tmp")
+        temp.write_text("x")
+        return str(temp)
+    item.download.side_effect = download
+    mock_user.items.return_value = [item]
+
+    sync_tool = GISBoxSync()
+    assert sync_tool.sync_down() == 1
+    row = sync_tool.state.get("Report.pdf")
+    assert (row['item_id'], row['remote_modified'], row['sync_status']) == ('a', 1000, 'downloaded')
+
+    # El modo backup limpia el directorio pero conserva la base de datos de estado
+    assert sync_tool.sync_down() == 1
+    assert Path(sync_tool.local_sync_dir, ".gisbox", "state.db").exists()
+    assert sync_tool.state.count() == 1
+
+    # Una fila escrita por el monitor (subida) cuenta como copia al día en modo incremental
+    sync_tool.state.upsert("Monitor.csv", item_id='m', title='Monitor', item_type='CSV',
+                           remote_modified=5, size=3, sync_status='uploaded')
+    sync_tool.state.flush()
+    Path(sync_tool.local_sync_dir, "Monitor.csv").write_text("a,b")
+    mocker.patch.dict(os.environ, {"SYNC_MODE": "incremental"})
+    uploaded = MagicMock(id='m', title='Monitor', type='CSV', modified=5, size=3)
+    mock_user.items.return_value = [item, uploaded]
+    assert GISBoxSync().sync_down() == 0
+    uploaded.download.assert_not_called()
+
+# Test 19: Sincronización delta (búsqueda por fecha de modificación y detección de eliminaciones)
+def test_sync_down_delta(mock_env, mock_gis_user, mock_listing, mocker):
+    mocker.patch.dict(os.environ, {"SYNC_MODE": "delta"})
+    mock_gis, mock_user = mock_gis_user
+    mock_gis._portal.resturl = "https://test.arcgis.com/sharing/rest/"
+
+    def make_item(item_id, title, modified, folder_id=None):
+        item = MagicMock(id=item_id, title=title, type='PDF', modified=modified, size=10)
+        item.get.side_effect = {'ownerFolder': folder_id}.get
+        def download(save_path):
+            temp = Path(save_path, f"tmp_{item_id}")
+            temp.write_text(title)
+            return str(temp)
+        item.download.side_effect = download
+        return item
+
+    root_item = make_item('a', 'Root', 1700000000000)
+    folder_item = make_item('b', 'Nested', 1700000001000, 'id1')
+    listing = {None: [root_item], 'Folder1': [folder_item]}
+    mock_user.items.side_effect = lambda folder=None: listing[folder]
+
+    # Primera ejecución: listado completo y punto de partida del delta
+    sync_tool = GISBoxSync()
+    assert sync_tool.sync_down() == 2
+    assert sync_tool.state.get_meta('delta_high_water_mark') == '1700000001000'
+
+    # Segunda ejecución: solo 'b' modificado; ninguna eliminación
+    folder_item.modified = 1700000002000
+    items_by_id = {'a': root_item, 'b': folder_item}
+    mocker.patch('gisbox_sync.Item', side_effect=lambda gis, item_id, item_dict: items_by_id[item_id])
+    responses = {'search': {'results': [{'id': 'b'}], 'nextStart': -1}, 'count': {'total': 2}}
+    mock_gis._con.get.side_effect = lambda url, params: responses['count' if params['num'] == 1 else 'search']
+    mock_listing_items = mocker.patch('gisbox_sync.iter_user_items')
+
+    sync_tool = GISBoxSync()
+    assert sync_tool.sync_down() == 1
+    assert mock_gis._con.get.call_count == 2
+    query = mock_gis._con.get.call_args_list[0][0][1]['q']
+    assert query.startswith('owner:"test_user" AND modified:[0000001699999401000 TO ')
+    assert Path(sync_tool.local_sync_dir, "Folder1", "Nested.pdf").exists()
+    mock_listing_items.assert_not_called()
+    root_item.download.assert_called_once()
+    assert sync_tool.state.get_meta('delta_high_water_mark') == '1700000002000'
+
+    # Tercera ejecución: 'a' eliminado en ArcGIS; el recuento no cuadra y se listan los ids
+    responses.update({'search': {'results': [], 'nextStart': -1}, 'count': {'total': 1}})
+    mock_listing_items.side_effect = lambda gis, username, folder_id, *args: [folder_item] if folder_id == 'id1' else []
+
+    sync_tool = GISBoxSync()
+    assert sync_tool.sync_down() == 0
+    assert not Path(sync_tool.local_sync_dir, "Root.pdf").exists()
+    assert Path(sync_tool.local_sync_dir, "Folder1", "Nested.pdf").exists()
+    assert json.loads(sync_tool.state.get_meta('delta_remote_item_ids')) == ['b']
+
+# Test 20: Las descargas fallidas se reintentan al final de sync_down
+def test_sync_down_retries_failed_downloads(mock_env, mock_gis_user, mock_listing, mocker):
+    mock_user = mock_gis_user[1]
+    mock_user.folders = []
+    item = MagicMock(id='a', title='Flaky', type='PDF', modified=1000, size=10)
+    def download(save_path):
+        # El primer intento falla
+        if item.download.call_count == 1:
+            raise Exception("Unable to download")
+        temp = Path(save_path, "tmp")
+        temp.write_text("x")
+        return str(temp)
+    item.download.side_effect = download
+    mock_user.items.return_value = [item]
+
+    sync_tool = GISBoxSync()
+    mocker.patch.object(sync_tool.governor, 'backoff', return_value=0)
+    assert sync_tool.sync_down() == 1
+    assert item.download.call_count == 2
+    assert Path(sync_tool.local_sync_dir, "Flaky.pdf").exists()
+    assert len(sync_tool.retry_queue) == 0
+
+# Test 21: Las descargas se anuncian (ruta y hash) para que el monitor no las suba de vuelta
+def test_download_registers_self_write(mock_env, mock_gis_user, mock_listing):
+    mock_user = mock_gis_user[1]
+    item = MagicMock(id='a', title='Report', type='PDF', modified=1000, size=10)
+    def download(save_path):
+        temp = Path(save_path, "tmp")
+        temp.write_bytes(b"remote content")
+        return str(temp)
+    item.download.side_effect = download
+    mock_user.items.return_value = [item]
+
+    sync_tool = GISBoxSync()
+    assert sync_tool.download_items() == 1
+    sync_tool.manifest.save()
+
+    content_hash = hashlib.sha256(b"remote content").hexdigest()
+    assert sync_tool.state.get("Report.pdf")['content_hash'] == content_hash
+    assert sync_tool.state.consume_write("Report.pdf", content_hash)['item_id'] == 'a'
+
+# Test 22: plan calcula descargas y eliminaciones sin tocar el disco
+def test_plan_does_not_change_anything(mock_env, mock_gis_user, mock_listing, mocker):
+    mocker.patch.dict(os.environ, {"SYNC_MODE": "incremental"})
+    mock_user = mock_gis_user[1]
+    mock_user.folders = []
+
+    def make_item(item_id, title, item_type, modified):
+        item = MagicMock(id=item_id, title=title, type=item_type, modified=modified, size=10)
+        def download(save_path):
+            temp = Path(save_path, f"tmp_{item_id}")
+            temp.write_text(title)
+            return str(temp)
+        item.download.side_effect = download
+        return item
+
+    kept, gone = make_item('a', 'Kept', 'PDF', 1000), make_item('b', 'Gone', 'PDF', 1000)
+    mock_user.items.return_value = [kept, gone]
+    GISBoxSync().sync_down()
+
+    # 'a' cambia, 'b' desaparece de ArcGIS y aparecen 'c' y un tipo que no se sincroniza
+    kept.modified = 2000
+    new_item = make_item('c', 'New', 'CSV', 3000)
+    mock_user.items.return_value = [kept, new_item, make_item('d', 'Map', 'Web Map', 3000)]
+    sync_tool = GISBoxSync()
+    before = sorted(path.name for path in Path(sync_tool.local_sync_dir).iterdir())
+    plan = sync_tool.plan()
+
+    assert [(entry['id'], entry['folder'], entry['type']) for entry in plan['download']] == [('a', None, 'PDF'),
+                                                                                           ('c', None, 'CSV')]
+    assert plan['remove'] == ["Gone.pdf"]
+    assert plan['unchanged'] == 0 and not plan['reset']
+    assert sorted(path.name for path in Path(sync_tool.local_sync_dir).iterdir()) == before
+    new_item.download.assert_not_called()
+
+# Test 23: Con métricas activas, sync_down las registra y escribe un resumen al terminar
+def test_sync_down_logs_metrics_summary(mock_env, mock_gis_user, mock_listing, mocker):
+    mock_user = mock_gis_user[1]
+    mock_user.folders = []
+    item = MagicMock(id='a', title='Report', type='PDF', modified=1000, size=10)
+    def download(save_path):
+        temp = Path(save_path, "tmp")
+        temp.write_bytes(b"remote content")
+        return str(temp)
+    item.download.side_effect = download
+    mock_user.items.return_value = [item]
+    log_info = mocker.patch.object(logger, 'info')
+
+    metrics = Metrics()
+    sync_tool = GISBoxSync(metrics=metrics)
+    sync_tool.sync_down()
+
+    text = metrics.render()
+    assert 'gisbox_items_total{result="downloaded"} 1' in text
+    assert 'gisbox_operations_total{operation="transfer",result="ok"} 1' in text
+    assert 'gisbox_operations_total{operation="sync_down",result="ok"} 1' in text
+    assert 'gisbox_governor_limit' in text
+    summary = next(call.args[0] for call in log_info.call_args_list
+                   if call.args[0].startswith("Métricas de la sincronización"))
+    assert "transfer: 1 operaciones" in summary
+    assert "items (result=downloaded): 1" in summary
+
+# Test 24: Con profiler, cada fase de cada elemento y cada carpeta queda en la traza
+def test_sync_down_profile_spans(mock_env, mock_gis_user, mock_listing, tmp_path):
+    mock_user = mock_gis_user[1]
+    item = MagicMock(id='a', title='Report', type='PDF', modified=1000, size=10)
+    def download(save_path):
+        temp = Path(save_path, "tmp")
+        temp.write_bytes(b"remote content")
+        return str(temp)
+    item.download.side_effect = download
+    mock_user.items.side_effect = lambda folder=None: [item] if folder is None else []
+
+    profiler = Profiler(tmp_path / "trace.json")
+    GISBoxSync(profiler=profiler).sync_down()
+    profiler.stop()
+
+    events = [event for event in json.loads((tmp_path / "trace.json").read_text(encoding='utf-8'))['traceEvents']
+              if event['ph'] == 'X']
+    item_spans = {event['name'] for event in events if event['args'].get('item_id') == 'a'}
+    assert item_spans == {'download', 'transfer', 'rename'}
+    assert all(event['args']['item_type'] == 'PDF' for event in events if event['args'].get('item_id') == 'a')
+    assert sorted(event['args']['folder'] for event in events if event['name'] == 'folder') == ['(raíz)', 'Folder1']
+    assert {'prepare', 'sync_full', 'save_state'} <= {event['name'] for event in events}
+
+# Test 25: El vaciado del modo backup no elimina nada en ArcGIS aunque el monitor vigile el directorio
+def test_backup_wipe_is_not_deleted_remotely(mock_env, mock_gis_user, mock_listing):
+    sync_tool = GISBoxSync()
+    local_dir = Path(sync_tool.local_sync_dir)
+    (local_dir / "Folder1").mkdir()
+    files = [local_dir / "report.pdf", local_dir / "Folder1" / "data.csv"]
+    for file_path in files:
+        file_path.write_text("content")
+
+    monitor_gis = MagicMock()
+    handler = UploadHandler(monitor_gis, str(local_dir), state=sync_tool.state,
+                            fingerprints=FingerprintCache(sync_tool.state))
+    handler.index.set("report.pdf", "r1")
+    handler.index.set("Folder1/data.csv", "d1")
+
+    assert sync_tool.sync_mode == 'backup'
+    sync_tool.sync_down()
+    assert not any(file_path.exists() for file_path in files)
+    # Los eventos de borrado que vería el monitor son ecos del vaciado
+    for file_path in files:
+        handler._delete_item(str(file_path))
+    monitor_gis._con.post.assert_not_called()
+    assert handler.index.get("report.pdf") is None and handler.index.get("Folder1/data.csv") is None